@@ -13,23 +13,44 @@ Features:
 """
 
 import os
+import io
+import re
 import sys
+import argparse
 import json
 import time
 import uuid
 import queue
+import weakref
+import atexit
+import itertools
+import bisect
+import heapq
+import mmap
 import threading
 import socket
 import base64
+import struct
 import hashlib
+import hmac
+import sqlite3
+import asyncio
+import mimetypes
+import multiprocessing
 import subprocess
 import webbrowser
+import contextlib
+import http.client
+from urllib.parse import parse_qs
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
 from datetime import datetime
-from typing import Dict, Optional, Tuple, List, Any
+from collections import OrderedDict, deque
+from typing import Dict, Optional, Tuple, List, Set, Callable, Any
 from dataclasses import dataclass, asdict
 
 try:
-    from flask import Flask, render_template, Response, jsonify, request
+    from flask import Flask, render_template, Response, jsonify, request, redirect, send_file
     from flask_socketio import SocketIO, emit
     from flask_cors import CORS
     import qrcode
@@ -61,7 +82,7 @@ except ImportError as e:
             print(f"[WARNING] Failed to install: {package}")
     
     try:
-        from flask import Flask, render_template, Response, jsonify, request
+        from flask import Flask, render_template, Response, jsonify, request, redirect, send_file
         from flask_socketio import SocketIO, emit
         from flask_cors import CORS
         import qrcode
@@ -77,6 +98,23 @@ except ImportError as e:
         print("Please install manually: pip install flask flask-socketio flask-cors qrcode[pil] pillow pyautogui keyboard")
         sys.exit(1)
 
+try:
+    # Optional: asyncio server mode (--server-mode asyncio)
+    import socketio as python_socketio
+    import uvicorn
+    import jinja2
+    ASYNC_AVAILABLE = True
+except ImportError:
+    ASYNC_AVAILABLE = False
+
+@dataclass(frozen=True)
+class StreamProfile:
+    """Server-side transcoding settings for a viewer stream"""
+    max_size: int = 0        # Longest edge in pixels, 0 keeps the original size
+    quality: int = 70
+    grayscale: bool = False
+    subsampling: int = 2     # 0 = 4:4:4, 1 = 4:2:2, 2 = 4:2:0
+
 @dataclass
 class Config:
     APP_NAME = "MØNSTR-M1ND"
@@ -88,12 +126,129 @@ class Config:
     HOST = "0.0.0.0"
     PORT = 8080
     WEB_PORT = 5000
+    SERVER_MODE = "threading"  # or "asyncio" (python-socketio + uvicorn)
     SECRET_KEY = "MØNSTR-M1ND-SECRET-" + str(uuid.uuid4())
+    PANEL_KEY = uuid.uuid4().hex  # Control panel credential, printed in the startup banner
     
     FRAME_RATE = 15  # Reduced for better performance
     QUALITY = 70     # Reduced quality for better performance
+    BINARY_FRAMES = True  # Send raw JPEG bytes instead of base64 data URLs
+    STREAM_WAIT_TIMEOUT = 5.0  # Seconds a viewer sleeps before re-checking the device
+    
+    # Stream profiles selectable per viewer with /stream/<sid>?profile=<name>,
+    # viewers that ask for none get the phone's JPEG as is
+    STREAM_PROFILES = {
+        "original": None,  # Pass-through, no re-encoding
+        "high": StreamProfile(max_size=1280, quality=85, subsampling=1),
+        "medium": StreamProfile(max_size=960, quality=70),
+        "low": StreamProfile(max_size=640, quality=50),
+        "gray": StreamProfile(max_size=640, quality=50, grayscale=True),
+    }
+    DEFAULT_STREAM_PROFILE = "original"
+    FRAME_CACHE_SIZE = 32  # Encoded frames kept per (device, sequence, profile)
+    PROCESSING_WORKERS = os.cpu_count() or 2  # Transcoding threads, Pillow releases the GIL
+    
+    # Shared memory frame rings read by separate streaming worker processes
+    SHARED_MEMORY_FRAMES = False
+    SHM_SLOTS = 4
+    SHM_SLOT_SIZE = 1024 * 1024   # Largest frame a slot can hold
+    SHM_POLL_INTERVAL = 0.005     # Seconds between ring checks in a worker
+    STREAM_WORKERS = 0
+    STREAM_WORKER_PORT = 5100     # First worker port, others follow
+    
+    SCREENSHOT_WORKERS = 2        # Background disk writers
+    SCREENSHOT_HISTORY = 1000     # Screenshot statuses kept for /screenshot_status
+    SCREENSHOT_LIST_LIMIT = 100
+    
+    # Session recording
+    RECORDINGS_DIR = "recordings"
+    RECORDING_SEGMENT_BYTES = 256 * 1024 * 1024
+    RECORDING_SEGMENT_SECONDS = 600
+    RECORDING_FSYNC_INTERVAL = 2.0
+    RECORDING_QUEUE_SIZE = 256    # Frames buffered before the recorder drops
+    PLAYBACK_SPEEDS = (1, 4, 16)
+    PLAYBACK_MAX_GAP = 1.0        # Longest pause between replayed frames (seconds)
+    PLAYBACK_CACHE_SIZE = 8       # Sessions kept mapped for reviewers
+    
+    # Timelapse export
+    TIMELAPSE_WIDTH = 720
+    TIMELAPSE_QUALITY = 70
+    TIMELAPSE_THRESHOLD = 4       # Difference hash bits that count as a change
+    TIMELAPSE_MAX_GAP = 60.0      # Keep a frame at least this often (seconds)
+    TIMELAPSE_CHUNK = 256         # Frames scored per worker job
+    TIMELAPSE_SHEET_FRAMES = 48
+    TIMELAPSE_SHEET_COLUMNS = 8
+    TIMELAPSE_THUMB_WIDTH = 180
+    
+    # Adaptive capture settings pushed to devices as stream_settings
+    ADAPTIVE_STREAMING = True
+    ADAPT_INTERVAL = 2.0  # Seconds between adjustments
+    MIN_FRAME_RATE = 2
+    MIN_QUALITY = 30
+    MIN_SCALE = 0.5
+    IDLE_FRAME_RATE = 2  # Capture rate while no viewer is watching
+    
+    # Delta mode: the phone sends only changed tiles between periodic keyframes
+    DELTA_FRAMES = False
+    TILE_SIZE = 128
+    KEYFRAME_INTERVAL = 5.0  # Seconds between full frames
+    KEYFRAME_RATIO = 0.5     # Send a full frame when more than this share of tiles changed
+    
+    # Duplicate frame suppression on ingest
+    DEDUP_FRAMES = True
+    PERCEPTUAL_DEDUP = False     # Also drop near-identical frames using a 64-bit dHash
+    PERCEPTUAL_THRESHOLD = 2     # Max differing hash bits to count as unchanged
+    STATIC_FRAME_COUNT = 15      # Consecutive duplicates before the screen counts as static
+    STATIC_FRAME_RATE = 3        # Capture rate hinted to the phone while static
+    
+    # Mouse moves and wheel ticks inside this window are merged per device
+    CONTROL_COALESCE_WINDOW = 0.016
+    CONTROL_BATCH_MAX = 2000     # Events accepted in one control_batch packet
+    
+    # Control traffic runs on its own Socket.IO namespace and connection
+    CONTROL_NAMESPACE = "/control"
+    CONTROL_LATENCY_SAMPLES = 500
+    
+    # Glass-to-glass timing from the phone's capture timestamps
+    FRAME_LATENCY_SAMPLES = 500
+    CLOCK_SYNC_SAMPLES = 8        # Ping exchanges kept per device, the lowest RTT one sets the offset
+    CLICK_FRAME_TIMEOUT = 5.0     # Give up on a click that no changed frame followed
     MAX_CLIENTS = 5
     TOKEN_EXPIRY = 3600  # 1 hour
+    TOKEN_IDLE_EXPIRY = 600       # Unused tokens (QR never opened) expire sooner
+    TOKEN_SWEEP_BATCH = 256       # Expired tokens removed per lock hold
+    RESUME_EXPIRY = 300           # A dropped device can resume its session this long after disconnecting
+    
+    # Logging
+    LOG_LEVEL = "INFO"            # DEBUG, INFO, SUCCESS, WARNING or ERROR
+    LOG_QUEUE_SIZE = 10000        # Messages buffered before the logger drops
+    LOG_MAX_BYTES = 10 * 1024 * 1024
+    LOG_BACKUPS = 3
+    LOG_SAMPLING = {              # Log 1 in N messages of these types
+        "mouse_move": 50,
+        "mouse_wheel": 10,
+        "keyboard": 5,
+        "control_batch": 10
+    }
+    
+    # Histogram buckets (seconds) for /metrics
+    METRICS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+    
+    # Load benchmark (benchmark subcommand)
+    BENCHMARK_FRAME_SIZE = (540, 960)      # Synthetic frame size, a phone capture at 50% scale
+    BENCHMARK_FRAME_COUNT = 60             # Distinct frames cycled by each simulated device
+    BENCHMARK_MAX_IN_FLIGHT = 2            # Unacked frames per device, like the phone client
+    BENCHMARK_SAMPLE_INTERVAL = 1.0        # Seconds between server CPU/memory samples
+    
+    # Hot path micro-benchmarks (microbench subcommand)
+    MICROBENCH_BASELINE = os.path.join("benchmarks", "microbench_baseline.json")
+    MICROBENCH_THRESHOLD = 0.25            # Slowdown of the median that counts as a regression
+    MICROBENCH_MIN_TIME = 0.2              # Seconds per timed round
+    MICROBENCH_REPEAT = 7                  # Timed rounds per benchmark
+    MICROBENCH_VIEWERS = 4                 # Threads waiting on the frame buffer during contention runs
+    
+    # Traffic capture (--capture) and replay
+    CAPTURE_QUEUE_SIZE = 1000              # Events buffered before the capture drops
     
     # UI settings
     WINDOW_WIDTH = 1200
@@ -104,76 +259,780 @@ class Config:
 
 config = Config()
 
-class SimpleLogger:
-    """Simple logger without emoji issues"""
+class AsyncLogger:
+    """Buffered logger: callers enqueue, a background thread prints and writes
+    
+    Messages below LOG_LEVEL are dropped before they are queued, noisy
+    message types can be sampled (1 in N), and the log file is kept open,
+    rotated by size and flushed on shutdown.
+    """
+    
+    LEVELS = {"DEBUG": 10, "INFO": 20, "SUCCESS": 25, "WARNING": 30, "ERROR": 40}
     
     def __init__(self):
         self.log_file = f"monstr_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+        self.level = self.LEVELS.get(config.LOG_LEVEL, 20)
+        self.queue: queue.Queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+        self.sample_counts: Dict[str, int] = {}
+        self.dropped = 0
+        self.thread: Optional[threading.Thread] = None
+        self.start_lock = threading.Lock()
+        
+    def debug(self, msg: str, sample: Optional[str] = None):
+        self._log("DEBUG", msg, sample)
+        
+    def info(self, msg: str, sample: Optional[str] = None):
+        self._log("INFO", msg, sample)
+        
+    def error(self, msg: str, sample: Optional[str] = None):
+        self._log("ERROR", msg, sample)
         
-    def info(self, msg: str):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_msg = f"[INFO] {timestamp} - {msg}"
-        print(log_msg)
-        self._write_log(log_msg)
-        
-    def error(self, msg: str):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_msg = f"[ERROR] {timestamp} - {msg}"
-        print(log_msg)
-        self._write_log(log_msg)
-        
-    def warning(self, msg: str):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_msg = f"[WARNING] {timestamp} - {msg}"
-        print(log_msg)
-        self._write_log(log_msg)
-        
-    def success(self, msg: str):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_msg = f"[SUCCESS] {timestamp} - {msg}"
-        print(log_msg)
-        self._write_log(log_msg)
-    
-    def _write_log(self, msg: str):
+    def warning(self, msg: str, sample: Optional[str] = None):
+        self._log("WARNING", msg, sample)
+        
+    def success(self, msg: str, sample: Optional[str] = None):
+        self._log("SUCCESS", msg, sample)
+    
+    def _log(self, level: str, msg: str, sample: Optional[str]):
+        if self.LEVELS[level] < self.level:
+            return
+        
+        if sample is not None:
+            # Unsynchronized on purpose: an occasional lost increment only shifts the sample
+            count = self.sample_counts.get(sample, 0)
+            self.sample_counts[sample] = count + 1
+            if count % config.LOG_SAMPLING.get(sample, 1):
+                return
+        
+        if self.thread is None:
+            self._start()
         try:
-            with open(self.log_file, 'a', encoding='utf-8') as f:
-                f.write(msg + '\n')
-        except:
+            self.queue.put_nowait((level, time.time(), msg))
+        except queue.Full:
+            self.dropped += 1
+    
+    def _start(self):
+        with self.start_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="logger", daemon=True)
+                self.thread.start()
+                atexit.register(self.shutdown)
+    
+    def _run(self):
+        log = None
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < 256:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            lines = []
+            stop = False
+            for entry in batch:
+                if entry is None:
+                    stop = True
+                    continue
+                level, created, msg = entry
+                timestamp = datetime.fromtimestamp(created).strftime("%Y-%m-%d %H:%M:%S")
+                lines.append(f"[{level}] {timestamp} - {msg}")
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                lines.append(f"[WARNING] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - "
+                             f"Logger queue full, dropped {dropped} messages")
+            
+            if lines:
+                text = "\n".join(lines) + "\n"
+                sys.stdout.write(text)
+                sys.stdout.flush()
+                try:
+                    if log is None:
+                        log = open(self.log_file, 'a', encoding='utf-8')
+                    log.write(text)
+                    log.flush()
+                    if log.tell() >= config.LOG_MAX_BYTES:
+                        log.close()
+                        log = None
+                        self._rotate()
+                except OSError:
+                    log = None
+            
+            if stop:
+                if log is not None:
+                    log.close()
+                return
+    
+    def _rotate(self):
+        """Shift monstr_log_*.txt to .1, .2, ... keeping LOG_BACKUPS files"""
+        for number in range(config.LOG_BACKUPS - 1, 0, -1):
+            if os.path.exists(f"{self.log_file}.{number}"):
+                os.replace(f"{self.log_file}.{number}", f"{self.log_file}.{number + 1}")
+        if config.LOG_BACKUPS > 0:
+            os.replace(self.log_file, f"{self.log_file}.1")
+        else:
+            os.remove(self.log_file)
+    
+    def shutdown(self):
+        """Write out everything queued and stop the writer"""
+        with self.start_lock:
+            thread, self.thread = self.thread, None
+        if thread is not None and thread.is_alive():
+            self.queue.put(None)
+            thread.join(timeout=5)
+
+logger = AsyncLogger()
+
+class MetricsRegistry:
+    """Counters and histograms aggregated per thread, merged when scraped
+    
+    Each thread updates its own dict without taking a lock; /metrics sums the
+    per-thread shards and folds shards of finished threads into a retired
+    total. Only the owning thread ever removes keys from its shard, so a
+    forgotten label is queued per shard, hidden from scrapes and dropped by
+    the owner on its next update. Gauges are callbacks read at scrape time.
+    """
+    
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.local = threading.local()
+        self.shards: List[Tuple[Any, Dict, set]] = []  # thread, shard, labels to forget
+        self.retired: Dict = {}
+        self.gauges: Dict[str, Any] = {}
+        self.lock = threading.Lock()
+        
+    def _shard(self) -> Dict:
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = self.local.shard = {}
+            self.local.forgotten = set()
+            with self.lock:
+                # Threaded servers start a thread per request, fold finished ones away
+                if len(self.shards) >= 256:
+                    self._retire_finished()
+                self.shards.append((weakref.ref(threading.current_thread()), shard, self.local.forgotten))
+        elif self.local.forgotten:
+            self._drop_forgotten(shard, self.local.forgotten)
+        return shard
+    
+    def _drop_forgotten(self, shard: Dict, forgotten: set):
+        """Remove forgotten series from the calling thread's own shard"""
+        with self.lock:
+            for key in [key for key in shard if forgotten.intersection(key[1])]:
+                del shard[key]
+            forgotten.clear()
+    
+    def _retire_finished(self):
+        live = []
+        for thread_ref, shard, forgotten in self.shards:
+            thread = thread_ref()
+            if thread is None or not thread.is_alive():
+                self._merge(self.retired, shard, forgotten)
+            else:
+                live.append((thread_ref, shard, forgotten))
+        self.shards = live
+    
+    def inc(self, name: str, labels: Tuple = (), value: float = 1):
+        """Add to a counter"""
+        shard = self._shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + value
+    
+    def observe(self, name: str, value: float, labels: Tuple = ()):
+        """Record a histogram sample"""
+        shard = self._shard()
+        key = (name, labels)
+        histogram = shard.get(key)
+        if histogram is None:
+            histogram = shard[key] = [0] * (len(self.buckets) + 2)  # buckets..., +Inf count, sum
+        histogram[bisect.bisect_left(self.buckets, value)] += 1
+        histogram[-1] += value
+    
+    def gauge(self, name: str, collect):
+        """Register a gauge read at scrape time; collect() returns [(labels, value)]"""
+        self.gauges[name] = collect
+    
+    def forget(self, label: Tuple[str, str]):
+        """Drop all series carrying a label, e.g. ("device", sid) after disconnect"""
+        with self.lock:
+            for key in [key for key in self.retired if label in key[1]]:
+                del self.retired[key]
+            for _, _, forgotten in self.shards:
+                forgotten.add(label)
+    
+    def _merge(self, total: Dict, shard: Dict, skip: set = frozenset()):
+        for key, value in list(shard.items()):
+            if skip and skip.intersection(key[1]):
+                continue
+            if isinstance(value, list):
+                merged = total.setdefault(key, [0] * len(value))
+                for i, count in enumerate(value):
+                    merged[i] += count
+            else:
+                total[key] = total.get(key, 0) + value
+    
+    def collect(self) -> Dict:
+        """Sum every shard into {(name, labels): value}"""
+        with self.lock:
+            self._retire_finished()
+            
+            total: Dict = {}
+            self._merge(total, self.retired)
+            for _, shard, forgotten in self.shards:
+                self._merge(total, shard, forgotten)
+        return total
+    
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        def series(name: str, labels: Tuple, extra: Tuple = ()) -> str:
+            pairs = [f'{key}="{value}"' for key, value in labels + extra]
+            return f"monstr_{name}{{{','.join(pairs)}}}" if pairs else f"monstr_{name}"
+        
+        lines = []
+        described = set()
+        for (name, labels), value in sorted(self.collect().items()):
+            kind, text = METRIC_HELP.get(name, ("counter", name))
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP monstr_{name} {text}")
+                lines.append(f"# TYPE monstr_{name} {kind}")
+            
+            if isinstance(value, list):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), value):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{series(name + '_bucket', labels, (('le', le),))} {cumulative}")
+                lines.append(f"{series(name + '_sum', labels)} {value[-1]}")
+                lines.append(f"{series(name + '_count', labels)} {cumulative}")
+            else:
+                lines.append(f"{series(name, labels)} {value}")
+        
+        for name, collect in sorted(self.gauges.items()):
+            lines.append(f"# HELP monstr_{name} {METRIC_HELP.get(name, ('gauge', name))[1]}")
+            lines.append(f"# TYPE monstr_{name} gauge")
+            for labels, value in collect():
+                lines.append(f"{series(name, labels)} {value}")
+        return "\n".join(lines) + "\n"
+    
+    def summary(self) -> Dict:
+        """JSON summary grouped by device"""
+        devices: Dict[str, Dict] = {}
+        totals: Dict[str, Any] = {}
+        for (name, labels), value in self.collect().items():
+            label_map = dict(labels)
+            target = devices.setdefault(label_map.pop("device"), {}) if "device" in label_map else totals
+            field = "_".join([name] + [str(v) for v in label_map.values()])
+            if isinstance(value, list):
+                count = sum(value[:-1])
+                target[field] = {
+                    "count": count,
+                    "avg_ms": round(value[-1] / count * 1000, 2) if count else 0.0,
+                    "p50_ms": self._bucket_percentile(value, 50),
+                    "p90_ms": self._bucket_percentile(value, 90)
+                }
+            else:
+                target[field] = value
+        
+        gauges = {name: {"/".join(str(v) for _, v in labels) or "value": value for labels, value in collect()}
+                  for name, collect in self.gauges.items()}
+        return {"devices": devices, "totals": totals, "gauges": gauges}
+    
+    def _bucket_percentile(self, histogram: List, q: float) -> Optional[float]:
+        """Upper bucket bound holding the q-th percentile, in milliseconds"""
+        count = sum(histogram[:-1])
+        if not count:
+            return None
+        seen = 0
+        for bound, bucket in zip(self.buckets + (float("inf"),), histogram):
+            seen += bucket
+            if seen * 100 >= q * count:
+                return round(bound * 1000, 2) if bound != float("inf") else None
+        return None
+
+METRIC_HELP = {
+    "frames_in_total": ("counter", "Frames received from devices"),
+    "bytes_in_total": ("counter", "Frame bytes received from devices"),
+    "frames_dropped_total": ("counter", "Frames dropped before reaching a viewer, by reason"),
+    "frames_served_total": ("counter", "Frames sent to viewers, by stream profile"),
+    "viewer_frames_served_total": ("counter", "Frames sent to each open viewer stream"),
+    "viewer_frames_skipped_total": ("counter", "Frames each open viewer stream fell behind on"),
+    "decode_seconds": ("histogram", "Time to turn an upload into a JPEG frame"),
+    "processing_seconds": ("histogram", "Time to transcode a frame for a stream profile"),
+    "capture_to_ingest_seconds": ("histogram", "Phone capture until the server published the frame"),
+    "ingest_to_send_seconds": ("histogram", "Frame published until it was written to a viewer"),
+    "click_to_frame_seconds": ("histogram", "Control click until the next changed frame arrived"),
+    "control_events_total": ("counter", "Control events received, by type"),
+    "connected_devices": ("gauge", "Connected devices"),
+    "tokens": ("gauge", "Connection tokens not yet used or expired"),
+    "viewers": ("gauge", "Open viewer streams per device and profile"),
+    "queue_depth": ("gauge", "Items waiting in internal queues")
+}
+
+metrics = MetricsRegistry(config.METRICS_BUCKETS)
+
+def _viewer_gauge() -> List[Tuple[Tuple, int]]:
+    return [((("device", sid), ("profile", profile)), count)
+            for (sid, profile), count in list(connection_manager.viewer_counts.items())]
+
+def _queue_gauge() -> List[Tuple[Tuple, int]]:
+    depths = [
+        ((("queue", "logger"),), logger.queue.qsize()),
+        ((("queue", "frame_workers"),), sum(1 for job in list(frame_worker_pool.jobs.values())
+                                            if job["pending"] is not None)),
+        ((("queue", "screenshots"),), sum(1 for job in list(screenshot_writer.jobs.values())
+                                          if job["status"] == "pending"))
+    ]
+    for sid, recorder in list(recording_manager.recorders.items()):
+        depths.append(((("queue", "recorder"), ("device", sid)), recorder.queue.qsize()))
+    return depths
+
+metrics.gauge("connected_devices", lambda: [((), len(connection_manager.clients))])
+metrics.gauge("viewers", _viewer_gauge)
+metrics.gauge("queue_depth", _queue_gauge)
+metrics.gauge("tokens", lambda: [((), len(connection_manager.tokens))])
+
+class FrameBuffer:
+    """Latest-frame slot shared by every viewer of a device"""
+    
+    def __init__(self):
+        self.frame: Optional[bytes] = None
+        self.seq = 0
+        self.timestamp = 0.0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        
+    def publish(self, frame_data: bytes, seq: Optional[int] = None,
+                on_seq: Optional[Callable[[int], None]] = None) -> int:
+        """Replace the latest frame, wake waiting viewers and return its sequence number
+        
+        A given seq that is not newer than the current one is ignored, so a
+        late transcode never moves viewers back to an older frame. on_seq is
+        called with the new sequence number before any viewer is woken.
+        """
+        with self.condition:
+            if seq is not None and seq <= self.seq:
+                return self.seq
+            self.seq = seq if seq is not None else self.seq + 1
+            self.frame = frame_data
+            self.timestamp = time.time()
+            if on_seq:
+                on_seq(self.seq)
+            self.condition.notify_all()
+            self._wake_async_waiters()
+            return self.seq
+    
+    def latest(self, last_seq: int = 0) -> Optional[Tuple[int, bytes]]:
+        """Get the newest frame if it is newer than last_seq"""
+        with self.condition:
+            if self.frame is None or self.seq <= last_seq:
+                return None
+            return self.seq, self.frame
+    
+    def wait(self, last_seq: int, timeout: Optional[float] = None) -> Optional[Tuple[int, bytes]]:
+        """Block until a frame newer than last_seq arrives, the buffer closes or timeout expires"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.closed or self.seq > last_seq, timeout)
+            if self.closed or self.frame is None or self.seq <= last_seq:
+                return None
+            return self.seq, self.frame
+    
+    async def wait_async(self, last_seq: int, timeout: Optional[float] = None) -> Optional[Tuple[int, bytes]]:
+        """Coroutine version of wait() for the asyncio server mode"""
+        loop = asyncio.get_running_loop()
+        with self.condition:
+            if not self.closed and self.seq <= last_seq:
+                waiter = (loop, loop.create_future())
+                self.async_waiters.append(waiter)
+            else:
+                waiter = None
+        
+        if waiter:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter[1]), timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self.condition:
+                    if waiter in self.async_waiters:
+                        self.async_waiters.remove(waiter)
+        
+        with self.condition:
+            if self.closed or self.frame is None or self.seq <= last_seq:
+                return None
+            return self.seq, self.frame
+    
+    def _wake_async_waiters(self):
+        """Resolve pending coroutine waiters on their own event loops"""
+        for loop, future in self.async_waiters:
+            loop.call_soon_threadsafe(lambda future=future: future.done() or future.set_result(None))
+        self.async_waiters = []
+    
+    def close(self):
+        """Wake all waiting viewers so they can stop"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+            self._wake_async_waiters()
+
+class SharedFrameRing:
+    """Per-device frame ring in shared memory with a seqlock per slot
+    
+    The ingest process is the only writer; streaming worker processes attach by
+    name and copy the newest frame out of the mapping. Each slot's lock
+    counter is odd while the writer fills it, so a reader that sees the counter
+    change (or odd) during its copy simply retries. In the writer, self.lock
+    keeps publish from racing close when a device disconnects mid-frame.
+    """
+    
+    MAGIC = 0x4D4F4E53
+    MAX_WORKERS = 16
+    HEADER = struct.Struct("<IIIIQ")  # magic, slot_count, slot_size, closed, latest_seq
+    VIEWERS = struct.Struct(f"<{MAX_WORKERS}I")  # viewer count per streaming worker
+    HEADER_SIZE = 128
+    SLOT_HEADER = struct.Struct("<QQId")  # lock, seq, length, timestamp
+    SLOT_HEADER_SIZE = 32
+    
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self.buf = shm.buf
+        magic, self.slot_count, self.slot_size, _, _ = self.HEADER.unpack_from(self.buf, 0)
+        if magic != self.MAGIC:
+            raise ValueError(f"Not a frame ring: {shm.name}")
+        self.stride = self.SLOT_HEADER_SIZE + self.slot_size
+        self.oversized = 0
+        self.lock = threading.Lock()
+        
+    @staticmethod
+    def ring_name(sid: str) -> str:
+        """Shared memory name for a device"""
+        return "monstr_" + hashlib.sha1(sid.encode()).hexdigest()[:20]
+    
+    @classmethod
+    def create(cls, sid: str, slot_count: int, slot_size: int) -> "SharedFrameRing":
+        """Create the ring for a device (writer side)"""
+        size = cls.HEADER_SIZE + slot_count * (cls.SLOT_HEADER_SIZE + slot_size)
+        shm = shared_memory.SharedMemory(name=cls.ring_name(sid), create=True, size=size)
+        cls.HEADER.pack_into(shm.buf, 0, cls.MAGIC, slot_count, slot_size, 0, 0)
+        return cls(shm, owner=True)
+    
+    @classmethod
+    def attach(cls, sid: str) -> Optional["SharedFrameRing"]:
+        """Attach to an existing device ring (reader side)"""
+        try:
+            try:
+                shm = shared_memory.SharedMemory(name=cls.ring_name(sid), track=False)
+            except TypeError:
+                # Before Python 3.13: workers share the ingest process's resource
+                # tracker, so attaching does not schedule an early unlink
+                shm = shared_memory.SharedMemory(name=cls.ring_name(sid))
+        except FileNotFoundError:
+            return None
+        return cls(shm, owner=False)
+    
+    @property
+    def closed(self) -> bool:
+        return self.HEADER.unpack_from(self.buf, 0)[3] != 0
+    
+    @property
+    def latest_seq(self) -> int:
+        return self.HEADER.unpack_from(self.buf, 0)[4]
+    
+    def publish(self, seq: int, frame_data: bytes, timestamp: float) -> bool:
+        """Write a frame into its slot and advance latest_seq (writer only)"""
+        length = len(frame_data)
+        if length > self.slot_size:
+            self.oversized += 1
+            return False
+        
+        base = self.HEADER_SIZE + (seq % self.slot_count) * self.stride
+        with self.lock:
+            if self.buf is None:
+                return False
+            lock = self.SLOT_HEADER.unpack_from(self.buf, base)[0]
+            struct.pack_into("<Q", self.buf, base, lock + 1)
+            data_start = base + self.SLOT_HEADER_SIZE
+            self.buf[data_start:data_start + length] = frame_data
+            self.SLOT_HEADER.pack_into(self.buf, base, lock + 2, seq, length, timestamp)
+            struct.pack_into("<Q", self.buf, 16, seq)
+        return True
+    
+    def read(self, last_seq: int = 0, retries: int = 8) -> Optional[Tuple[int, bytes]]:
+        """Copy out the newest frame if it is newer than last_seq"""
+        for _ in range(retries):
+            latest = self.latest_seq
+            if latest <= last_seq:
+                return None
+            
+            base = self.HEADER_SIZE + (latest % self.slot_count) * self.stride
+            lock, seq, length, _ = self.SLOT_HEADER.unpack_from(self.buf, base)
+            if lock & 1 or seq != latest:
+                continue
+            
+            data_start = base + self.SLOT_HEADER_SIZE
+            frame = bytes(self.buf[data_start:data_start + length])
+            if self.SLOT_HEADER.unpack_from(self.buf, base)[0] == lock:
+                return seq, frame
+        return None
+    
+    def set_viewers(self, worker_id: int, count: int):
+        """Publish the viewer count of one streaming worker"""
+        struct.pack_into("<I", self.buf, self.HEADER.size + worker_id * 4, count)
+    
+    def get_viewers(self) -> int:
+        """Total viewers across all streaming workers"""
+        return sum(self.VIEWERS.unpack_from(self.buf, self.HEADER.size))
+    
+    def close(self):
+        """Mark the ring closed; the writer also unlinks it"""
+        with self.lock:
+            if self.buf is None:
+                return
+            if self.owner:
+                struct.pack_into("<I", self.buf, 12, 1)
+            self.buf = None
+            self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+def remove_qr_codes(token: str):
+    """Delete the QR images generated for a token"""
+    for path in (f"qrcodes/{token}.png", f"static/qrcodes/{token}.png"):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
             pass
+        except OSError as e:
+            logger.error(f"QR cleanup error: {e}")
 
-logger = SimpleLogger()
+class TokenStore:
+    """Connection tokens with idle and absolute expiry
+    
+    A token is valid until TOKEN_EXPIRY after it was issued or until it went
+    unused for the idle expiry, and is consumed by the first successful
+    authenticate. Deadlines are kept on a min-heap: the sweeper only pops
+    entries that are due, O(log n) each, and re-pushes tokens whose activity
+    moved their deadline, so nothing scans the whole dict under the lock.
+    
+    Removing a token early leaves its heap entry behind. Those are counted
+    in stale, and once they outnumber the live tokens the sweeper thread
+    compacts the heap, so it stays under twice the live tokens plus a batch.
+    """
+    
+    def __init__(self, idle_expiry: float, absolute_expiry: float, on_remove=None):
+        self.idle_expiry = idle_expiry
+        self.absolute_expiry = absolute_expiry
+        self.on_remove = on_remove
+        self.tokens: Dict[str, Dict] = {}
+        self.heap: List[Tuple[float, str]] = []
+        self.expired = 0
+        self.consumed = 0
+        self.stale = 0  # heap entries whose token is gone
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.thread: Optional[threading.Thread] = None
+        
+    def __len__(self) -> int:
+        return len(self.tokens)
+    
+    def _deadline(self, entry: Dict) -> float:
+        return min(entry["last_activity"] + self.idle_expiry, entry["created_at"] + self.absolute_expiry)
+    
+    def issue(self, token: str, entry: Dict):
+        """Add a token, entry needs created_at and last_activity"""
+        with self.lock:
+            self.tokens[token] = entry
+            heapq.heappush(self.heap, (self._deadline(entry), token))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="token-sweeper", daemon=True)
+                self.thread.start()
+            elif self.heap[0][1] == token:
+                # New earliest deadline, the sweeper may be sleeping past it
+                self.wakeup.notify()
+    
+    def touch(self, token: str) -> bool:
+        """Check a token and refresh its idle deadline"""
+        now = time.time()
+        with self.lock:
+            entry = self.tokens.get(token)
+            if entry is None:
+                return False
+            if self._deadline(entry) <= now:
+                self.tokens.pop(token)
+                self.expired += 1
+                self._dropped()
+            else:
+                entry["last_activity"] = now
+                return True
+        if self.on_remove:
+            self.on_remove(token)
+        return False
+    
+    def consume(self, token: str) -> Optional[Dict]:
+        """Take a valid token out of the store, None if unknown or expired"""
+        with self.lock:
+            entry = self.tokens.pop(token, None)
+            if entry is None:
+                return None
+            self._dropped()
+            if self._deadline(entry) <= time.time():
+                self.expired += 1
+                entry = None
+            else:
+                self.consumed += 1
+        if self.on_remove:
+            self.on_remove(token)
+        return entry
+    
+    def _dropped(self):
+        """Count the heap entry of a token removed outside the sweep, call with the lock held"""
+        self.stale += 1
+        if self.stale > len(self.tokens) + config.TOKEN_SWEEP_BATCH:
+            self.wakeup.notify()
+    
+    def compact(self):
+        """Rebuild the heap without the entries of removed tokens"""
+        with self.lock:
+            self.heap = [item for item in self.heap if item[1] in self.tokens]
+            heapq.heapify(self.heap)
+            self.stale = 0
+    
+    def sweep(self) -> int:
+        """Remove due tokens, returns how many expired
+        
+        Stale entries count against TOKEN_SWEEP_BATCH like any other pop, so
+        one lock hold never works through more than a batch of entries.
+        """
+        removed = []
+        now = time.time()
+        with self.lock:
+            for _ in range(config.TOKEN_SWEEP_BATCH):
+                if not self.heap or self.heap[0][0] > now:
+                    break
+                _, token = heapq.heappop(self.heap)
+                entry = self.tokens.get(token)
+                if entry is None:
+                    self.stale = max(self.stale - 1, 0)
+                    continue
+                deadline = self._deadline(entry)
+                if deadline > now:
+                    # Used since it was pushed, check again at its new deadline
+                    heapq.heappush(self.heap, (deadline, token))
+                else:
+                    self.tokens.pop(token)
+                    removed.append(token)
+            self.expired += len(removed)
+        
+        for token in removed:
+            if self.on_remove:
+                self.on_remove(token)
+        return len(removed)
+    
+    def _run(self):
+        while True:
+            with self.lock:
+                delay = self.heap[0][0] - time.time() if self.heap else None
+                if delay is None or delay > 0:
+                    self.wakeup.wait(delay)
+                compact = self.stale > len(self.tokens) + config.TOKEN_SWEEP_BATCH
+            try:
+                if compact:
+                    self.compact()
+                if self.sweep():
+                    logger.debug(f"Expired tokens swept, {len(self.tokens)} left")
+            except Exception as e:
+                logger.error(f"Token sweep error: {e}")
+    
+    def get_stats(self) -> Dict:
+        """Token counts"""
+        with self.lock:
+            return {"active": len(self.tokens), "pending_deadlines": len(self.heap), "stale": self.stale,
+                    "expired": self.expired, "consumed": self.consumed}
 
 class ConnectionManager:
     """Manages client connections and sessions"""
     
     def __init__(self):
         self.clients: Dict[str, Dict] = {}
-        self.tokens: Dict[str, Dict] = {}
-        self.screen_streams: Dict[str, queue.Queue] = {}
+        self.tokens = TokenStore(config.TOKEN_IDLE_EXPIRY, config.TOKEN_EXPIRY, remove_qr_codes)
+        self.resume_keys = TokenStore(config.RESUME_EXPIRY, config.RESUME_EXPIRY)  # of disconnected devices
+        self.resume_owners: Dict[str, str] = {}      # resume key -> connected device sid
+        self.screen_streams: Dict[str, FrameBuffer] = {}
+        self.profile_streams: Dict[Tuple[str, str], FrameBuffer] = {}
+        self.viewer_counts: Dict[Tuple[str, str], int] = {}
+        self.shared_rings: Dict[str, SharedFrameRing] = {}
+        self.subscribers: Dict[str, List] = {}
+        self.control_keys: Dict[str, str] = {}       # control key -> device sid
+        self.control_channels: Dict[str, str] = {}   # device sid -> control namespace sid
+        self.control_devices: Dict[str, str] = {}    # control namespace sid -> device sid
+        self.control_panels: Set[str] = set()        # control namespace sids of control panels
         self.lock = threading.Lock()
         
     def generate_token(self, client_info: Dict) -> str:
         """Generate unique token for client"""
         token = hashlib.sha256(f"{uuid.uuid4()}{time.time()}".encode()).hexdigest()[:32]
         
-        with self.lock:
-            self.tokens[token] = {
-                "client_info": client_info,
-                "created_at": time.time(),
-                "last_activity": time.time(),
-                "ip": "127.0.0.1"
-            }
+        self.tokens.issue(token, {
+            "client_info": client_info,
+            "created_at": time.time(),
+            "last_activity": time.time(),
+            "ip": "127.0.0.1"
+        })
             
         logger.info(f"Generated token for client: {client_info.get('device', 'Unknown')}")
         return token
     
     def validate_token(self, token: str) -> bool:
         """Validate client token"""
+        return self.tokens.touch(token)
+    
+    def consume_token(self, token: str) -> bool:
+        """Validate a token for authentication, it cannot be used again"""
+        return self.tokens.consume(token) is not None
+    
+    def issue_resume_key(self, sid: str) -> str:
+        """Create the key a device presents to reconnect after its token was consumed"""
+        key = uuid.uuid4().hex
+        with self.lock:
+            client = self.clients.get(sid)
+            if client:
+                self.resume_owners.pop(client.get("resume_key"), None)
+                client["resume_key"] = key
+                self.resume_owners[key] = sid
+        return key
+    
+    def can_resume(self, key: str) -> bool:
+        """Check a resume key without using it up"""
         with self.lock:
-            if token in self.tokens:
-                self.tokens[token]["last_activity"] = time.time()
+            if key in self.resume_owners:
                 return True
-        return False
+        return self.resume_keys.touch(key)
+    
+    def resume_client(self, key: str, token: str, client_data: Dict) -> Tuple[bool, Optional[str]]:
+        """Use up a resume key, valid only for the device and token it was issued to
+        
+        Returns whether it was valid and, when the old connection has not
+        timed out yet, the sid the caller has to disconnect to take over.
+        """
+        device = client_data.get("device") if isinstance(client_data, dict) else None
+        with self.lock:
+            sid = self.resume_owners.pop(key, None)
+            if sid is not None:
+                client = self.clients.get(sid)
+                if client is None:
+                    return False, None
+                # The old connection must not hand the key on when it closes
+                client["resume_key"] = None
+                if client["token"] != token or client["data"].get("device") != device:
+                    return False, None
+                return True, sid
+        entry = self.resume_keys.consume(key)
+        return entry is not None and entry["token"] == token and entry["device"] == device, None
     
     def add_client(self, sid: str, token: str, client_data: Dict):
         """Add new client connection"""
@@ -187,8 +1046,12 @@ class ConnectionManager:
                 "streaming": False
             }
             
-            
-            self.screen_streams[sid] = queue.Queue(maxsize=5)  # Smaller queue for better performance
+            self.screen_streams[sid] = FrameBuffer()
+            if config.SHARED_MEMORY_FRAMES:
+                try:
+                    self.shared_rings[sid] = SharedFrameRing.create(sid, config.SHM_SLOTS, config.SHM_SLOT_SIZE)
+                except Exception as e:
+                    logger.error(f"Shared frame ring error: {e}")
             
         logger.success(f"Client connected: {sid} - {client_data.get('device', 'Unknown')}")
     
@@ -196,11 +1059,71 @@ class ConnectionManager:
         """Remove client connection"""
         with self.lock:
             if sid in self.clients:
-                device = self.clients[sid]["data"].get("device", "Unknown")
-                self.clients.pop(sid, None)
-                self.screen_streams.pop(sid, None)
+                client = self.clients.pop(sid)
+                device = client["data"].get("device", "Unknown")
+                resume_key = client.get("resume_key")
+                if resume_key and self.resume_owners.pop(resume_key, None) == sid:
+                    now = time.time()
+                    self.resume_keys.issue(resume_key, {
+                        "token": client["token"],
+                        "device": client["data"].get("device"),
+                        "created_at": now,
+                        "last_activity": now
+                    })
+                buffers = [self.screen_streams.pop(sid, None)]
+                for key in [key for key in self.profile_streams if key[0] == sid]:
+                    buffers.append(self.profile_streams.pop(key))
+                    self.viewer_counts.pop(key, None)
+                for buffer in buffers:
+                    if buffer:
+                        buffer.close()
+                ring = self.shared_rings.pop(sid, None)
+                if ring:
+                    ring.close()
+                for key in [key for key, device_sid in self.control_keys.items() if device_sid == sid]:
+                    self.control_keys.pop(key)
+                self.control_devices.pop(self.control_channels.pop(sid, None), None)
                 logger.info(f"Client disconnected: {sid} - {device}")
     
+    def issue_control_key(self, sid: str) -> str:
+        """Create the key a device presents when opening its control channel"""
+        key = uuid.uuid4().hex
+        with self.lock:
+            self.control_keys[key] = sid
+        return key
+    
+    def attach_control_channel(self, key: str, control_sid: str) -> Optional[str]:
+        """Bind a control namespace connection to its device, None for unknown keys"""
+        with self.lock:
+            sid = self.control_keys.get(key)
+            if sid is None or sid not in self.clients:
+                return None
+            self.control_devices.pop(self.control_channels.get(sid), None)
+            self.control_channels[sid] = control_sid
+            self.control_devices[control_sid] = sid
+            return sid
+    
+    def attach_control_panel(self, control_sid: str):
+        """Mark a control namespace connection as a control panel"""
+        with self.lock:
+            self.control_panels.add(control_sid)
+    
+    def is_control_panel(self, control_sid: str) -> bool:
+        """Whether a control namespace connection may send control events"""
+        return control_sid in self.control_panels
+    
+    def detach_control_channel(self, control_sid: str):
+        """Forget a closed control namespace connection"""
+        with self.lock:
+            self.control_panels.discard(control_sid)
+            sid = self.control_devices.pop(control_sid, None)
+            if sid is not None and self.control_channels.get(sid) == control_sid:
+                self.control_channels.pop(sid)
+    
+    def get_control_channel(self, sid: str) -> Optional[str]:
+        """Control namespace sid of a device, if it opened one"""
+        return self.control_channels.get(sid)
+    
     def get_client(self, sid: str) -> Optional[Dict]:
         """Get client information"""
         with self.lock:
@@ -212,29 +1135,132 @@ class ConnectionManager:
             if sid in self.clients:
                 self.clients[sid]["screen_size"] = (width, height)
     
-    def add_frame(self, sid: str, frame_data: bytes):
-        """Add screen frame to client queue"""
-        if sid in self.screen_streams:
-            try:
-                # Clear old frames if queue is full
-                if self.screen_streams[sid].full():
-                    try:
-                        self.screen_streams[sid].get_nowait()
-                    except queue.Empty:
-                        pass
-                
-                self.screen_streams[sid].put_nowait(frame_data)
-            except queue.Full:
-                pass
+    def add_frame(self, sid: str, frame_data: bytes, on_seq: Optional[Callable[[int], None]] = None) -> int:
+        """Publish screen frame to all viewers of a client, on_seq runs before they wake"""
+        buffer = self.screen_streams.get(sid)
+        if buffer is None:
+            return 0
+        seq = buffer.publish(frame_data, on_seq=on_seq)
+        
+        ring = self.shared_rings.get(sid)
+        if ring is not None:
+            ring.publish(seq, frame_data, buffer.timestamp)
+        
+        for callback in self.subscribers.get(sid, ()):
+            callback(seq, frame_data, buffer.timestamp)
+        
+        # Hand transcoding for every watched profile to the worker pool
+        for profile in self.get_active_profiles(sid):
+            frame_worker_pool.submit(sid, profile, seq, frame_data)
+        return seq
     
-    def get_frame(self, sid: str) -> Optional[bytes]:
-        """Get screen frame from client queue"""
-        if sid in self.screen_streams:
-            try:
-                return self.screen_streams[sid].get_nowait()
-            except queue.Empty:
-                return None
-        return None
+    def subscribe(self, sid: str, callback):
+        """Call callback(seq, frame_data, timestamp) for every new frame of a device"""
+        with self.lock:
+            self.subscribers[sid] = self.subscribers.get(sid, []) + [callback]
+    
+    def unsubscribe(self, sid: str, callback):
+        """Remove a frame subscriber"""
+        with self.lock:
+            callbacks = [c for c in self.subscribers.get(sid, []) if c != callback]
+            if callbacks:
+                self.subscribers[sid] = callbacks
+            else:
+                self.subscribers.pop(sid, None)
+    
+    def publish_processed(self, sid: str, profile: str, seq: int, frame_data: bytes):
+        """Publish a transcoded frame to the viewers of a profile"""
+        buffer = self.profile_streams.get((sid, profile))
+        if buffer is not None:
+            buffer.publish(frame_data, seq)
+    
+    def get_active_profiles(self, sid: str) -> List[str]:
+        """Get profiles that currently have viewers and need transcoding"""
+        with self.lock:
+            return [profile for (client_sid, profile) in self.viewer_counts
+                    if client_sid == sid and config.STREAM_PROFILES.get(profile) is not None]
+    
+    def get_viewer_count(self, sid: str) -> int:
+        """Get number of viewers and recorders consuming a device's frames"""
+        with self.lock:
+            count = sum(count for (client_sid, _), count in self.viewer_counts.items() if client_sid == sid)
+            count += len(self.subscribers.get(sid, ()))
+            ring = self.shared_rings.get(sid)
+            if ring is not None:
+                count += ring.get_viewers()
+            return count
+    
+    def add_viewer(self, sid: str, profile: str) -> bool:
+        """Register a viewer of a device stream in the given profile"""
+        key = (sid, profile)
+        transcoded = config.STREAM_PROFILES.get(profile) is not None
+        with self.lock:
+            if sid not in self.screen_streams:
+                return False
+            self.viewer_counts[key] = self.viewer_counts.get(key, 0) + 1
+            if not transcoded:
+                return True
+            if key not in self.profile_streams:
+                self.profile_streams[key] = FrameBuffer()
+            # Only an empty profile needs seeding, otherwise it already has this frame or a newer one
+            latest = self.screen_streams[sid].latest() if self.profile_streams[key].frame is None else None
+        
+        # Seed the new profile with the current frame so the viewer doesn't wait for the next one
+        if latest:
+            frame_worker_pool.submit(sid, profile, latest[0], latest[1])
+        return True
+    
+    def remove_viewer(self, sid: str, profile: str):
+        """Unregister a viewer; transcoding stops when a profile has no viewers"""
+        key = (sid, profile)
+        with self.lock:
+            if key not in self.viewer_counts:
+                return
+            self.viewer_counts[key] -= 1
+            if self.viewer_counts[key] <= 0:
+                self.viewer_counts.pop(key)
+                buffer = self.profile_streams.pop(key, None)
+                if buffer:
+                    buffer.close()
+    
+    def get_stream_buffer(self, sid: str, profile: Optional[str] = None) -> Optional[FrameBuffer]:
+        """Get the buffer viewers of a profile read from"""
+        if config.STREAM_PROFILES.get(profile) is None:
+            return self.screen_streams.get(sid)
+        return self.profile_streams.get((sid, profile))
+    
+    def get_frame(self, sid: str, last_seq: int = 0) -> Optional[Tuple[int, bytes]]:
+        """Get the newest frame not yet seen by a viewer at cursor last_seq"""
+        buffer = self.screen_streams.get(sid)
+        if buffer is None:
+            return None
+        return buffer.latest(last_seq)
+    
+    def wait_frame(self, sid: str, last_seq: int, timeout: Optional[float] = None,
+                   profile: Optional[str] = None) -> Optional[Tuple[int, bytes]]:
+        """Wait for the next frame newer than last_seq, or None on timeout/disconnect"""
+        buffer = self.get_stream_buffer(sid, profile)
+        if buffer is None:
+            return None
+        return buffer.wait(last_seq, timeout)
+    
+    async def wait_frame_async(self, sid: str, last_seq: int, timeout: Optional[float] = None,
+                               profile: Optional[str] = None) -> Optional[Tuple[int, bytes]]:
+        """Coroutine version of wait_frame for the asyncio server mode"""
+        buffer = self.get_stream_buffer(sid, profile)
+        if buffer is None:
+            return None
+        return await buffer.wait_async(last_seq, timeout)
+    
+    def is_streaming(self, sid: str) -> bool:
+        """Check if a client still has an open frame buffer"""
+        buffer = self.screen_streams.get(sid)
+        return buffer is not None and not buffer.closed
+    
+    def get_latest_frame(self, sid: str) -> Optional[bytes]:
+        """Get the latest frame without affecting any viewer"""
+        result = self.get_frame(sid)
+        return result[1] if result else None
     
     def get_connected_devices(self) -> List[Dict]:
         """Get list of all connected devices"""
@@ -245,97 +1271,693 @@ class ConnectionManager:
                     "sid": sid,
                     "device": client["data"].get("device", "Unknown"),
                     "connected_at": client["connected_at"],
-                    "screen_size": client["screen_size"]
+                    "screen_size": client["screen_size"],
+                    "frames_suppressed": frame_deduplicator.get_suppressed(sid),
+                    "control_channel": sid in self.control_channels,
+                    "control_latency": control_latency.get_stats(sid),
+                    "latency": frame_latency.get_stats(sid)
                 })
             return devices
 
 connection_manager = ConnectionManager()
 
 class SimpleFrameProcessor:
-    """Simple frame processor without OpenCV"""
+    """Frame transcoder using Pillow draft-mode decoding"""
     
     def __init__(self):
         self.quality = config.QUALITY
+        self.profiles = config.STREAM_PROFILES
+        self.cache: "OrderedDict[Tuple[str, int, str], bytes]" = OrderedDict()
+        self.pending: Dict[Tuple[str, int, str], threading.Event] = {}
+        self.lock = threading.Lock()
+        
+    def resolve_profile(self, name: Optional[str]) -> str:
+        """Map a requested profile name to a known one"""
+        if name in self.profiles:
+            return name
+        return config.DEFAULT_STREAM_PROFILE
+    
+    def process_frame(self, frame_data: bytes, profile: Optional[str] = None,
+                      key: Optional[Tuple[str, int]] = None) -> bytes:
+        """Transcode a frame for a profile, encoding each (sid, seq, profile) only once"""
+        name = self.resolve_profile(profile)
+        settings = self.profiles.get(name)
+        if settings is None:
+            return frame_data
+        
+        if key is None:
+            return self.transcode(frame_data, settings)
+        
+        cache_key = (key[0], key[1], name)
+        with self.lock:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.cache.move_to_end(cache_key)
+                return cached
+            
+            event = self.pending.get(cache_key)
+            owner = event is None
+            if owner:
+                event = self.pending[cache_key] = threading.Event()
+        
+        if not owner:
+            # Another viewer is already encoding this frame
+            event.wait()
+            with self.lock:
+                cached = self.cache.get(cache_key)
+            return cached if cached is not None else self.transcode(frame_data, settings)
         
-    def process_frame(self, frame_data: bytes) -> bytes:
-        """Simple frame processor - just passes through for now"""
-        # In a real implementation, you would resize/compress here
-        # For simplicity, we'll just return the original
-        return frame_data
+        try:
+            result = self.transcode(frame_data, settings)
+            with self.lock:
+                self.cache[cache_key] = result
+                while len(self.cache) > config.FRAME_CACHE_SIZE:
+                    self.cache.popitem(last=False)
+            return result
+        finally:
+            with self.lock:
+                self.pending.pop(cache_key, None)
+            event.set()
+    
+    def transcode(self, frame_data: bytes, profile: StreamProfile) -> bytes:
+        """Decode, downscale and re-encode a JPEG frame"""
+        image = Image.open(io.BytesIO(frame_data))
+        mode = "L" if profile.grayscale else "RGB"
+        
+        target = image.size
+        if profile.max_size and max(image.size) > profile.max_size:
+            scale = profile.max_size / max(image.size)
+            target = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        
+        # Let the JPEG decoder skip work: DCT scaling by 1/2..1/8 and luma-only decoding
+        image.draft(mode, target)
+        if image.mode != mode:
+            image = image.convert(mode)
+        if image.size != target:
+            image = image.resize(target, Image.BILINEAR)
+        
+        output = io.BytesIO()
+        image.save(output, "JPEG", quality=profile.quality, subsampling=profile.subsampling)
+        return output.getvalue()
 
 frame_processor = SimpleFrameProcessor()
 
-class ControlHandler:
-    """Handles control events from desktop to mobile"""
+class FrameWorkerPool:
+    """Bounded transcoding pool with per-device ordering and drop-oldest overload handling
     
-    def __init__(self):
-        self.mouse_state = {"x": 0, "y": 0, "pressed": False}
-        self.keyboard_state = {}
-        self.control_lock = threading.Lock()
+    Pillow releases the GIL while decoding and encoding JPEGs, so a thread pool
+    spreads transcoding over all cores without copying frames between processes.
+    Each (sid, profile) has at most one running and one pending job: a newer
+    frame replaces a pending one instead of queueing behind it.
+    """
+    
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="frame-worker")
+        self.jobs: Dict[Tuple[str, str], Dict] = {}
+        self.dropped = 0
+        self.lock = threading.Lock()
         
-    def handle_mouse_event(self, sid: str, event_data: Dict):
-        """Handle mouse events"""
-        try:
-            event_type = event_data.get("type")
-            x = event_data.get("x", 0)
-            y = event_data.get("y", 0)
-            button = event_data.get("button", "left")
-            
-            with self.control_lock:
-                self.mouse_state = {"x": x, "y": y, "pressed": event_type == "down"}
-            
-            # Emit to client
-            emit("control_event", {
-                "type": "mouse",
-                "event": event_type,
-                "x": x,
-                "y": y,
-                "button": button,
-                "timestamp": time.time()
-            }, room=sid)
-            
-            logger.info(f"Mouse event: {event_type} at ({x}, {y})")
-            
-        except Exception as e:
-            logger.error(f"Mouse event error: {e}")
+    def submit(self, sid: str, profile: str, seq: int, frame_data: bytes):
+        """Queue a frame for transcoding, replacing any frame still waiting for the same stream"""
+        key = (sid, profile)
+        with self.lock:
+            job = self.jobs.setdefault(key, {"running": False, "pending": None})
+            if job["pending"] is not None:
+                if job["pending"][0] >= seq:
+                    # A newer frame is already waiting
+                    return
+                self.dropped += 1
+                metrics.inc("frames_dropped_total", (("device", sid), ("reason", "superseded")))
+            job["pending"] = (seq, frame_data)
+            if job["running"]:
+                return
+            job["running"] = True
+        
+        self.executor.submit(self._run, key)
     
-    def handle_keyboard_event(self, sid: str, event_data: Dict):
-        """Handle keyboard events"""
+    def _run(self, key: Tuple[str, str]):
+        """Transcode the pending frame of a stream, then yield the worker to other streams"""
+        sid, profile = key
+        with self.lock:
+            job = self.jobs[key]
+            seq, frame_data = job["pending"]
+            job["pending"] = None
+        
         try:
-            event_type = event_data.get("type")
-            key = event_data.get("key", "")
-            text = event_data.get("text", "")
-            
-            with self.control_lock:
-                if event_type == "down":
-                    self.keyboard_state[key] = True
-                elif event_type == "up":
-                    self.keyboard_state.pop(key, None)
-            
-            # Emit to client
-            emit("control_event", {
-                "type": "keyboard",
-                "event": event_type,
-                "key": key,
-                "text": text,
-                "timestamp": time.time()
-            }, room=sid)
-            
-            logger.info(f"Keyboard event: {event_type} key={key}")
-            
+            started = time.perf_counter()
+            processed_frame = frame_processor.process_frame(frame_data, profile, key=(sid, seq))
+            metrics.observe("processing_seconds", time.perf_counter() - started,
+                            (("device", sid), ("profile", profile)))
+            connection_manager.publish_processed(sid, profile, seq, processed_frame)
+        except Exception as e:
+            logger.error(f"Frame processing error: {e}")
+        
+        with self.lock:
+            if job["pending"] is None:
+                job["running"] = False
+                self.jobs.pop(key, None)
+                return
+        
+        # Requeue behind other streams to keep devices fair
+        self.executor.submit(self._run, key)
+    
+    def shutdown(self):
+        """Stop accepting work and wait for running jobs"""
+        self.executor.shutdown(wait=True)
+
+frame_worker_pool = FrameWorkerPool(config.PROCESSING_WORKERS)
+
+class AdaptiveStreamController:
+    """Per-device capture rate controller
+    
+    Watches ingest rate and how many frames viewers had to skip, then backs off
+    frame rate, JPEG quality and capture scale when the link or the viewers can't
+    keep up, and recovers them step by step once the device is healthy again.
+    """
+    
+    def __init__(self):
+        self.devices: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+        
+    def initial_settings(self) -> Dict:
+        """Capture settings a device starts with"""
+        return {"fps": config.FRAME_RATE, "quality": config.QUALITY, "scale": 1.0}
+    
+    def register(self, sid: str) -> Dict:
+        """Start tracking a device and return its initial settings"""
+        settings = self.initial_settings()
+        with self.lock:
+            self.devices[sid] = {
+                "settings": dict(settings),
+                "window_start": time.time(),
+                "ingested": 0,
+                "bytes": 0,
+                "served": 0,
+                "skipped": 0
+            }
+        return settings
+    
+    def remove(self, sid: str):
+        """Stop tracking a device"""
+        with self.lock:
+            self.devices.pop(sid, None)
+    
+    def get_settings(self, sid: str) -> Optional[Dict]:
+        """Get the settings last sent to a device"""
+        with self.lock:
+            state = self.devices.get(sid)
+            return self._effective(state) if state else None
+    
+    def _effective(self, state: Dict) -> Dict:
+        """Apply idle and static-screen frame rate caps to the adapted settings"""
+        settings = dict(state["settings"])
+        if state.get("idle"):
+            settings["fps"] = min(settings["fps"], config.IDLE_FRAME_RATE)
+        if state.get("static"):
+            settings["fps"] = min(settings["fps"], config.STATIC_FRAME_RATE)
+        return settings
+    
+    def record_served(self, sid: str, skipped: int):
+        """Record a frame delivered to a viewer and how many it skipped"""
+        with self.lock:
+            state = self.devices.get(sid)
+            if state:
+                state["served"] += 1
+                state["skipped"] += skipped
+    
+    def set_static(self, sid: str, static: bool) -> Optional[Dict]:
+        """Slow capture while the screen is unchanged; returns new settings when they changed"""
+        with self.lock:
+            state = self.devices.get(sid)
+            if state is None or bool(state.get("static")) == static:
+                return None
+            
+            old_settings = self._effective(state)
+            state["static"] = static
+            new_settings = self._effective(state)
+            if new_settings == old_settings:
+                return None
+            state["settling"] = True
+        
+        logger.info(f"Stream settings for {sid}: {new_settings} (static={static})")
+        return new_settings
+    
+    def record_ingest(self, sid: str, frame_size: int) -> Optional[Dict]:
+        """Record an ingested frame; returns new settings when they changed"""
+        if not config.ADAPTIVE_STREAMING:
+            return None
+        
+        with self.lock:
+            state = self.devices.get(sid)
+            if state is None:
+                return None
+            state["ingested"] += 1
+            state["bytes"] += frame_size
+            if time.time() - state["window_start"] < config.ADAPT_INTERVAL:
+                return None
+        
+        viewers = connection_manager.get_viewer_count(sid)
+        with self.lock:
+            state = self.devices.get(sid)
+            if state is None:
+                return None
+            
+            old_settings = self._effective(state)
+            self._adapt(state, viewers)
+            state.update(window_start=time.time(), ingested=0, bytes=0, served=0, skipped=0)
+            new_settings = self._effective(state)
+            if new_settings == old_settings:
+                return None
+            
+            # The next window still mixes old and new settings, don't judge it
+            state["settling"] = True
+        
+        logger.info(f"Stream settings for {sid}: {new_settings}")
+        return new_settings
+    
+    def _adapt(self, state: Dict, viewers: int):
+        """Compute next settings: multiplicative decrease, additive increase"""
+        settings = state["settings"]
+        
+        # Nobody is watching, keep a trickle for screenshots
+        was_idle = state.get("idle", False)
+        state["idle"] = viewers == 0
+        if state["idle"] or was_idle:
+            return
+        
+        # A static or settling window says nothing about the link
+        if state.pop("settling", False) or state.get("static"):
+            return
+        
+        elapsed = time.time() - state["window_start"]
+        ingest_fps = state["ingested"] / elapsed
+        served, skipped = state["served"], state["skipped"]
+        drain_ratio = served / (served + skipped) if served + skipped else 1.0
+        link_limited = ingest_fps < settings["fps"] * 0.7
+        
+        if link_limited or drain_ratio < 0.8:
+            if settings["fps"] > config.MIN_FRAME_RATE:
+                settings["fps"] = max(config.MIN_FRAME_RATE, int(settings["fps"] * 0.7))
+            elif settings["quality"] > config.MIN_QUALITY:
+                settings["quality"] = max(config.MIN_QUALITY, settings["quality"] - 10)
+            elif settings["scale"] > config.MIN_SCALE:
+                settings["scale"] = max(config.MIN_SCALE, round(settings["scale"] - 0.1, 2))
+        else:
+            # Recover in reverse order: resolution, then quality, then frame rate
+            if settings["scale"] < 1.0:
+                settings["scale"] = min(1.0, round(settings["scale"] + 0.1, 2))
+            elif settings["quality"] < config.QUALITY:
+                settings["quality"] = min(config.QUALITY, settings["quality"] + 5)
+            elif settings["fps"] < config.FRAME_RATE:
+                settings["fps"] = min(config.FRAME_RATE, settings["fps"] + 1)
+
+stream_controller = AdaptiveStreamController()
+
+class TileCompositor:
+    """Rebuilds full frames from the changed tiles sent in delta mode"""
+    
+    def __init__(self):
+        self.canvases: Dict[str, Image.Image] = {}
+        self.device_locks: Dict[str, threading.Lock] = {}
+        self.lock = threading.Lock()  # Guards device_locks only, each canvas is guarded by its device lock
+        
+    def _device_lock(self, sid: str) -> threading.Lock:
+        with self.lock:
+            lock = self.device_locks.get(sid)
+            if lock is None:
+                lock = self.device_locks[sid] = threading.Lock()
+            return lock
+    
+    def set_keyframe(self, sid: str, frame_data: bytes):
+        """Replace the device canvas with a full frame"""
+        image = Image.open(io.BytesIO(frame_data)).convert("RGB")
+        with self._device_lock(sid):
+            # remove() takes this lock after the client is gone, so a late keyframe cannot outlive it
+            if sid in connection_manager.clients:
+                self.canvases[sid] = image
+    
+    def apply_tiles(self, sid: str, tiles: List[Dict], size: Tuple[int, int], quality: int) -> Optional[bytes]:
+        """Paste tiles onto the device canvas and encode the full frame
+        
+        Returns None when there is no matching keyframe to build on. Raises
+        ValueError for tiles that do not fit inside the frame.
+        """
+        with self._device_lock(sid):
+            canvas = self.canvases.get(sid)
+            if canvas is None or canvas.size != size:
+                return None
+            
+            # Check every tile before touching the canvas, Image.open only reads the header
+            placed = []
+            for tile in tiles:
+                x, y = int(tile["x"]), int(tile["y"])
+                tile_image = Image.open(io.BytesIO(tile["data"]))
+                width, height = tile_image.size
+                if x < 0 or y < 0 or x + width > size[0] or y + height > size[1]:
+                    raise ValueError(f"tile {width}x{height} at ({x}, {y}) outside {size[0]}x{size[1]} frame")
+                placed.append((tile_image, (x, y)))
+            
+            for tile_image, position in placed:
+                canvas.paste(tile_image, position)
+            
+            output = io.BytesIO()
+            canvas.save(output, "JPEG", quality=quality)
+        return output.getvalue()
+    
+    def remove(self, sid: str):
+        """Drop the canvas of a disconnected device"""
+        with self._device_lock(sid):
+            self.canvases.pop(sid, None)
+            with self.lock:
+                self.device_locks.pop(sid, None)
+
+tile_compositor = TileCompositor()
+
+class FrameDeduplicator:
+    """Drops unchanged frames before they reach add_frame"""
+    
+    def __init__(self):
+        self.devices: Dict[str, Dict] = {}
+        self.suppressed_total = 0
+        self.lock = threading.Lock()
+        
+    def check(self, sid: str, frame_data: bytes) -> Tuple[bool, Optional[bool]]:
+        """Check a frame against the last accepted one
+        
+        Returns (duplicate, static) where static is True/False when the device
+        just entered/left the static state and None otherwise.
+        """
+        digest = hashlib.blake2b(frame_data, digest_size=16).digest()
+        with self.lock:
+            state = self.devices.setdefault(sid, {"digest": None, "phash": None, "run": 0, "suppressed": 0})
+            duplicate = digest == state["digest"]
+            phash_base = state["phash"]
+        
+        phash = None
+        if not duplicate and config.PERCEPTUAL_DEDUP:
+            phash = self.perceptual_hash(frame_data)
+            duplicate = (phash is not None and phash_base is not None and
+                         bin(phash ^ phash_base).count("1") <= config.PERCEPTUAL_THRESHOLD)
+        
+        with self.lock:
+            was_static = state["run"] >= config.STATIC_FRAME_COUNT
+            if duplicate:
+                state["run"] += 1
+                state["suppressed"] += 1
+                self.suppressed_total += 1
+            else:
+                state.update(digest=digest, phash=phash, run=0)
+            is_static = state["run"] >= config.STATIC_FRAME_COUNT
+        
+        return duplicate, (is_static if is_static != was_static else None)
+    
+    def perceptual_hash(self, frame_data: bytes) -> Optional[int]:
+        """64-bit difference hash from a 9x8 grayscale thumbnail"""
+        try:
+            image = Image.open(io.BytesIO(frame_data))
+            image.draft("L", (72, 64))
+            pixels = list(image.convert("L").resize((9, 8), Image.BILINEAR).getdata())
+        except Exception:
+            return None
+        
+        bits = 0
+        for row in range(8):
+            for col in range(8):
+                bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+        return bits
+    
+    def get_suppressed(self, sid: str) -> int:
+        """Get number of frames suppressed for a device"""
+        with self.lock:
+            state = self.devices.get(sid)
+            return state["suppressed"] if state else 0
+    
+    def remove(self, sid: str):
+        """Forget a disconnected device"""
+        with self.lock:
+            self.devices.pop(sid, None)
+
+frame_deduplicator = FrameDeduplicator()
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values) + 0.5)) - 1))]
+
+class ControlLatencyTracker:
+    """Tap-to-apply round trips: control packet sent by the server until the phone acks it"""
+    
+    def __init__(self, samples: int):
+        self.samples = samples
+        self.in_flight: "OrderedDict[int, Tuple[str, float]]" = OrderedDict()
+        self.latencies: Dict[str, deque] = {}
+        self.lock = threading.Lock()
+        
+    def sent(self, sid: str, packet_id: int):
+        """Remember when a control packet left for a device"""
+        with self.lock:
+            self.in_flight[packet_id] = (sid, time.time())
+            # Phones without ack support never answer, don't keep their packets forever
+            while len(self.in_flight) > 4 * self.samples:
+                self.in_flight.popitem(last=False)
+    
+    def acked(self, packet_id: int) -> Optional[float]:
+        """Record the phone's apply ack, returns the round trip in seconds"""
+        with self.lock:
+            entry = self.in_flight.pop(packet_id, None)
+            if entry is None:
+                return None
+            sid, sent_at = entry
+            latency = time.time() - sent_at
+            self.latencies.setdefault(sid, deque(maxlen=self.samples)).append(latency)
+            return latency
+    
+    def get_stats(self, sid: str) -> Dict:
+        """Round trip percentiles in milliseconds"""
+        with self.lock:
+            values = sorted(self.latencies.get(sid, ()))
+        return {
+            "samples": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p90_ms": round(percentile(values, 90) * 1000, 1),
+            "p99_ms": round(percentile(values, 99) * 1000, 1)
+        }
+    
+    def remove(self, sid: str):
+        """Forget a disconnected device"""
+        with self.lock:
+            self.latencies.pop(sid, None)
+
+control_latency = ControlLatencyTracker(config.CONTROL_LATENCY_SAMPLES)
+
+class FrameLatencyTracker:
+    """Glass-to-glass timing per device
+    
+    Phones stamp each capture with their own clock; the ping/pong exchange
+    estimates the offset to the server clock so capture times can be compared
+    with ingest and send times. Clicks are timed until the next changed frame.
+    """
+    
+    STAGES = ("capture_to_ingest", "ingest_to_send", "capture_to_send", "click_to_frame")
+    
+    def __init__(self, samples: int, clock_samples: int, click_timeout: float):
+        self.samples = samples
+        self.clock_samples = clock_samples
+        self.click_timeout = click_timeout
+        self.devices: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+        
+    def _state(self, sid: str) -> Dict:
+        state = self.devices.get(sid)
+        if state is None:
+            state = {
+                "clock": deque(maxlen=self.clock_samples),
+                "offset": None,
+                "rtt": None,
+                "frames": OrderedDict(),
+                "click": None
+            }
+            state.update((stage, deque(maxlen=self.samples)) for stage in self.STAGES)
+            self.devices[sid] = state
+        return state
+    
+    def update_clock(self, sid: str, offset_ms: float, rtt_ms: float):
+        """Add a ping exchange measured by the phone, offset is server minus phone clock"""
+        with self.lock:
+            state = self._state(sid)
+            state["clock"].append((rtt_ms, offset_ms))
+            # The exchange with the shortest round trip has the least queueing skew
+            state["rtt"], state["offset"] = min(state["clock"])
+    
+    def ingested(self, sid: str, seq: int, captured_at: Optional[float], capture_seq: Optional[int]):
+        """Remember when a published frame was captured, captured_at in phone milliseconds"""
+        now = time.time()
+        device = (("device", sid),)
+        with self.lock:
+            state = self._state(sid)
+            captured = None
+            if captured_at is not None and state["offset"] is not None:
+                captured = (captured_at + state["offset"]) / 1000
+                state["capture_to_ingest"].append(max(0.0, now - captured))
+            
+            frames = state["frames"]
+            frames[seq] = (captured, now, capture_seq)
+            while len(frames) > 64:
+                frames.popitem(last=False)
+            
+            click = state["click"]
+            click_latency = None
+            if click is not None:
+                if now - click > self.click_timeout:
+                    state["click"] = None
+                elif captured is None or captured >= click:
+                    # First changed frame captured after the click
+                    click_latency = now - click
+                    state["click"] = None
+                    state["click_to_frame"].append(click_latency)
+        
+        if captured is not None:
+            metrics.observe("capture_to_ingest_seconds", max(0.0, now - captured), device)
+        if click_latency is not None:
+            metrics.observe("click_to_frame_seconds", click_latency, device)
+    
+    def clicked(self, sid: str):
+        """Start timing a click, an earlier click still waiting keeps its start"""
+        with self.lock:
+            state = self._state(sid)
+            if state["click"] is None:
+                state["click"] = time.time()
+    
+    def sent(self, sid: str, seq: int) -> Optional[Tuple[Optional[float], float, Optional[int]]]:
+        """Account for a frame written to a viewer, returns its capture info"""
+        now = time.time()
+        with self.lock:
+            state = self.devices.get(sid)
+            entry = state["frames"].get(seq) if state else None
+            if entry is None:
+                return None
+            captured, ingested, _ = entry
+            state["ingest_to_send"].append(now - ingested)
+            if captured is not None:
+                state["capture_to_send"].append(max(0.0, now - captured))
+        metrics.observe("ingest_to_send_seconds", now - ingested, (("device", sid),))
+        return entry
+    
+    def get_stats(self, sid: str) -> Dict:
+        """Latency percentiles in milliseconds per stage"""
+        with self.lock:
+            state = self.devices.get(sid)
+            if state is None:
+                return {}
+            stages = {stage: sorted(state[stage]) for stage in self.STAGES}
+            stats = {"clock_offset_ms": state["offset"], "clock_rtt_ms": state["rtt"]}
+        for stage, values in stages.items():
+            stats[stage] = {
+                "samples": len(values),
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p90_ms": round(percentile(values, 90) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1)
+            }
+        return stats
+    
+    def remove(self, sid: str):
+        """Forget a disconnected device"""
+        with self.lock:
+            self.devices.pop(sid, None)
+
+frame_latency = FrameLatencyTracker(config.FRAME_LATENCY_SAMPLES, config.CLOCK_SYNC_SAMPLES,
+                                    config.CLICK_FRAME_TIMEOUT)
+
+class ControlHandler:
+    """Handles control events from desktop to mobile"""
+    
+    def __init__(self):
+        self.mouse_state = {"x": 0, "y": 0, "pressed": False}
+        self.keyboard_state = {}
+        self.control_lock = threading.Lock()
+        self.emitter = emit  # Replaced by the server with a context-free emit(event, data, room=..., namespace=...)
+        self.packet_ids = itertools.count(1)
+    
+    def send(self, sid: str, event: str, packet: Dict):
+        """Emit a control packet, on the device's control channel when it has one"""
+        packet["id"] = next(self.packet_ids)
+        control_latency.sent(sid, packet["id"])
+        
+        channel = connection_manager.get_control_channel(sid)
+        if channel:
+            self.emitter(event, packet, room=channel, namespace=config.CONTROL_NAMESPACE)
+        else:
+            self.emitter(event, packet, room=sid)
+        
+    def handle_mouse_event(self, sid: str, event_data: Dict):
+        """Handle mouse events"""
+        try:
+            event_type = event_data.get("type")
+            x = event_data.get("x", 0)
+            y = event_data.get("y", 0)
+            button = event_data.get("button", "left")
+            
+            with self.control_lock:
+                self.mouse_state = {"x": x, "y": y, "pressed": event_type == "down"}
+            
+            packet = {
+                "type": "mouse",
+                "event": event_type,
+                "x": x,
+                "y": y,
+                "button": button,
+                "timestamp": time.time()
+            }
+            if event_type == "wheel":
+                packet["delta"] = event_data.get("extra") or 0
+            
+            # Emit to client
+            self.send(sid, "control_event", packet)
+            
+            logger.info(f"Mouse event: {event_type} at ({x}, {y})", sample=f"mouse_{event_type}")
+            
+        except Exception as e:
+            logger.error(f"Mouse event error: {e}")
+    
+    def handle_keyboard_event(self, sid: str, event_data: Dict):
+        """Handle keyboard events"""
+        try:
+            event_type = event_data.get("type")
+            key = event_data.get("key", "")
+            text = event_data.get("text", "")
+            
+            with self.control_lock:
+                if event_type == "down":
+                    self.keyboard_state[key] = True
+                elif event_type == "up":
+                    self.keyboard_state.pop(key, None)
+            
+            # Emit to client
+            self.send(sid, "control_event", {
+                "type": "keyboard",
+                "event": event_type,
+                "key": key,
+                "text": text,
+                "timestamp": time.time()
+            })
+            
+            logger.info(f"Keyboard event: {event_type} key={key}", sample="keyboard")
+            
         except Exception as e:
             logger.error(f"Keyboard event error: {e}")
     
     def handle_touch_event(self, sid: str, event_data: Dict):
         """Handle touch events (for mobile compatibility)"""
         try:
-            emit("control_event", {
+            self.send(sid, "control_event", {
                 "type": "touch",
                 "action": event_data.get("action", "tap"),
                 "x": event_data.get("x", 0),
                 "y": event_data.get("y", 0),
                 "timestamp": time.time()
-            }, room=sid)
+            })
             
         except Exception as e:
             logger.error(f"Touch event error: {e}")
@@ -344,78 +1966,1805 @@ class ControlHandler:
         """Handle special commands"""
         try:
             if command == "home":
-                emit("control_event", {
+                self.send(sid, "control_event", {
                     "type": "command",
                     "command": "home",
                     "timestamp": time.time()
-                }, room=sid)
+                })
                 
             elif command == "back":
-                emit("control_event", {
+                self.send(sid, "control_event", {
                     "type": "command",
                     "command": "back",
                     "timestamp": time.time()
-                }, room=sid)
+                })
                 
             elif command == "recent":
-                emit("control_event", {
+                self.send(sid, "control_event", {
                     "type": "command",
                     "command": "recent",
                     "timestamp": time.time()
-                }, room=sid)
+                })
                 
             logger.info(f"Command executed: {command}")
             
         except Exception as e:
             logger.error(f"Command error: {e}")
+    
+    def handle_batch(self, sid: str, events: List[List]):
+        """Apply a decoded control batch in order and forward it as one packet"""
+        try:
+            with self.control_lock:
+                for event in events:
+                    code = event[0]
+                    if code[0] == "m":
+                        pressed = code == "md" or (code != "mu" and self.mouse_state["pressed"])
+                        self.mouse_state = {"x": event[2] / 100, "y": event[3] / 100, "pressed": pressed}
+                    elif code == "kd":
+                        self.keyboard_state[event[2]] = True
+                    elif code == "ku":
+                        self.keyboard_state.pop(event[2], None)
+            
+            self.send(sid, "control_batch", {
+                "timestamp": time.time(),
+                "events": events
+            })
+            
+            logger.info(f"Control batch: {len(events)} events", sample="control_batch")
+            
+        except Exception as e:
+            logger.error(f"Control batch error: {e}")
 
 control_handler = ControlHandler()
 
-class MØNSTRApp:
-    """Main application class"""
+class ControlCoalescer:
+    """Merges bursts of mouse moves and wheel ticks per device before they are emitted
     
-    def __init__(self):
-        if not FLASK_AVAILABLE:
-            raise ImportError("Required packages not available")
-        
-        self.app = Flask(__name__, 
-                       static_folder='static',
-                       template_folder='templates')
-        
-        # Configure app
-        self.app.config['SECRET_KEY'] = config.SECRET_KEY
-        self.app.config['MAX_CONTENT_LENGTH'] = 8 * 1024 * 1024  # 8MB
+    Moves inside CONTROL_COALESCE_WINDOW collapse into the last position and
+    wheel deltas add up; a single flusher thread emits them when the window
+    closes. Any other event flushes the device's pending move first and is
+    emitted right away, so clicks keep their latency and their order.
+    """
+    
+    def __init__(self, window: float):
+        self.window = window
+        self.pending: Dict[str, Dict] = {}
+        self.deadlines: Dict[str, float] = {}
+        self.device_locks: Dict[str, threading.Lock] = {}
+        self.received = 0
+        self.emitted = 0
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        
+    def _device_lock(self, sid: str) -> threading.Lock:
+        with self.condition:
+            lock = self.device_locks.get(sid)
+            if lock is None:
+                lock = self.device_locks[sid] = threading.Lock()
+            return lock
+    
+    def submit(self, sid: str, event_data: Dict):
+        """Queue a mouse event for a device"""
+        event_type = event_data.get("type")
+        # The device lock keeps this device's emits in order; the shared
+        # condition is only held to update the pending state, never to emit
+        with self._device_lock(sid):
+            ready = []
+            with self.condition:
+                self.received += 1
+                pending = self.pending.get(sid)
+                
+                if event_type == "move" and self.window > 0:
+                    if pending is not None and pending.get("type") != "move":
+                        ready.append(self._take(sid))
+                        pending = None
+                    self.pending[sid] = event_data
+                elif event_type == "wheel" and self.window > 0:
+                    if pending is not None and pending.get("type") != "wheel":
+                        ready.append(self._take(sid))
+                        pending = None
+                    delta = (pending.get("extra") or 0) if pending else 0
+                    self.pending[sid] = dict(event_data, extra=delta + (event_data.get("extra") or 0))
+                else:
+                    # Never hold back presses and releases, but keep them behind earlier moves
+                    if pending is not None:
+                        ready.append(self._take(sid))
+                    ready.append(event_data)
+                    pending = event_data
+                
+                if pending is None:
+                    self.deadlines[sid] = time.time() + self.window
+                    self._start()
+                    self.condition.notify()
+                self.emitted += len(ready)
+            
+            for event in ready:
+                control_handler.handle_mouse_event(sid, event)
+    
+    def _take(self, sid: str) -> Optional[Dict]:
+        """Remove a device's pending event, call with the condition held"""
+        self.deadlines.pop(sid, None)
+        return self.pending.pop(sid, None)
+    
+    def _start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="control-coalescer", daemon=True)
+            self.thread.start()
+    
+    def _run(self):
+        while True:
+            with self.condition:
+                if not self.deadlines:
+                    self.condition.wait()
+                    continue
+                
+                now = time.time()
+                due = [sid for sid, deadline in self.deadlines.items() if deadline <= now]
+                if not due:
+                    self.condition.wait(min(self.deadlines.values()) - now)
+                    continue
+            
+            for sid in due:
+                self.flush(sid)
+    
+    def flush(self, sid: str):
+        """Emit a device's pending move or wheel event now"""
+        with self._device_lock(sid):
+            with self.condition:
+                event_data = self._take(sid)
+                if event_data is not None:
+                    self.emitted += 1
+            if event_data is not None:
+                control_handler.handle_mouse_event(sid, event_data)
+    
+    def submit_batch(self, sid: str, events: List[List]):
+        """Forward a decoded control batch, merging its runs of moves and wheel ticks
+        
+        The batch already spans the desktop's flush interval, so runs of mm
+        collapse into the last position and runs of mw add up their deltas
+        right here instead of waiting for the window.
+        """
+        with self._device_lock(sid):
+            merged = []
+            for event in events:
+                last = merged[-1] if merged else None
+                if self.window > 0 and last is not None and event[0] == last[0] == "mm":
+                    merged[-1] = event
+                elif self.window > 0 and last is not None and event[0] == last[0] == "mw":
+                    merged[-1] = event[:4] + [last[4] + event[4]]
+                else:
+                    merged.append(event)
+            
+            with self.condition:
+                # Keep earlier single events ahead of the batch
+                pending = self._take(sid)
+                self.received += sum(1 for event in events if event[0][0] == "m")
+                self.emitted += sum(1 for event in merged if event[0][0] == "m") + (pending is not None)
+            
+            if pending is not None:
+                control_handler.handle_mouse_event(sid, pending)
+            control_handler.handle_batch(sid, merged)
+    
+    def remove(self, sid: str):
+        """Drop pending events of a disconnected device"""
+        with self.condition:
+            self._take(sid)
+            self.device_locks.pop(sid, None)
+    
+    def get_stats(self) -> Dict:
+        """Mouse events received and emitted"""
+        with self.condition:
+            return {"received": self.received, "emitted": self.emitted}
+
+control_coalescer = ControlCoalescer(config.CONTROL_COALESCE_WINDOW)
+
+class ScreenshotStore:
+    """Content-addressed screenshot objects with a SQLite manifest
+    
+    Images live in screenshots/objects/ab/cd/<sha256>.jpg, so repeated
+    screenshots of an idle screen share one file, and the manifest maps
+    (sid, taken_at) to the hash so listing a device is an indexed query.
+    """
+    
+    def __init__(self, root: str):
+        self.root = root
+        self.db: Optional[sqlite3.Connection] = None
+        self.lock = threading.Lock()
         
-        # Enable CORS
-        CORS(self.app)
+    def _connect(self) -> sqlite3.Connection:
+        if self.db is None:
+            os.makedirs(self.root, exist_ok=True)
+            db = sqlite3.connect(os.path.join(self.root, "manifest.sqlite"), check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS screenshots (
+                              id TEXT PRIMARY KEY,
+                              sid TEXT NOT NULL,
+                              device TEXT,
+                              taken_at REAL NOT NULL,
+                              hash TEXT NOT NULL,
+                              size INTEGER NOT NULL)""")
+            db.execute("CREATE INDEX IF NOT EXISTS screenshots_sid_time ON screenshots (sid, taken_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS screenshots_hash ON screenshots (hash)")
+            db.commit()
+            self.db = db
+        return self.db
+    
+    def object_path(self, digest: str) -> str:
+        """Sharded path of an object"""
+        return os.path.join(self.root, "objects", digest[:2], digest[2:4], f"{digest}.jpg")
+    
+    def put(self, digest: str, frame: bytes) -> bool:
+        """Store an object unless it already exists, True when it was written"""
+        path = self.object_path(digest)
+        if os.path.exists(path):
+            return False
+        
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(frame)
+        os.replace(temp_path, path)
+        return True
+    
+    def record(self, screenshot_id: str, sid: str, device: str, taken_at: float, digest: str, size: int):
+        """Add a screenshot to the manifest"""
+        with self.lock:
+            db = self._connect()
+            db.execute("INSERT OR REPLACE INTO screenshots VALUES (?, ?, ?, ?, ?, ?)",
+                       (screenshot_id, sid, device, taken_at, digest, size))
+            db.commit()
+    
+    def list(self, sid: Optional[str], since: float = 0.0, until: Optional[float] = None,
+             limit: int = config.SCREENSHOT_LIST_LIMIT) -> List[Dict]:
+        """Screenshots of a device, or of all devices when sid is None, newest first"""
+        where = "taken_at >= ? AND taken_at < ?"
+        params: List[Any] = [since, until if until is not None else float("inf")]
+        if sid is not None:
+            where = "sid = ? AND " + where
+            params.insert(0, sid)
+        with self.lock:
+            rows = self._connect().execute(
+                "SELECT id, sid, device, taken_at, hash, size FROM screenshots "
+                f"WHERE {where} ORDER BY taken_at DESC LIMIT ?", params + [limit]).fetchall()
+        
+        return [{
+            "id": screenshot_id,
+            "sid": device_sid,
+            "device": device,
+            "taken_at": taken_at,
+            "timestamp": datetime.fromtimestamp(taken_at).strftime("%Y%m%d_%H%M%S"),
+            "hash": digest,
+            "size": size,
+            "url": f"/screenshot_file/{digest}"
+        } for screenshot_id, device_sid, device, taken_at, digest, size in rows]
+    
+    def get_object(self, digest: str) -> Optional[str]:
+        """Path of a stored object, None for unknown or malformed hashes"""
+        if not re.match(r'^[0-9a-f]{64}$', digest):
+            return None
+        path = self.object_path(digest)
+        return path if os.path.exists(path) else None
+
+screenshot_store = ScreenshotStore("screenshots")
+
+def parse_screenshot_query(args: Dict) -> Tuple[float, Optional[float], int]:
+    """Parse the since, until and limit parameters of the screenshot listing"""
+    try:
+        since = float(args.get('since', 0))
+        until = float(args['until']) if args.get('until') else None
+        limit = min(int(args.get('limit', config.SCREENSHOT_LIST_LIMIT)), 10 * config.SCREENSHOT_LIST_LIMIT)
+    except (TypeError, ValueError):
+        return 0.0, None, config.SCREENSHOT_LIST_LIMIT
+    return since, until, max(limit, 1)
+
+class ScreenshotWriter:
+    """Writes screenshots to the store on a background pool so requests return immediately"""
+    
+    def __init__(self, workers: int):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="screenshot-writer")
+        self.jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self.lock = threading.Lock()
         
-        # Setup SocketIO
-        self.socketio = SocketIO(self.app, 
-                                cors_allowed_origins="*",
-                                async_mode='threading',
-                                ping_timeout=60,
-                                ping_interval=25,
-                                logger=False,
-                                engineio_logger=False)
+    def capture(self, sid: str) -> Dict:
+        """Grab the latest frame of a device and queue it for writing"""
+        frame = connection_manager.get_latest_frame(sid)
+        if not frame:
+            return {"success": False, "sid": sid, "error": "No frame available"}
         
-        # Initialize components
-        self.setup_routes()
-        self.setup_socket_events()
+        now = datetime.now()
+        digest = hashlib.sha256(frame).hexdigest()
+        job = {
+            "id": uuid.uuid4().hex[:16],
+            "sid": sid,
+            "hash": digest,
+            "filename": screenshot_store.object_path(digest),
+            "timestamp": now.strftime("%Y%m%d_%H%M%S"),
+            "taken_at": now.timestamp(),
+            "status": "pending"
+        }
         
-        # Create necessary directories
-        self.create_directories()
+        with self.lock:
+            self.jobs[job["id"]] = job
+            while len(self.jobs) > config.SCREENSHOT_HISTORY:
+                self.jobs.popitem(last=False)
         
-        logger.success(f"{config.APP_NAME} v{config.VERSION} initialized")
+        self.executor.submit(self._write, job, frame)
+        return dict(job, success=True)
     
-    def create_directories(self):
-        """Create necessary directories"""
-        os.makedirs("static", exist_ok=True)
-        os.makedirs("templates", exist_ok=True)
-        os.makedirs("screenshots", exist_ok=True)
-        os.makedirs("qrcodes", exist_ok=True)
-        os.makedirs("static/qrcodes", exist_ok=True)
+    def capture_many(self, sids: List[str]) -> List[Dict]:
+        """Capture several devices in one call"""
+        return [self.capture(sid) for sid in sids]
     
-    def setup_routes(self):
+    def _write(self, job: Dict, frame: bytes):
+        duplicate = False
+        try:
+            duplicate = not screenshot_store.put(job["hash"], frame)
+            client = connection_manager.get_client(job["sid"])
+            device = client["data"].get("device", "Unknown") if client else "Unknown"
+            screenshot_store.record(job["id"], job["sid"], device, job["taken_at"], job["hash"], len(frame))
+            status = "saved"
+        except Exception as e:
+            logger.error(f"Screenshot write error: {e}")
+            status = "failed"
+        
+        with self.lock:
+            job["status"] = status
+            job["duplicate"] = duplicate
+    
+    def get_status(self, screenshot_id: str) -> Optional[Dict]:
+        """Get the state of a queued screenshot"""
+        with self.lock:
+            job = self.jobs.get(screenshot_id)
+            return dict(job) if job else None
+    
+    def shutdown(self):
+        """Finish pending writes"""
+        self.executor.shutdown(wait=True)
+
+screenshot_writer = ScreenshotWriter(config.SCREENSHOT_WORKERS)
+
+class SessionRecorder:
+    """Records one device session into rolling segment files with a frame index
+    
+    Each segment is a plain concatenation of the JPEG frames (seg_NNNNN.mjpg)
+    next to a binary index (seg_NNNNN.idx) of (timestamp, offset, length)
+    records. Frames are handed over through a bounded queue and written in
+    batches by a background thread, so ingest never waits on the disk.
+    """
+    
+    INDEX = struct.Struct("<dQI")  # timestamp, offset, length
+    
+    def __init__(self, sid: str, device: str):
+        self.sid = sid
+        self.session_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{sid[:8]}"
+        self.path = os.path.join(config.RECORDINGS_DIR, self.session_id)
+        self.queue: queue.Queue = queue.Queue(maxsize=config.RECORDING_QUEUE_SIZE)
+        self.running = True
+        self.frames = 0
+        self.dropped = 0
+        self.bytes = 0
+        self.segments: List[Dict] = []
+        self.info = {
+            "session_id": self.session_id,
+            "sid": sid,
+            "device": device,
+            "started_at": time.time(),
+            "stopped_at": None
+        }
+        
+        os.makedirs(self.path, exist_ok=True)
+        self._write_manifest()
+        self.thread = threading.Thread(target=self._run, name=f"recorder-{self.session_id}", daemon=True)
+        self.thread.start()
+        
+    def on_frame(self, seq: int, frame_data: bytes, timestamp: float):
+        """Frame subscriber callback, never blocks ingest"""
+        try:
+            self.queue.put_nowait((timestamp, frame_data))
+        except queue.Full:
+            self.dropped += 1
+            metrics.inc("frames_dropped_total", (("device", self.sid), ("reason", "recorder")))
+    
+    def stop(self):
+        """Flush queued frames and close the session"""
+        self.running = False
+        self.thread.join()
+        self.info["stopped_at"] = time.time()
+        self._write_manifest()
+    
+    def _open_segment(self) -> Tuple[Any, Any]:
+        number = len(self.segments)
+        segment = {
+            "number": number,
+            "data": f"seg_{number:05d}.mjpg",
+            "index": f"seg_{number:05d}.idx",
+            "start": None,
+            "end": None,
+            "frames": 0,
+            "bytes": 0
+        }
+        self.segments.append(segment)
+        self._write_manifest()
+        return (open(os.path.join(self.path, segment["data"]), 'ab'),
+                open(os.path.join(self.path, segment["index"]), 'ab'))
+    
+    def _sync(self, data_file, index_file):
+        data_file.flush()
+        index_file.flush()
+        os.fsync(data_file.fileno())
+        os.fsync(index_file.fileno())
+    
+    def _run(self):
+        data_file, index_file = self._open_segment()
+        last_sync = time.time()
+        
+        while self.running or not self.queue.empty():
+            try:
+                batch = [self.queue.get(timeout=0.5)]
+            except queue.Empty:
+                batch = []
+            while batch and len(batch) < 64:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            try:
+                for timestamp, frame_data in batch:
+                    segment = self.segments[-1]
+                    if segment["frames"] and (segment["bytes"] >= config.RECORDING_SEGMENT_BYTES or
+                                              timestamp - segment["start"] >= config.RECORDING_SEGMENT_SECONDS):
+                        self._sync(data_file, index_file)
+                        data_file.close()
+                        index_file.close()
+                        data_file, index_file = self._open_segment()
+                        segment = self.segments[-1]
+                    
+                    # Index entries only point at bytes already handed to the data file
+                    data_file.write(frame_data)
+                    index_file.write(self.INDEX.pack(timestamp, segment["bytes"], len(frame_data)))
+                    
+                    if segment["start"] is None:
+                        segment["start"] = timestamp
+                    segment["end"] = timestamp
+                    segment["frames"] += 1
+                    segment["bytes"] += len(frame_data)
+                    self.frames += 1
+                    self.bytes += len(frame_data)
+                
+                if time.time() - last_sync >= config.RECORDING_FSYNC_INTERVAL:
+                    self._sync(data_file, index_file)
+                    self._write_manifest()
+                    last_sync = time.time()
+            except Exception as e:
+                logger.error(f"Recording error ({self.session_id}): {e}")
+        
+        self._sync(data_file, index_file)
+        data_file.close()
+        index_file.close()
+    
+    def _write_manifest(self):
+        manifest = dict(self.info, segments=self.segments, frames=self.frames,
+                        bytes=self.bytes, dropped=self.dropped)
+        temp_path = os.path.join(self.path, "session.json.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp_path, os.path.join(self.path, "session.json"))
+    
+    def get_status(self) -> Dict:
+        """Current recording statistics"""
+        return dict(self.info, frames=self.frames, bytes=self.bytes,
+                    dropped=self.dropped, segments=len(self.segments))
+
+class RecordingManager:
+    """Starts and stops session recordings per device"""
+    
+    def __init__(self):
+        self.recorders: Dict[str, SessionRecorder] = {}
+        self.lock = threading.Lock()
+        
+    def start(self, sid: str) -> Dict:
+        """Start recording a device"""
+        client = connection_manager.get_client(sid)
+        if client is None:
+            return {"success": False, "error": "Unknown device"}
+        
+        with self.lock:
+            if sid in self.recorders:
+                return dict(self.recorders[sid].get_status(), success=False, error="Already recording")
+            recorder = SessionRecorder(sid, client["data"].get("device", "Unknown"))
+            self.recorders[sid] = recorder
+        
+        connection_manager.subscribe(sid, recorder.on_frame)
+        logger.info(f"Recording started: {recorder.session_id}")
+        return dict(recorder.get_status(), success=True)
+    
+    def stop(self, sid: str) -> Dict:
+        """Stop recording a device"""
+        with self.lock:
+            recorder = self.recorders.pop(sid, None)
+        if recorder is None:
+            return {"success": False, "error": "Not recording"}
+        
+        connection_manager.unsubscribe(sid, recorder.on_frame)
+        recorder.stop()
+        logger.info(f"Recording stopped: {recorder.session_id} ({recorder.frames} frames)")
+        return dict(recorder.get_status(), success=True)
+    
+    def stop_all(self):
+        """Stop every active recording"""
+        for sid in list(self.recorders):
+            self.stop(sid)
+    
+    def list_sessions(self) -> List[Dict]:
+        """List recorded sessions on disk, newest first"""
+        sessions = []
+        if not os.path.isdir(config.RECORDINGS_DIR):
+            return sessions
+        
+        for name in sorted(os.listdir(config.RECORDINGS_DIR), reverse=True):
+            manifest_path = os.path.join(config.RECORDINGS_DIR, name, "session.json")
+            try:
+                with open(manifest_path, encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                continue
+            manifest["segments"] = len(manifest.get("segments", []))
+            manifest["recording"] = name in [r.session_id for r in self.recorders.values()]
+            sessions.append(manifest)
+        return sessions
+
+recording_manager = RecordingManager()
+
+class TrafficCapture:
+    """Records the inbound frame and control traffic of live sessions to one file
+    
+    The file is MAGIC followed by records: a RECORD header (time, kind,
+    device number, payload length) and the event as compact JSON, with its
+    binary fields (JPEG frames, tiles) moved out of the JSON and appended raw.
+    Devices are numbered in order of appearance so replays can map them to
+    new connections. Events are queued and written by a background thread.
+    """
+    
+    MAGIC = b"MNSTRCAP\x01"
+    RECORD = struct.Struct("<dBHI")  # time, kind, device number, payload length
+    KINDS = ("connect", "disconnect", "screen_data", "screen_tiles", "control", "control_batch")
+    
+    def __init__(self):
+        self.path: Optional[str] = None
+        self.queue: Optional[queue.Queue] = None
+        self.thread: Optional[threading.Thread] = None
+        self.devices: Dict[str, int] = {}
+        self.records = 0
+        self.bytes = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        
+    def start(self, path: str):
+        """Start capturing, devices already connected are recorded as connects first"""
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(self.MAGIC)
+        self.queue = queue.Queue(maxsize=config.CAPTURE_QUEUE_SIZE)
+        self.thread = threading.Thread(target=self._run, name="traffic-capture", daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+        
+        for sid, client in list(connection_manager.clients.items()):
+            self.record("connect", sid, {"client_data": client["data"]})
+        logger.info(f"Capturing traffic to {path}")
+    
+    def record(self, kind: str, sid: Optional[str], data: Any):
+        """Queue an inbound event, a no-op unless capturing"""
+        capture_queue = self.queue
+        if capture_queue is None or not sid:
+            return
+        with self.lock:
+            number = self.devices.setdefault(sid, len(self.devices) % 65536)
+        try:
+            capture_queue.put_nowait((time.time(), self.KINDS.index(kind), number, data))
+        except queue.Full:
+            self.dropped += 1
+    
+    def stop(self):
+        """Write out queued events and close the file"""
+        if self.queue is None:
+            return
+        capture_queue, self.queue = self.queue, None
+        capture_queue.put(None)
+        self.thread.join()
+        self.file.close()
+        logger.info(f"Captured {self.records} events ({self.bytes / 1024 / 1024:.1f} MB, "
+                    f"{self.dropped} dropped) to {self.path}")
+    
+    def _run(self):
+        capture_queue = self.queue
+        while True:
+            item = capture_queue.get()
+            if item is None:
+                break
+            timestamp, kind, number, data = item
+            try:
+                payload = self.pack(data)
+                self.file.write(self.RECORD.pack(timestamp, kind, number, len(payload)))
+                self.file.write(payload)
+                self.records += 1
+                self.bytes += self.RECORD.size + len(payload)
+                if capture_queue.empty():
+                    self.file.flush()
+            except Exception as e:
+                logger.error(f"Capture error: {e}")
+    
+    @staticmethod
+    def pack(data: Any) -> bytes:
+        """Event payload: JSON length, blob count, JSON, blob lengths, blobs"""
+        blobs: List[bytes] = []
+        
+        def strip(value):
+            if isinstance(value, (bytes, bytearray, memoryview)):
+                blobs.append(bytes(value))
+                return {"$blob": len(blobs) - 1}
+            if isinstance(value, dict):
+                return {key: strip(item) for key, item in value.items()}
+            if isinstance(value, (list, tuple)):
+                return [strip(item) for item in value]
+            return value
+        
+        meta = json.dumps(strip(data), separators=(',', ':')).encode()
+        return (struct.pack("<IH", len(meta), len(blobs)) + meta +
+                struct.pack(f"<{len(blobs)}I", *(len(blob) for blob in blobs)) + b"".join(blobs))
+    
+    @staticmethod
+    def unpack(payload: bytes) -> Any:
+        """Inverse of pack"""
+        meta_size, count = struct.unpack_from("<IH", payload)
+        meta = json.loads(payload[6:6 + meta_size])
+        sizes = struct.unpack_from(f"<{count}I", payload, 6 + meta_size)
+        blobs, offset = [], 6 + meta_size + 4 * count
+        for size in sizes:
+            blobs.append(payload[offset:offset + size])
+            offset += size
+        
+        def restore(value):
+            if isinstance(value, dict):
+                if len(value) == 1 and "$blob" in value:
+                    return blobs[value["$blob"]]
+                return {key: restore(item) for key, item in value.items()}
+            if isinstance(value, list):
+                return [restore(item) for item in value]
+            return value
+        
+        return restore(meta)
+    
+    @classmethod
+    def read(cls, path: str):
+        """Yield (timestamp, kind, device number, data) from a capture file
+        
+        A record cut off by the end of the file is what a crashed server
+        leaves behind, so it ends the capture with a warning. Raises
+        ValueError for a bad header or a corrupt record.
+        """
+        with open(path, 'rb') as f:
+            if f.read(len(cls.MAGIC)) != cls.MAGIC:
+                raise ValueError(f"{path} is not a traffic capture")
+            while True:
+                offset = f.tell()
+                header = f.read(cls.RECORD.size)
+                if not header:
+                    return
+                if len(header) < cls.RECORD.size:
+                    logger.warning(f"{path}: ignoring truncated record header at byte {offset}")
+                    return
+                timestamp, kind, number, size = cls.RECORD.unpack(header)
+                payload = f.read(size)
+                if len(payload) < size:
+                    logger.warning(f"{path}: ignoring final record at byte {offset}, "
+                                   f"cut off after {len(payload)} of {size} bytes")
+                    return
+                try:
+                    record = (timestamp, cls.KINDS[kind], number, cls.unpack(payload))
+                except (IndexError, KeyError, TypeError, ValueError, struct.error) as e:
+                    raise ValueError(f"{path}: corrupt record at byte {offset}: {e}") from e
+                yield record
+
+traffic_capture = TrafficCapture()
+
+class SegmentIndex:
+    """Memory-mapped view of a segment's frame index, searchable with bisect"""
+    
+    def __init__(self, mm: mmap.mmap, count: int):
+        self.mm = mm
+        self.count = count
+        
+    def __len__(self) -> int:
+        return self.count
+    
+    def __getitem__(self, i: int) -> float:
+        return SessionRecorder.INDEX.unpack_from(self.mm, i * SessionRecorder.INDEX.size)[0]
+    
+    def entry(self, i: int) -> Tuple[float, int, int]:
+        """Timestamp, offset and length of frame i"""
+        return SessionRecorder.INDEX.unpack_from(self.mm, i * SessionRecorder.INDEX.size)
+
+class SessionPlayback:
+    """Random access to a recorded session through mmap-ed segment files
+    
+    Nothing but the segment list is held in Python memory; frames and index
+    records are read straight out of the mappings, so memory stays flat for
+    any recording length and all reviewers share the OS page cache.
+    """
+    
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.path = os.path.join(config.RECORDINGS_DIR, session_id)
+        self.manifest: Dict = {}
+        self.segments: List[Tuple[float, SegmentIndex, mmap.mmap]] = []
+        self.segment_files: Dict[str, Tuple[float, SegmentIndex, mmap.mmap]] = {}
+        self.mapped_sizes: Dict[str, int] = {}
+        self.checked = 0.0
+        self.users = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        self.refresh(force=True)
+        
+    def _map(self, filename: str) -> Optional[mmap.mmap]:
+        with open(os.path.join(self.path, filename), 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return None
+            self.mapped_sizes[filename] = size
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    def refresh(self, force: bool = False):
+        """Re-map segments that grew while the session is still recording"""
+        if not force and (self.manifest.get("stopped_at") or time.time() - self.checked < 1.0):
+            return
+        
+        with self.lock:
+            self.checked = time.time()
+            with open(os.path.join(self.path, "session.json"), encoding='utf-8') as f:
+                manifest = json.load(f)
+            
+            segments = []
+            segment_files = {}
+            for segment in manifest.get("segments", []):
+                try:
+                    data_size = os.path.getsize(os.path.join(self.path, segment["data"]))
+                    index_size = os.path.getsize(os.path.join(self.path, segment["index"]))
+                except OSError:
+                    continue
+                
+                # Match by file name, skipped segments shift the list positions
+                mapped = self.segment_files.get(segment["data"])
+                if (mapped is not None and self.mapped_sizes.get(segment["data"]) == data_size
+                        and self.mapped_sizes.get(segment["index"]) == index_size):
+                    segments.append(mapped)
+                    segment_files[segment["data"]] = mapped
+                    continue
+                
+                data_mm = self._map(segment["data"])
+                index_mm = self._map(segment["index"])
+                if data_mm is None or index_mm is None:
+                    continue
+                
+                # Skip index records whose frame bytes have not reached the disk yet
+                index = SegmentIndex(index_mm, len(index_mm) // SessionRecorder.INDEX.size)
+                while index.count:
+                    _, offset, length = index.entry(index.count - 1)
+                    if offset + length <= len(data_mm):
+                        break
+                    index.count -= 1
+                if index.count:
+                    segments.append((index[0], index, data_mm))
+                    segment_files[segment["data"]] = segments[-1]
+            
+            self.manifest = manifest
+            self.segments = segments
+            self.segment_files = segment_files
+    
+    @contextlib.contextmanager
+    def _in_use(self):
+        """Keep the mappings open while a reader uses them"""
+        with self.lock:
+            self.users += 1
+            # Evicted between open() and this read, map it again for this reader
+            remap = self.closed and not self.segments
+        try:
+            if remap:
+                self.refresh(force=True)
+            yield
+        finally:
+            with self.lock:
+                self.users -= 1
+                if self.closed and not self.users:
+                    self._unmap()
+    
+    def _unmap(self):
+        """Close all mappings, call with the lock held"""
+        for _, index, data_mm in self.segments:
+            index.mm.close()
+            data_mm.close()
+        self.segments = []
+        self.segment_files = {}
+    
+    def close(self):
+        """Unmap the segments once the last reader is done"""
+        with self.lock:
+            self.closed = True
+            if not self.users:
+                self._unmap()
+    
+    @property
+    def stopped(self) -> bool:
+        """Whether recording has finished, so its frames can no longer change"""
+        return bool(self.manifest.get("stopped_at"))
+    
+    @property
+    def start(self) -> float:
+        return self.segments[0][0] if self.segments else 0.0
+    
+    @property
+    def end(self) -> float:
+        if not self.segments:
+            return 0.0
+        index = self.segments[-1][1]
+        return index[len(index) - 1]
+    
+    def get_info(self) -> Dict:
+        """Session metadata and time range"""
+        with self._in_use():
+            return self._info()
+    
+    def _info(self) -> Dict:
+        self.refresh()
+        return {
+            "session_id": self.session_id,
+            "sid": self.manifest.get("sid"),
+            "device": self.manifest.get("device"),
+            "start": self.start,
+            "end": self.end,
+            "duration": self.end - self.start,
+            "frames": sum(len(index) for _, index, _ in self.segments),
+            "segments": len(self.segments),
+            "recording": not self.stopped
+        }
+    
+    def locate(self, timestamp: float) -> Optional[Tuple[int, int]]:
+        """Position of the last frame at or before timestamp"""
+        segments = self.segments
+        if not segments:
+            return None
+        segment = max(bisect.bisect_right([start for start, _, _ in segments], timestamp) - 1, 0)
+        index = segments[segment][1]
+        return segment, max(bisect.bisect_right(index, timestamp) - 1, 0)
+    
+    def read(self, position: Tuple[int, int]) -> Tuple[float, bytes]:
+        """Timestamp and JPEG bytes of the frame at position"""
+        _, index, data_mm = self.segments[position[0]]
+        timestamp, offset, length = index.entry(position[1])
+        return timestamp, data_mm[offset:offset + length]
+    
+    def next_position(self, position: Tuple[int, int]) -> Optional[Tuple[int, int]]:
+        segment, frame = position
+        if frame + 1 < len(self.segments[segment][1]):
+            return segment, frame + 1
+        if segment + 1 < len(self.segments):
+            return segment + 1, 0
+        return None
+    
+    def frame_at(self, offset: float) -> Optional[Tuple[float, bytes]]:
+        """Frame shown offset seconds into the session"""
+        with self._in_use():
+            self.refresh()
+            position = self.locate(self.start + offset)
+            return self.read(position) if position else None
+    
+    def replay(self, offset: float = 0.0, speed: float = 1.0):
+        """Yield (delay, frame) pairs that replay the session at the given speed
+        
+        Frames the client cannot keep up with are skipped by seeking to the
+        current playback time, and long idle gaps are shortened.
+        """
+        with self._in_use():
+            self.refresh()
+            position = self.locate(self.start + offset)
+            if position is None:
+                return
+            
+            base_timestamp = self.read(position)[0]
+            wall_start = time.time()
+            while position is not None:
+                # Jump ahead when sending fell behind the playback clock
+                target = self.locate(base_timestamp + (time.time() - wall_start) * speed)
+                if target > position:
+                    position = target
+                
+                timestamp, frame = self.read(position)
+                delay = (timestamp - base_timestamp) / speed - (time.time() - wall_start)
+                if delay > config.PLAYBACK_MAX_GAP:
+                    wall_start -= delay - config.PLAYBACK_MAX_GAP
+                    delay = config.PLAYBACK_MAX_GAP
+                yield max(delay, 0.0), frame
+                position = self.next_position(position)
+
+class PlaybackLibrary:
+    """Keeps recently reviewed sessions mapped so reviewers share them"""
+    
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.sessions: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        
+    def open(self, session_id: str) -> Optional[SessionPlayback]:
+        """Open a recorded session, None when it does not exist"""
+        if not re.match(r'^[\w-]+$', session_id):
+            return None
+        
+        with self.lock:
+            playback = self.sessions.get(session_id)
+            if playback is not None:
+                self.sessions.move_to_end(session_id)
+                return playback
+        
+        try:
+            playback = SessionPlayback(session_id)
+        except (OSError, ValueError) as e:
+            logger.error(f"Playback open error ({session_id}): {e}")
+            return None
+        
+        with self.lock:
+            self.sessions[session_id] = playback
+            evicted = []
+            while len(self.sessions) > self.capacity:
+                evicted.append(self.sessions.popitem(last=False)[1])
+        
+        # Readers still streaming an evicted session keep it mapped until they finish
+        for old in evicted:
+            old.close()
+        return playback
+
+playback_library = PlaybackLibrary(config.PLAYBACK_CACHE_SIZE)
+
+def parse_playback_args(args: Dict) -> Tuple[float, float]:
+    """Offset and speed query parameters of the playback endpoints"""
+    try:
+        offset = max(float(args.get('t', 0)), 0.0)
+    except (TypeError, ValueError):
+        offset = 0.0
+    try:
+        speed = float(args.get('speed', 1))
+    except (TypeError, ValueError):
+        speed = 1.0
+    return offset, speed if speed in config.PLAYBACK_SPEEDS else 1.0
+
+_timelapse_playback: Optional[SessionPlayback] = None
+
+def _timelapse_init(recordings_dir: str, session_id: str):
+    """Open the session once in each timelapse worker process"""
+    global _timelapse_playback
+    config.RECORDINGS_DIR = recordings_dir
+    _timelapse_playback = SessionPlayback(session_id)
+
+def _timelapse_hashes(segment: int, start: int, stop: int) -> List[Tuple[float, Optional[int]]]:
+    """Timestamps and difference hashes of a run of recorded frames"""
+    hashes = []
+    for frame in range(start, stop):
+        timestamp, frame_data = _timelapse_playback.read((segment, frame))
+        hashes.append((timestamp, frame_deduplicator.perceptual_hash(frame_data)))
+    return hashes
+
+def _timelapse_render(position: Tuple[int, int], width: int, quality: int,
+                      thumb_size: Optional[Tuple[int, int]]) -> Tuple[bytes, Optional[bytes]]:
+    """Resize one recorded frame for the timelapse, plus a contact sheet thumbnail"""
+    _, frame_data = _timelapse_playback.read(position)
+    image = Image.open(io.BytesIO(frame_data))
+    image.draft("RGB", (width, width * 4))
+    image = image.convert("RGB")
+    if image.width > width:
+        image = image.resize((width, max(1, image.height * width // image.width)), Image.BILINEAR)
+    
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality)
+    
+    thumb = None
+    if thumb_size:
+        image.thumbnail(thumb_size, Image.BILINEAR)
+        thumb_output = io.BytesIO()
+        image.save(thumb_output, format="JPEG", quality=80)
+        thumb = thumb_output.getvalue()
+    return output.getvalue(), thumb
+
+def _ordered_map(pool: ProcessPoolExecutor, fn, jobs, window: int):
+    """Like pool.map, but with at most window jobs in flight"""
+    pending = deque()
+    for job in jobs:
+        pending.append(pool.submit(fn, *job))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+class ProgressReporter:
+    """Prints progress and throughput of a long running CLI stage"""
+    
+    def __init__(self, stage: str, total: int):
+        self.stage = stage
+        self.total = total
+        self.done = 0
+        self.started = time.time()
+        self.reported = 0.0
+        
+    def update(self, count: int = 1, extra: str = ""):
+        self.done += count
+        now = time.time()
+        if now - self.reported >= 1.0 or self.done >= self.total:
+            self.reported = now
+            rate = self.done / max(now - self.started, 1e-6)
+            percent = 100.0 * self.done / self.total if self.total else 100.0
+            print(f"[INFO] {self.stage}: {self.done}/{self.total} ({percent:.1f}%) "
+                  f"{rate:.0f} frames/s{extra}", flush=True)
+    
+    @property
+    def elapsed(self) -> float:
+        return time.time() - self.started
+
+def export_timelapse(args: argparse.Namespace) -> bool:
+    """Export a timelapse MJPEG and contact sheet from a recorded session
+    
+    Frames are scored by how far their difference hash moved from the last
+    kept frame, then only the kept frames are decoded, resized and encoded.
+    Both passes run across a process pool with a bounded window of jobs and
+    stream their results, so memory use does not grow with the recording.
+    """
+    recordings_dir, session_id = os.path.split(os.path.normpath(args.session))
+    recordings_dir = recordings_dir or config.RECORDINGS_DIR
+    try:
+        config.RECORDINGS_DIR = recordings_dir
+        playback = SessionPlayback(session_id)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] Cannot open recording {args.session}: {e}")
+        return False
+    
+    info = playback.get_info()
+    if not info["frames"]:
+        print(f"[ERROR] Recording {session_id} has no frames")
+        return False
+    
+    output_path = args.output or os.path.join(playback.path, "timelapse.mjpg")
+    sheet_path = args.sheet or os.path.join(playback.path, "contact_sheet.jpg")
+    workers = args.workers or os.cpu_count() or 1
+    window = workers * 4
+    print(f"[INFO] Timelapse of {session_id}: {info['frames']} frames, "
+          f"{info['duration'] / 3600:.2f}h, {workers} workers")
+    
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_timelapse_init, initargs=(recordings_dir, session_id)) as pool:
+        # Pass 1: keep frames whose content moved away from the last kept frame
+        chunks = [(segment, start, min(start + config.TIMELAPSE_CHUNK, len(index)))
+                  for segment, (_, index, _) in enumerate(playback.segments)
+                  for start in range(0, len(index), config.TIMELAPSE_CHUNK)]
+        selected: List[Tuple[int, int]] = []
+        last_hash, last_timestamp = None, None
+        progress = ProgressReporter("Scoring", info["frames"])
+        
+        for (segment, start, _), hashes in zip(chunks, _ordered_map(pool, _timelapse_hashes, chunks, window)):
+            for offset, (timestamp, frame_hash) in enumerate(hashes):
+                changed = (last_hash is None or frame_hash is None or
+                           bin(frame_hash ^ last_hash).count("1") >= args.threshold)
+                if changed or timestamp - last_timestamp >= args.max_gap:
+                    selected.append((segment, start + offset))
+                    last_hash, last_timestamp = frame_hash, timestamp
+            progress.update(len(hashes), f", kept {len(selected)}")
+        scoring_time = progress.elapsed
+        
+        # Pass 2: resize the kept frames, streaming them to the output in order
+        sheet_every = max(1, -(-len(selected) // args.sheet_frames))
+        thumb_size = (config.TIMELAPSE_THUMB_WIDTH, config.TIMELAPSE_THUMB_WIDTH * 2)
+        jobs = [(position, args.width, args.quality, thumb_size if i % sheet_every == 0 else None)
+                for i, position in enumerate(selected)]
+        sheet, cell, thumbs = None, None, 0
+        written = 0
+        progress = ProgressReporter("Rendering", len(jobs))
+        
+        with open(output_path, 'wb') as output:
+            for frame_data, thumb_data in _ordered_map(pool, _timelapse_render, jobs, window):
+                output.write(frame_data)
+                written += len(frame_data)
+                
+                if thumb_data:
+                    thumb = Image.open(io.BytesIO(thumb_data))
+                    if sheet is None:
+                        cell = thumb.size
+                        rows = -(-len(selected) // sheet_every // args.columns) or 1
+                        sheet = Image.new("RGB", (cell[0] * args.columns, cell[1] * rows))
+                    sheet.paste(thumb, ((thumbs % args.columns) * cell[0], (thumbs // args.columns) * cell[1]))
+                    thumbs += 1
+                progress.update()
+        
+        if sheet is not None:
+            sheet.save(sheet_path, format="JPEG", quality=85)
+    
+    total_time = scoring_time + progress.elapsed
+    print(f"[SUCCESS] Kept {len(selected)}/{info['frames']} frames "
+          f"({info['duration'] / max(len(selected), 1):.1f}s of recording per frame)")
+    print(f"[SUCCESS] Timelapse: {output_path} ({written / 1024 / 1024:.1f} MB)")
+    print(f"[SUCCESS] Contact sheet: {sheet_path} ({thumbs} frames)")
+    print(f"[INFO] Scoring {scoring_time:.1f}s, rendering {progress.elapsed:.1f}s, "
+          f"{info['frames'] / max(total_time, 1e-6):.0f} frames/s overall")
+    return True
+
+class StreamWorkerProcesses:
+    """Streaming worker processes that serve /stream/<sid> out of shared memory"""
+    
+    def __init__(self):
+        self.processes: List[multiprocessing.Process] = []
+        self.ports: List[int] = []
+        self.next_index = 0
+        self.lock = threading.Lock()
+        
+    def start(self, count: int, base_port: int):
+        """Spawn count workers on consecutive ports"""
+        context = multiprocessing.get_context("spawn")
+        for worker_id in range(min(count, SharedFrameRing.MAX_WORKERS)):
+            port = base_port + worker_id
+            process = context.Process(target=run_stream_worker, args=(worker_id, port),
+                                      name=f"stream-worker-{worker_id}", daemon=True)
+            process.start()
+            self.processes.append(process)
+            self.ports.append(port)
+            logger.info(f"Stream worker {worker_id} listening on port {port}")
+    
+    def pick_port(self) -> Optional[int]:
+        """Round-robin a worker port for a new viewer"""
+        with self.lock:
+            if not self.ports:
+                return None
+            port = self.ports[self.next_index % len(self.ports)]
+            self.next_index += 1
+            return port
+    
+    def stop(self):
+        """Terminate all workers"""
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join(timeout=2)
+        self.processes = []
+        self.ports = []
+
+stream_workers = StreamWorkerProcesses()
+
+class SharedRingFollower:
+    """Reads one device's ring inside a streaming worker and wakes its viewers
+    
+    A single thread per device polls the ring and copies each new frame out
+    of shared memory once; the worker's viewers of that device sleep on a
+    condition instead of polling the ring themselves.
+    """
+    
+    def __init__(self, ring: SharedFrameRing):
+        self.ring = ring
+        self.seq = 0
+        self.frame: Optional[bytes] = None
+        self.viewers = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name="ring-follower", daemon=True)
+        
+    def _run(self):
+        try:
+            while not self.ring.closed:
+                with self.condition:
+                    if self.viewers <= 0:
+                        break
+                result = self.ring.read(self.seq)
+                if result is None:
+                    time.sleep(config.SHM_POLL_INTERVAL)
+                    continue
+                with self.condition:
+                    self.seq, self.frame = result
+                    self.condition.notify_all()
+        except Exception as e:
+            logger.error(f"Shared ring follower error: {e}")
+        finally:
+            with self.condition:
+                self.closed = True
+                self.condition.notify_all()
+            self.ring.close()
+    
+    def wait(self, last_seq: int, timeout: float) -> Optional[Tuple[int, bytes]]:
+        """Newest frame after last_seq, None on timeout or once the ring closed"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq > last_seq or self.closed, timeout)
+            if self.seq > last_seq:
+                return self.seq, self.frame
+            return None
+
+def run_stream_worker(worker_id: int, port: int):
+    """Entry point of a streaming worker process"""
+    app = Flask(f"{__name__}.stream_worker_{worker_id}")
+    followers: Dict[str, SharedRingFollower] = {}
+    followers_lock = threading.Lock()
+    
+    def join(sid: str) -> Optional[SharedRingFollower]:
+        with followers_lock:
+            follower = followers.get(sid)
+            if follower is None or follower.closed:
+                ring = SharedFrameRing.attach(sid)
+                if ring is None:
+                    return None
+                follower = followers[sid] = SharedRingFollower(ring)
+            with follower.condition:
+                follower.viewers += 1
+                if not follower.closed:
+                    follower.ring.set_viewers(worker_id, follower.viewers)
+            if not follower.thread.is_alive() and not follower.closed:
+                follower.thread.start()
+            return follower
+    
+    def leave(sid: str, follower: SharedRingFollower):
+        with followers_lock:
+            with follower.condition:
+                follower.viewers -= 1
+                if not follower.closed:
+                    follower.ring.set_viewers(worker_id, follower.viewers)
+            if follower.viewers <= 0 and followers.get(sid) is follower:
+                followers.pop(sid)
+    
+    @app.route('/stream/<sid>')
+    def worker_stream(sid):
+        """Video streaming endpoint backed by the device's shared frame ring"""
+        profile = frame_processor.resolve_profile(request.args.get('profile'))
+        follower = join(sid)
+        if follower is None:
+            return "Unknown device", 404
+        
+        def generate():
+            last_seq = 0
+            try:
+                while not follower.closed:
+                    result = follower.wait(last_seq, config.STREAM_WAIT_TIMEOUT)
+                    if result is None:
+                        continue
+                    
+                    last_seq, frame = result
+                    # Transcoding runs on this worker's cores, cached across its viewers
+                    frame = frame_processor.process_frame(frame, profile, key=(sid, last_seq))
+                    yield (b'--frame\r\n'
+                           b'Content-Type: image/jpeg\r\n\r\n' + 
+                           frame + b'\r\n')
+            except Exception as e:
+                logger.error(f"Stream worker {worker_id} error: {e}")
+            finally:
+                leave(sid, follower)
+        
+        return Response(generate(),
+                      mimetype='multipart/x-mixed-replace; boundary=frame')
+    
+    app.run(host=config.HOST, port=port, threaded=True, debug=False, use_reloader=False)
+
+def host_without_port(host: str) -> str:
+    """Strip the port from a Host header, keeping the brackets of IPv6 literals"""
+    if host.startswith('['):
+        end = host.find(']')
+        return host[:end + 1] if end != -1 else host
+    if host.count(':') == 1:
+        return host.split(':')[0]
+    return host
+
+def get_server_ip() -> str:
+    """Get the LAN address devices should connect to"""
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.connect(("8.8.8.8", 80))
+        server_ip = s.getsockname()[0]
+        s.close()
+    except:
+        try:
+            server_ip = socket.gethostbyname(socket.gethostname())
+            if server_ip.startswith("127."):
+                server_ip = "localhost"
+        except:
+            server_ip = "localhost"
+    return server_ip
+
+def create_connection(client_info: Dict) -> Dict:
+    """Generate a token and its connection QR code"""
+    server_ip = get_server_ip()
+    token = connection_manager.generate_token(client_info)
+    
+    # Create connection URL
+    connection_url = f"http://{server_ip}:{config.WEB_PORT}/connect?token={token}"
+    
+    # Generate QR code
+    try:
+        qr = qrcode.QRCode(
+            version=1,
+            error_correction=qrcode.constants.ERROR_CORRECT_H,
+            box_size=10,
+            border=4,
+        )
+        qr.add_data(connection_url)
+        qr.make(fit=True)
+        
+        img = qr.make_image(fill_color="black", back_color="white")
+        
+        # Save QR code
+        qr_path = f"qrcodes/{token}.png"
+        img.save(qr_path)
+        
+        # Copy to static folder
+        static_qr_path = f"static/qrcodes/{token}.png"
+        img.save(static_qr_path)
+        
+        return {
+            "success": True,
+            "qr_url": f"/static/qrcodes/{token}.png",
+            "connection_url": connection_url,
+            "token": token,
+            "server_ip": server_ip,
+            "port": config.WEB_PORT
+        }
+    except Exception as e:
+        logger.error(f"QR generation error: {e}")
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+def process_usage() -> Dict:
+    """CPU seconds and resident memory of the server process"""
+    usage = {"cpu_seconds": round(time.process_time(), 3), "rss_bytes": None}
+    try:
+        with open("/proc/self/statm") as f:
+            usage["rss_bytes"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    return usage
+
+def get_system_info(start_time: Optional[float]) -> Dict:
+    """Get system information"""
+    return {
+        "app_name": config.APP_NAME,
+        "version": config.VERSION,
+        "author": config.AUTHOR,
+        "uptime": time.time() - start_time if start_time else 0,
+        "connected_clients": len(connection_manager.clients),
+        "frames_suppressed": frame_deduplicator.suppressed_total,
+        "control_events": control_coalescer.get_stats(),
+        "tokens": connection_manager.tokens.get_stats(),
+        "process": process_usage(),
+        "server_time": datetime.now().isoformat()
+    }
+
+def authenticate_client(sid: str, data: Dict) -> Dict:
+    """Validate a device token or resume key and register the client
+    
+    The QR token is single-use; reconnects and page reloads present the
+    resume_key from the previous authenticated reply instead.
+    """
+    token = data.get('token', '')
+    client_data = data.get('client_data', {})
+    resume_key = data.get('resume_key')
+    
+    if resume_key:
+        authenticated, stale_sid = connection_manager.resume_client(str(resume_key), token, client_data)
+        if stale_sid:
+            # Take over the session the server has not seen close yet
+            logger.info(f"Device resumed, dropping stale session: {stale_sid}")
+            disconnect_client(stale_sid)
+    else:
+        authenticated = connection_manager.consume_token(token)
+    
+    if authenticated:
+        connection_manager.add_client(sid, token, client_data)
+        traffic_capture.record("connect", sid, {"client_data": client_data})
+        return {
+            'success': True,
+            'sid': sid,
+            'message': 'Authentication successful',
+            'binary_frames': config.BINARY_FRAMES,
+            'delta': {
+                'tile_size': config.TILE_SIZE,
+                'keyframe_interval': config.KEYFRAME_INTERVAL,
+                'keyframe_ratio': config.KEYFRAME_RATIO
+            } if config.DELTA_FRAMES else None,
+            'stream_settings': stream_controller.register(sid),
+            'control_namespace': config.CONTROL_NAMESPACE,
+            'control_key': connection_manager.issue_control_key(sid),
+            'resume_key': connection_manager.issue_resume_key(sid)
+        }
+    
+    return {
+        'success': False,
+        'message': 'Invalid token'
+    }
+
+def disconnect_client(sid: str):
+    """Release everything held for a disconnected client"""
+    if sid in traffic_capture.devices:
+        traffic_capture.record("disconnect", sid, {})
+    if sid in recording_manager.recorders:
+        recording_manager.stop(sid)
+    control_coalescer.remove(sid)
+    control_latency.remove(sid)
+    frame_latency.remove(sid)
+    metrics.forget(("device", sid))
+    connection_manager.remove_client(sid)
+    stream_controller.remove(sid)
+    tile_compositor.remove(sid)
+    frame_deduplicator.remove(sid)
+
+def ingest_frame(sid: str, frame_bytes: bytes, wire_size: int, screen_info: Optional[Dict] = None,
+                 capture: Optional[Dict] = None) -> List[Tuple[str, Any]]:
+    """Publish a decoded frame; returns events to send back to the device
+    
+    capture carries the phone's captured_at (ms, phone clock) and capture_seq.
+    """
+    events = []
+    device = (("device", sid),)
+    metrics.inc("frames_in_total", device)
+    metrics.inc("bytes_in_total", device, wire_size)
+    
+    # Update screen size if provided
+    if screen_info:
+        width = screen_info.get('width', 0)
+        height = screen_info.get('height', 0)
+        if width and height:
+            connection_manager.update_screen_size(sid, width, height)
+    
+    settings = stream_controller.record_ingest(sid, wire_size)
+    if settings:
+        events.append(('stream_settings', settings))
+    
+    if config.DEDUP_FRAMES:
+        duplicate, static = frame_deduplicator.check(sid, frame_bytes)
+        if static is not None:
+            # Hint the phone to slow down while nothing changes, and to resume after
+            settings = stream_controller.set_static(sid, static)
+            if settings:
+                events.append(('stream_settings', settings))
+        if duplicate:
+            metrics.inc("frames_dropped_total", device + (("reason", "duplicate"),))
+            return events
+    
+    # Record the ingest before viewers wake, or a fast viewer finds no entry to time
+    captured_at, capture_seq = parse_capture_info(capture)
+    connection_manager.add_frame(sid, frame_bytes,
+                                 lambda seq: frame_latency.ingested(sid, seq, captured_at, capture_seq))
+    return events
+
+def parse_capture_info(data: Optional[Dict]) -> Tuple[Optional[float], Optional[int]]:
+    """Capture timestamp and sequence number sent along with a frame, if valid"""
+    if not isinstance(data, dict):
+        return None, None
+    try:
+        captured_at = float(data['captured_at']) if data.get('captured_at') is not None else None
+        capture_seq = int(data['capture_seq']) if data.get('capture_seq') is not None else None
+    except (TypeError, ValueError):
+        return None, None
+    return captured_at, capture_seq
+
+def sync_clock(sid: str, data: Any) -> Dict:
+    """Handle a ping; returns the pong payload for the phone's clock offset estimate
+    
+    The phone sends t0 (its send time) and the offset/rtt of its previous
+    exchange; t1 and t2 are the server's receive and reply times.
+    """
+    received = time.time() * 1000
+    client = connection_manager.get_client(sid)
+    if client:
+        client['last_ping'] = received / 1000
+    if not isinstance(data, dict):
+        return {}
+    try:
+        if data.get('offset') is not None and data.get('rtt') is not None:
+            frame_latency.update_clock(sid, float(data['offset']), float(data['rtt']))
+    except (TypeError, ValueError):
+        pass
+    return {"t0": data.get('t0'), "t1": received, "t2": time.time() * 1000}
+
+def mjpeg_part(sid: str, seq: int, frame: bytes) -> bytes:
+    """One multipart/x-mixed-replace part, tagged with the frame's sequence and capture time"""
+    entry = frame_latency.sent(sid, seq)
+    headers = f"Content-Length: {len(frame)}\r\nX-Frame-Seq: {seq}\r\n"
+    if entry is not None and entry[0] is not None:
+        headers += f"X-Capture-Timestamp: {entry[0]:.3f}\r\n"
+    return b'--frame\r\nContent-Type: image/jpeg\r\n' + headers.encode() + b'\r\n' + frame + b'\r\n'
+
+def ingest_screen_data(sid: str, data: Dict) -> List[Tuple[str, Any]]:
+    """Handle a full frame from mobile; returns events to send back"""
+    if sid not in connection_manager.clients:
+        return []
+    traffic_capture.record("screen_data", sid, data)
+    frame_data = data.get('frame', '')
+    screen_info = data.get('screen_info', {})
+    
+    if not frame_data:
+        return []
+    
+    try:
+        started = time.perf_counter()
+        if isinstance(frame_data, (bytes, bytearray, memoryview)):
+            # Binary attachment - raw JPEG bytes, no decoding needed
+            frame_bytes = bytes(frame_data)
+            kind = "binary"
+        else:
+            # Fallback: base64 data URL
+            if ',' in frame_data:
+                frame_data = frame_data.split(',')[1]
+            
+            frame_bytes = base64.b64decode(frame_data)
+            kind = "base64"
+        
+        if config.DELTA_FRAMES and data.get('keyframe'):
+            tile_compositor.set_keyframe(sid, frame_bytes)
+        metrics.observe("decode_seconds", time.perf_counter() - started, (("device", sid), ("kind", kind)))
+        
+        return ingest_frame(sid, frame_bytes, len(frame_bytes), screen_info, data)
+        
+    except Exception as e:
+        logger.error(f"Screen data error: {e}")
+        return []
+
+def ingest_screen_tiles(sid: str, data: Dict) -> List[Tuple[str, Any]]:
+    """Handle changed tiles from mobile in delta mode; returns events to send back"""
+    if sid not in connection_manager.clients:
+        return []
+    traffic_capture.record("screen_tiles", sid, data)
+    tiles = data.get('tiles', [])
+    screen_info = data.get('screen_info', {})
+    
+    if not tiles:
+        return []
+    
+    try:
+        size = (int(data.get('width', 0)), int(data.get('height', 0)))
+        settings = stream_controller.get_settings(sid) or stream_controller.initial_settings()
+        started = time.perf_counter()
+        frame_bytes = tile_compositor.apply_tiles(sid, tiles, size, settings["quality"])
+        metrics.observe("decode_seconds", time.perf_counter() - started, (("device", sid), ("kind", "tiles")))
+        
+        if frame_bytes is None:
+            # No base frame to patch, ask the phone for a full one
+            return [('request_keyframe', None)]
+        
+        wire_size = sum(len(tile.get('data', b'')) for tile in tiles)
+        return ingest_frame(sid, frame_bytes, wire_size, screen_info, data)
+        
+    except Exception as e:
+        logger.error(f"Screen tiles error: {e}")
+        return [('request_keyframe', None)]
+
+viewer_ids = itertools.count(1)
+
+def record_viewer_frame(sid: str, profile: str, skipped: int, viewer: str):
+    """Account for a frame sent to a viewer and the frames it skipped"""
+    stream_controller.record_served(sid, skipped)
+    metrics.inc("frames_served_total", (("device", sid), ("profile", profile)))
+    # Per viewer series live only while the stream is open, see forget_viewer
+    labels = (("device", sid), ("viewer", viewer))
+    metrics.inc("viewer_frames_served_total", labels)
+    if skipped:
+        metrics.inc("frames_dropped_total", (("device", sid), ("reason", "viewer_skipped")), skipped)
+        metrics.inc("viewer_frames_skipped_total", labels, skipped)
+
+def forget_viewer(viewer: str):
+    """Drop the series of a closed viewer stream"""
+    metrics.forget(("viewer", viewer))
+
+def dispatch_control(data: Dict):
+    """Route a control event from the desktop to the control handler"""
+    sid = data.get('sid', '')
+    event_type = data.get('type', '')
+    event_data = data.get('data', {})
+    
+    if sid and sid in connection_manager.clients:
+        traffic_capture.record("control", sid, data)
+        action = event_data.get('type') if event_type in ('mouse', 'keyboard') else None
+        name = f"{event_type}_{action}" if action else event_type
+        metrics.inc("control_events_total", (("type", name if name in CONTROL_EVENT_TYPES else "other"),))
+        if name in CLICK_EVENT_TYPES:
+            frame_latency.clicked(sid)
+        
+        if event_type == 'mouse':
+            control_coalescer.submit(sid, event_data)
+        elif event_type == 'keyboard':
+            control_handler.handle_keyboard_event(sid, event_data)
+        elif event_type == 'touch':
+            control_handler.handle_touch_event(sid, event_data)
+        elif event_type == 'command':
+            control_handler.handle_command(sid, event_data.get('command', ''))
+
+# control_batch events are [code, dt_ms, *args] with coordinates in 1/10000 of the screen
+CONTROL_BATCH_ARGS = {
+    "md": (int, int),             # mouse down: x, y
+    "mm": (int, int),             # mouse move: x, y
+    "mu": (int, int),             # mouse up: x, y
+    "mw": (int, int, int),        # mouse wheel: x, y, delta
+    "kd": (str, int),             # key down: key, keyCode
+    "ku": (str, int),             # key up: key, keyCode
+    "kt": (str,),                 # text input
+    "tp": (str, int, int),        # touch: action, x, y
+    "c": (str,)                   # command: home, back, recent...
+}
+
+CONTROL_EVENT_TYPES = {
+    "md": "mouse_down", "mm": "mouse_move", "mu": "mouse_up", "mw": "mouse_wheel",
+    "kd": "keyboard_down", "ku": "keyboard_up", "kt": "keyboard_text", "tp": "touch", "c": "command"
+}
+CONTROL_EVENT_TYPES.update({name: name for name in list(CONTROL_EVENT_TYPES.values())})
+
+# Events expected to change the screen, timed until the next changed frame
+CLICK_EVENT_TYPES = {"md", "kd", "kt", "tp", "c", "mouse_down", "keyboard_down", "touch", "command"}
+
+def decode_control_batch(events: List) -> List[List]:
+    """Validate compact control events, clamping coordinates to the screen"""
+    decoded = []
+    for event in events[:config.CONTROL_BATCH_MAX]:
+        if not isinstance(event, list) or not event or not isinstance(event[0], str):
+            continue
+        args = CONTROL_BATCH_ARGS.get(event[0])
+        if args is None or len(event) != len(args) + 2:
+            continue
+        try:
+            values = [kind(value) for kind, value in zip(args, event[2:])]
+            dt = int(event[1])
+        except (TypeError, ValueError):
+            continue
+        
+        # Coordinates follow the code's string arguments
+        first = 1 if event[0] == "tp" else 0
+        if event[0][0] in "mt":
+            for i in (first, first + 1):
+                values[i] = min(max(values[i], 0), 10000)
+        decoded.append([event[0], dt] + values)
+    return decoded
+
+def dispatch_control_batch(data: Dict) -> Dict:
+    """Route a batch of compact control events from the desktop, returns the ack"""
+    received_at = time.time()
+    sid = data.get('sid', '')
+    events = []
+    if sid and sid in connection_manager.clients and isinstance(data.get('events'), list):
+        traffic_capture.record("control_batch", sid, data)
+        events = decode_control_batch(data['events'])
+        for event in events:
+            metrics.inc("control_events_total", (("type", CONTROL_EVENT_TYPES[event[0]]),))
+        if any(event[0] in CLICK_EVENT_TYPES for event in events):
+            frame_latency.clicked(sid)
+        if events:
+            control_coalescer.submit_batch(sid, events)
+    return {"received_at": received_at, "applied": len(events)}
+
+def is_local_address(address: Optional[str]) -> bool:
+    """Whether a request comes from the machine running the server"""
+    if not address:
+        return False
+    return address.startswith("127.") or address in ("::1", "localhost", get_server_ip())
+
+def panel_authorized(panel_key: Any) -> bool:
+    """Check a control panel credential against config.PANEL_KEY"""
+    return bool(panel_key) and hmac.compare_digest(str(panel_key), config.PANEL_KEY)
+
+def connect_control_channel(control_sid: str, auth: Optional[Dict]) -> bool:
+    """Accept a control namespace connection
+    
+    Phones present the control_key from their authenticate reply and only
+    receive events; the control panel presents config.PANEL_KEY and is the
+    only side allowed to send them.
+    """
+    auth = auth if isinstance(auth, dict) else {}
+    panel_key = auth.get('panel_key')
+    if panel_key:
+        if not panel_authorized(panel_key):
+            logger.warning(f"Control panel rejected: {control_sid}")
+            return False
+        connection_manager.attach_control_panel(control_sid)
+        logger.info(f"Control panel connected: {control_sid}")
+        return True
+    
+    key = auth.get('control_key')
+    sid = connection_manager.attach_control_channel(str(key), control_sid) if key else None
+    if sid is None:
+        logger.warning(f"Control channel rejected: {control_sid}")
+        return False
+    logger.info(f"Control channel opened: {sid}")
+    return True
+
+def dispatch_panel_control(control_sid: str, data: Dict):
+    """Route a control event from the control namespace, panels only"""
+    if connection_manager.is_control_panel(control_sid):
+        dispatch_control(data)
+
+def dispatch_panel_control_batch(control_sid: str, data: Dict) -> Dict:
+    """Route a control batch from the control namespace, panels only"""
+    if not connection_manager.is_control_panel(control_sid):
+        return {"received_at": time.time(), "applied": 0}
+    return dispatch_control_batch(data)
+
+def acknowledge_control(data: Dict):
+    """Record a phone's ack for an applied control packet"""
+    try:
+        control_latency.acked(int(data.get('id')))
+    except (TypeError, ValueError, AttributeError):
+        pass
+
+def print_server_info(server_ip: str, server_mode: str):
+    """Print startup banner with access points"""
+    print("\n" + "="*60)
+    print(f"MØNSTR-M1ND v{config.VERSION}")
+    print("="*60)
+    print(f"Author: {config.AUTHOR}")
+    print(f"Telegram: {config.TELEGRAM_URL}")
+    print(f"Instagram: {config.INSTAGRAM_URL}")
+    print("="*60)
+    print("\nServer Information:")
+    print(f"  • Server IP: {server_ip}")
+    print(f"  • Port: {config.WEB_PORT}")
+    print(f"  • Server Mode: {server_mode}")
+    print(f"  • FPS: {config.FRAME_RATE}")
+    print(f"  • Max Clients: {config.MAX_CLIENTS}")
+    print("\nAccess Points:")
+    print(f"  • Main Interface: http://{server_ip}:{config.WEB_PORT}")
+    print(f"  • Control Panel: http://{server_ip}:{config.WEB_PORT}/control?key={config.PANEL_KEY}")
+    print(f"  • Local Access: http://localhost:{config.WEB_PORT}")
+    print("\nQuick Start:")
+    print("  1. Open main interface in browser")
+    print("  2. Click 'Generate QR Code'")
+    print("  3. Scan QR code with your Android device")
+    print("  4. Open link on mobile and grant permissions")
+    print("  5. Start controlling from desktop!")
+    print("="*60 + "\n")
+
+class MØNSTRApp:
+    """Main application class"""
+    
+    def __init__(self):
+        if not FLASK_AVAILABLE:
+            raise ImportError("Required packages not available")
+        
+        self.app = Flask(__name__, 
+                       static_folder='static',
+                       template_folder='templates')
+        
+        # Configure app
+        self.app.config['SECRET_KEY'] = config.SECRET_KEY
+        self.app.config['MAX_CONTENT_LENGTH'] = 8 * 1024 * 1024  # 8MB
+        
+        # Enable CORS
+        CORS(self.app)
+        
+        # Setup SocketIO
+        self.socketio = SocketIO(self.app, 
+                                cors_allowed_origins="*",
+                                async_mode='threading',
+                                ping_timeout=60,
+                                ping_interval=25,
+                                logger=False,
+                                engineio_logger=False)
+        control_handler.emitter = self.socketio.emit
+        
+        # Initialize components
+        self.setup_routes()
+        self.setup_socket_events()
+        
+        # Create necessary directories
+        self.create_directories()
+        
+        logger.success(f"{config.APP_NAME} v{config.VERSION} initialized")
+    
+    def create_directories(self):
+        """Create necessary directories"""
+        os.makedirs("static", exist_ok=True)
+        os.makedirs("templates", exist_ok=True)
+        os.makedirs("screenshots", exist_ok=True)
+        os.makedirs(config.RECORDINGS_DIR, exist_ok=True)
+        os.makedirs("qrcodes", exist_ok=True)
+        os.makedirs("static/qrcodes", exist_ok=True)
+    
+    def setup_routes(self):
         """Setup Flask routes"""
         
         @self.app.route('/')
@@ -425,80 +3774,27 @@ class MØNSTRApp:
         
         @self.app.route('/control')
         def control_panel():
-            """Control panel"""
-            return render_template('control.html')
+            """Control panel, with its key filled in for the desktop running the server"""
+            panel_key = config.PANEL_KEY if is_local_address(request.remote_addr) else ''
+            return render_template('control.html', panel_key=panel_key)
         
         @self.app.route('/generate_qr')
         def generate_qr():
             """Generate QR code for connection"""
-            try:
-                # Get server IP
-                try:
-                    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                    s.connect(("8.8.8.8", 80))
-                    server_ip = s.getsockname()[0]
-                    s.close()
-                except:
-                    server_ip = socket.gethostbyname(socket.gethostname())
-                    if server_ip.startswith("127."):
-                        server_ip = "localhost"
-            except:
-                server_ip = "localhost"
-            
-            # Generate token
             client_info = {
                 "device": "Android Device",
                 "user_agent": request.user_agent.string if request.user_agent else "Unknown",
                 "ip": request.remote_addr if request.remote_addr else "127.0.0.1"
             }
-            
-            token = connection_manager.generate_token(client_info)
-            
-            # Create connection URL
-            connection_url = f"http://{server_ip}:{config.WEB_PORT}/connect?token={token}"
-            
-            # Generate QR code
-            try:
-                qr = qrcode.QRCode(
-                    version=1,
-                    error_correction=qrcode.constants.ERROR_CORRECT_H,
-                    box_size=10,
-                    border=4,
-                )
-                qr.add_data(connection_url)
-                qr.make(fit=True)
-                
-                img = qr.make_image(fill_color="black", back_color="white")
-                
-                # Save QR code
-                qr_path = f"qrcodes/{token}.png"
-                img.save(qr_path)
-                
-                # Copy to static folder
-                static_qr_path = f"static/qrcodes/{token}.png"
-                img.save(static_qr_path)
-                
-                return jsonify({
-                    "success": True,
-                    "qr_url": f"/static/qrcodes/{token}.png",
-                    "connection_url": connection_url,
-                    "token": token,
-                    "server_ip": server_ip,
-                    "port": config.WEB_PORT
-                })
-            except Exception as e:
-                logger.error(f"QR generation error: {e}")
-                return jsonify({
-                    "success": False,
-                    "error": str(e)
-                })
+            return jsonify(create_connection(client_info))
         
         @self.app.route('/connect')
         def connect():
             """Mobile connection page"""
             token = request.args.get('token', '')
+            resume_key = request.args.get('resume', '')
             
-            if connection_manager.validate_token(token):
+            if connection_manager.validate_token(token) or (resume_key and connection_manager.can_resume(resume_key)):
                 return render_template('mobile.html', token=token)
             else:
                 return "Invalid or expired token", 403
@@ -506,20 +3802,33 @@ class MØNSTRApp:
         @self.app.route('/stream/<sid>')
         def video_stream(sid):
             """Video streaming endpoint"""
+            profile = frame_processor.resolve_profile(request.args.get('profile'))
+            
+            # Hand the viewer to a streaming worker process when they are running
+            worker_port = stream_workers.pick_port()
+            if worker_port:
+                return redirect(f"http://{host_without_port(request.host)}:{worker_port}/stream/{sid}?profile={profile}")
+            
             def generate():
-                while True:
-                    frame = connection_manager.get_frame(sid)
-                    if frame:
-                        try:
-                            processed_frame = frame_processor.process_frame(frame)
-                            yield (b'--frame\r\n'
-                                   b'Content-Type: image/jpeg\r\n\r\n' + 
-                                   processed_frame + b'\r\n')
-                        except Exception as e:
-                            logger.error(f"Stream generation error: {e}")
-                            break
-                    else:
-                        time.sleep(1 / config.FRAME_RATE)
+                last_seq = 0
+                viewer = str(next(viewer_ids))
+                if not connection_manager.add_viewer(sid, profile):
+                    return
+                
+                try:
+                    while connection_manager.is_streaming(sid):
+                        # Sleep until a new frame for this profile is published
+                        result = connection_manager.wait_frame(sid, last_seq, config.STREAM_WAIT_TIMEOUT, profile)
+                        if result:
+                            seq, frame = result
+                            record_viewer_frame(sid, profile, seq - last_seq - 1 if last_seq else 0, viewer)
+                            last_seq = seq
+                            yield mjpeg_part(sid, seq, frame)
+                except Exception as e:
+                    logger.error(f"Stream generation error: {e}")
+                finally:
+                    connection_manager.remove_viewer(sid, profile)
+                    forget_viewer(viewer)
             
             return Response(generate(),
                           mimetype='multipart/x-mixed-replace; boundary=frame')
@@ -536,22 +3845,117 @@ class MØNSTRApp:
         
         @self.app.route('/screenshot/<sid>')
         def take_screenshot(sid):
-            """Take screenshot of device"""
-            frame = connection_manager.get_frame(sid)
-            if frame:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"screenshots/{sid}_{timestamp}.jpg"
-                
-                with open(filename, 'wb') as f:
-                    f.write(frame)
-                
-                return jsonify({
-                    "success": True,
-                    "filename": filename,
-                    "timestamp": timestamp
-                })
+            """Take screenshot of device"""
+            return jsonify(screenshot_writer.capture(sid))
+        
+        @self.app.route('/screenshots', methods=['GET'])
+        def list_all_screenshots():
+            """List recent screenshots of all devices from the manifest"""
+            since, until, limit = parse_screenshot_query(request.args)
+            screenshots = screenshot_store.list(None, since, until, limit)
+            return jsonify({"success": True, "screenshots": screenshots, "count": len(screenshots)})
+        
+        @self.app.route('/screenshots', methods=['POST'])
+        def take_screenshots():
+            """Take screenshots of several devices (all when none are given)"""
+            sids = (request.get_json(silent=True) or {}).get('sids') or []
+            if not sids:
+                sids = [device["sid"] for device in connection_manager.get_connected_devices()]
+            
+            return jsonify({"success": True, "screenshots": screenshot_writer.capture_many(sids)})
+        
+        @self.app.route('/screenshot_status/<screenshot_id>')
+        def screenshot_status(screenshot_id):
+            """Get the state of a queued screenshot"""
+            status = screenshot_writer.get_status(screenshot_id)
+            if status is None:
+                return jsonify({"success": False, "error": "Unknown screenshot"}), 404
+            return jsonify(dict(status, success=True))
+        
+        @self.app.route('/screenshots/<sid>')
+        def list_screenshots(sid):
+            """List a device's screenshots from the manifest"""
+            since, until, limit = parse_screenshot_query(request.args)
+            screenshots = screenshot_store.list(sid, since, until, limit)
+            return jsonify({"success": True, "sid": sid, "screenshots": screenshots, "count": len(screenshots)})
+        
+        @self.app.route('/screenshot_file/<digest>')
+        def screenshot_file(digest):
+            """Serve a stored screenshot by content hash"""
+            path = screenshot_store.get_object(digest)
+            if path is None:
+                return jsonify({"success": False, "error": "Unknown screenshot"}), 404
+            # Objects never change, so clients may cache them forever
+            return send_file(os.path.abspath(path), mimetype='image/jpeg', max_age=31536000)
+        
+        @self.app.route('/record/start/<sid>', methods=['GET', 'POST'])
+        def start_recording(sid):
+            """Start recording a device session"""
+            return jsonify(recording_manager.start(sid))
+        
+        @self.app.route('/record/stop/<sid>', methods=['GET', 'POST'])
+        def stop_recording(sid):
+            """Stop recording a device session"""
+            return jsonify(recording_manager.stop(sid))
+        
+        @self.app.route('/recordings')
+        def list_recordings():
+            """List recorded sessions"""
+            return jsonify({"success": True, "recordings": recording_manager.list_sessions()})
+        
+        @self.app.route('/playback/<session_id>')
+        def playback_info(session_id):
+            """Recorded session metadata"""
+            playback = playback_library.open(session_id)
+            if playback is None:
+                return jsonify({"success": False, "error": "Unknown recording"}), 404
+            return jsonify(dict(playback.get_info(), success=True))
+        
+        @self.app.route('/playback/<session_id>/frame')
+        def playback_frame(session_id):
+            """Frame at t seconds into a recorded session"""
+            playback = playback_library.open(session_id)
+            result = playback.frame_at(parse_playback_args(request.args)[0]) if playback else None
+            if result is None:
+                return jsonify({"success": False, "error": "Unknown recording"}), 404
+            timestamp, frame = result
+            headers = {'X-Frame-Timestamp': str(timestamp)}
+            if playback.stopped:
+                # Frames of a session still recording can change as segments are re-mapped
+                headers['Cache-Control'] = 'max-age=3600'
+            return Response(frame, mimetype='image/jpeg', headers=headers)
+        
+        @self.app.route('/playback/<session_id>/stream')
+        def playback_stream(session_id):
+            """Replay a recorded session as MJPEG"""
+            playback = playback_library.open(session_id)
+            if playback is None:
+                return jsonify({"success": False, "error": "Unknown recording"}), 404
+            offset, speed = parse_playback_args(request.args)
+            
+            def generate():
+                try:
+                    for delay, frame in playback.replay(offset, speed):
+                        if delay:
+                            time.sleep(delay)
+                        yield (b'--frame\r\n'
+                               b'Content-Type: image/jpeg\r\n\r\n' + 
+                               frame + b'\r\n')
+                except Exception as e:
+                    logger.error(f"Playback error: {e}")
             
-            return jsonify({"success": False, "error": "No frame available"})
+            return Response(generate(),
+                          mimetype='multipart/x-mixed-replace; boundary=frame')
+        
+        @self.app.route('/metrics')
+        def get_metrics():
+            """Prometheus metrics"""
+            return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+        
+        @self.app.route('/metrics.json')
+        def get_metrics_summary():
+            """Metrics summary per device"""
+            return jsonify(dict(metrics.summary(), success=True))
         
         @self.app.route('/open_telegram')
         def open_telegram():
@@ -568,18 +3972,13 @@ class MØNSTRApp:
         @self.app.route('/system_info')
         def system_info():
             """Get system information"""
-            return jsonify({
-                "app_name": config.APP_NAME,
-                "version": config.VERSION,
-                "author": config.AUTHOR,
-                "uptime": time.time() - self.start_time if hasattr(self, 'start_time') else 0,
-                "connected_clients": len(connection_manager.clients),
-                "server_time": datetime.now().isoformat()
-            })
+            return jsonify(get_system_info(getattr(self, 'start_time', None)))
         
         @self.app.route('/send_command/<sid>', methods=['POST'])
         def send_command(sid):
             """Send command to device"""
+            if not panel_authorized(request.headers.get('X-Panel-Key')):
+                return jsonify({"success": False, "error": "Control panel key required"}), 403
             try:
                 data = request.json
                 command = data.get('command', '')
@@ -592,145 +3991,1384 @@ class MØNSTRApp:
             except Exception as e:
                 return jsonify({"success": False, "error": str(e)})
     
-    def setup_socket_events(self):
-        """Setup SocketIO events"""
-        
-        @self.socketio.on('connect')
-        def handle_connect():
-            """Handle client connection"""
-            logger.info(f"Client connected: {request.sid}")
-            emit('connected', {'sid': request.sid})
-        
-        @self.socketio.on('disconnect')
-        def handle_disconnect():
-            """Handle client disconnection"""
-            connection_manager.remove_client(request.sid)
-        
-        @self.socketio.on('authenticate')
-        def handle_authentication(data):
-            """Handle client authentication"""
-            token = data.get('token', '')
-            client_data = data.get('client_data', {})
-            
-            if connection_manager.validate_token(token):
-                connection_manager.add_client(request.sid, token, client_data)
-                emit('authenticated', {
-                    'success': True,
-                    'sid': request.sid,
-                    'message': 'Authentication successful'
-                })
-            else:
-                emit('authenticated', {
-                    'success': False,
-                    'message': 'Invalid token'
-                })
-        
-        @self.socketio.on('screen_data')
-        def handle_screen_data(data):
-            """Handle incoming screen data from mobile"""
-            sid = request.sid
-            frame_data = data.get('frame', '')
-            screen_info = data.get('screen_info', {})
+    def setup_socket_events(self):
+        """Setup SocketIO events"""
+        
+        @self.socketio.on('connect')
+        def handle_connect():
+            """Handle client connection"""
+            logger.info(f"Client connected: {request.sid}")
+            emit('connected', {'sid': request.sid})
+        
+        @self.socketio.on('disconnect')
+        def handle_disconnect():
+            """Handle client disconnection"""
+            disconnect_client(request.sid)
+        
+        @self.socketio.on('authenticate')
+        def handle_authentication(data):
+            """Handle client authentication"""
+            emit('authenticated', authenticate_client(request.sid, data))
+        
+        @self.socketio.on('screen_data')
+        def handle_screen_data(data):
+            """Handle incoming screen data from mobile"""
+            for event, payload in ingest_screen_data(request.sid, data):
+                emit(event, payload)
+            
+            # Acknowledge so the client can limit frames in flight
+            return True
+        
+        @self.socketio.on('screen_tiles')
+        def handle_screen_tiles(data):
+            """Handle changed tiles from mobile in delta mode"""
+            for event, payload in ingest_screen_tiles(request.sid, data):
+                emit(event, payload)
+            return True
+        
+        @self.socketio.on('control_ack')
+        def handle_control_ack(data):
+            """Handle a phone's ack for an applied control packet"""
+            acknowledge_control(data)
+        
+        # Control namespace: its own connection, so taps never queue behind frame uploads
+        @self.socketio.on('connect', namespace=config.CONTROL_NAMESPACE)
+        def handle_control_connect(auth=None):
+            """Handle control channel connection"""
+            return connect_control_channel(request.sid, auth)
+        
+        @self.socketio.on('disconnect', namespace=config.CONTROL_NAMESPACE)
+        def handle_control_disconnect(*args):
+            """Handle control channel disconnection"""
+            connection_manager.detach_control_channel(request.sid)
+        
+        @self.socketio.on('control', namespace=config.CONTROL_NAMESPACE)
+        def handle_channel_control(data):
+            """Handle control events on the control channel"""
+            dispatch_panel_control(request.sid, data)
+        
+        @self.socketio.on('control_batch', namespace=config.CONTROL_NAMESPACE)
+        def handle_channel_control_batch(data):
+            """Handle a batch of control events on the control channel"""
+            return dispatch_panel_control_batch(request.sid, data)
+        
+        @self.socketio.on('control_ack', namespace=config.CONTROL_NAMESPACE)
+        def handle_channel_control_ack(data):
+            """Handle a phone's ack on the control channel"""
+            acknowledge_control(data)
+        
+        @self.socketio.on('ping')
+        def handle_ping(data=None):
+            """Handle ping from clients, answering with clock sync times"""
+            emit('pong', sync_clock(request.sid, data))
+    
+    def run(self):
+        """Run the application"""
+        self.start_time = time.time()
+        
+        logger.info(f"Starting {config.APP_NAME} v{config.VERSION}")
+        logger.info(f"Author: {config.AUTHOR}")
+        logger.info(f"Telegram: {config.TELEGRAM_URL}")
+        logger.info(f"Instagram: {config.INSTAGRAM_URL}")
+        
+        print_server_info(get_server_ip(), "threading")
+        
+        try:
+            self.socketio.run(self.app, 
+                             host=config.HOST, 
+                             port=config.WEB_PORT,
+                             debug=False,
+                             allow_unsafe_werkzeug=True)
+        except Exception as e:
+            logger.error(f"Server error: {e}")
+            print(f"\nError: Failed to start server: {e}")
+            print(f"Check if port {config.WEB_PORT} is available.")
+
+class AsyncMØNSTRApp:
+    """Asyncio server mode: python-socketio AsyncServer behind uvicorn
+    
+    Socket events and HTTP routes are coroutines on one event loop, so an idle
+    MJPEG viewer or device socket costs a pending future instead of an OS thread.
+    """
+    
+    def __init__(self):
+        if not ASYNC_AVAILABLE:
+            raise ImportError("Asyncio mode requires: pip install python-socketio uvicorn jinja2")
+        
+        self.sio = python_socketio.AsyncServer(async_mode='asgi',
+                                               cors_allowed_origins="*",
+                                               ping_timeout=60,
+                                               ping_interval=25,
+                                               max_http_buffer_size=8 * 1024 * 1024,
+                                               logger=False,
+                                               engineio_logger=False)
+        self.asgi_app = python_socketio.ASGIApp(self.sio, other_asgi_app=self.http_app)
+        self.templates = jinja2.Environment(loader=jinja2.FileSystemLoader('templates'), autoescape=True)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.start_time: Optional[float] = None
+        control_handler.emitter = self.emit_threadsafe
+        
+        self.routes = [
+            ('GET', re.compile(r'^/$'), self.index),
+            ('GET', re.compile(r'^/control$'), self.control_panel),
+            ('GET', re.compile(r'^/generate_qr$'), self.generate_qr),
+            ('GET', re.compile(r'^/connect$'), self.connect),
+            ('GET', re.compile(r'^/stream/(?P<sid>[^/]+)$'), self.video_stream),
+            ('GET', re.compile(r'^/devices$'), self.get_devices),
+            ('GET', re.compile(r'^/screenshot/(?P<sid>[^/]+)$'), self.take_screenshot),
+            ('GET', re.compile(r'^/screenshots$'), self.list_all_screenshots),
+            ('POST', re.compile(r'^/screenshots$'), self.take_screenshots),
+            ('GET', re.compile(r'^/screenshot_status/(?P<screenshot_id>[^/]+)$'), self.screenshot_status),
+            ('GET', re.compile(r'^/screenshots/(?P<sid>[^/]+)$'), self.list_screenshots),
+            ('GET', re.compile(r'^/screenshot_file/(?P<digest>[^/]+)$'), self.screenshot_file),
+            ('GET', re.compile(r'^/system_info$'), self.system_info),
+            ('GET', re.compile(r'^/record/start/(?P<sid>[^/]+)$'), self.start_recording),
+            ('POST', re.compile(r'^/record/start/(?P<sid>[^/]+)$'), self.start_recording),
+            ('GET', re.compile(r'^/record/stop/(?P<sid>[^/]+)$'), self.stop_recording),
+            ('POST', re.compile(r'^/record/stop/(?P<sid>[^/]+)$'), self.stop_recording),
+            ('GET', re.compile(r'^/recordings$'), self.list_recordings),
+            ('GET', re.compile(r'^/metrics$'), self.get_metrics),
+            ('GET', re.compile(r'^/metrics\.json$'), self.get_metrics_summary),
+            ('GET', re.compile(r'^/playback/(?P<session_id>[^/]+)$'), self.playback_info),
+            ('GET', re.compile(r'^/playback/(?P<session_id>[^/]+)/frame$'), self.playback_frame),
+            ('GET', re.compile(r'^/playback/(?P<session_id>[^/]+)/stream$'), self.playback_stream),
+            ('GET', re.compile(r'^/open_telegram$'), self.open_telegram),
+            ('GET', re.compile(r'^/open_instagram$'), self.open_instagram),
+            ('POST', re.compile(r'^/send_command/(?P<sid>[^/]+)$'), self.send_command),
+            ('GET', re.compile(r'^/static/(?P<path>.+)$'), self.static_file),
+        ]
+        
+        self.setup_socket_events()
+        os.makedirs("static", exist_ok=True)
+        os.makedirs("templates", exist_ok=True)
+        os.makedirs("screenshots", exist_ok=True)
+        os.makedirs(config.RECORDINGS_DIR, exist_ok=True)
+        os.makedirs("qrcodes", exist_ok=True)
+        os.makedirs("static/qrcodes", exist_ok=True)
+        
+        logger.success(f"{config.APP_NAME} v{config.VERSION} initialized (asyncio mode)")
+    
+    def emit_threadsafe(self, event: str, data: Any = None, room: Optional[str] = None, namespace: Optional[str] = None):
+        """Emit from the event loop or from any worker thread"""
+        coroutine = self.sio.emit(event, data, to=room, namespace=namespace)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        
+        if running is self.loop:
+            self.loop.create_task(coroutine)
+        elif self.loop is not None:
+            asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        else:
+            coroutine.close()
+    
+    async def emit_events(self, sid: str, events: List[Tuple[str, Any]]):
+        """Send events returned by the shared ingest helpers back to a device"""
+        for event, payload in events:
+            await self.sio.emit(event, payload, to=sid)
+    
+    def setup_socket_events(self):
+        """Setup AsyncServer events"""
+        
+        @self.sio.on('connect')
+        async def handle_connect(sid, environ, auth=None):
+            """Handle client connection"""
+            self.loop = asyncio.get_running_loop()
+            logger.info(f"Client connected: {sid}")
+            await self.sio.emit('connected', {'sid': sid}, to=sid)
+        
+        @self.sio.on('disconnect')
+        async def handle_disconnect(sid, *args):
+            """Handle client disconnection"""
+            # Stopping a recording joins its writer and fsyncs, keep that off the loop
+            await asyncio.to_thread(disconnect_client, sid)
+        
+        @self.sio.on('authenticate')
+        async def handle_authentication(sid, data):
+            """Handle client authentication"""
+            await self.sio.emit('authenticated', authenticate_client(sid, data), to=sid)
+        
+        @self.sio.on('screen_data')
+        async def handle_screen_data(sid, data):
+            """Handle incoming screen data from mobile"""
+            if (config.DELTA_FRAMES and data.get('keyframe')) or config.PERCEPTUAL_DEDUP:
+                # Keyframe decoding and perceptual hashing are CPU-bound
+                events = await asyncio.to_thread(ingest_screen_data, sid, data)
+            else:
+                events = ingest_screen_data(sid, data)
+            await self.emit_events(sid, events)
+            return True
+        
+        @self.sio.on('screen_tiles')
+        async def handle_screen_tiles(sid, data):
+            """Handle changed tiles from mobile in delta mode"""
+            events = await asyncio.to_thread(ingest_screen_tiles, sid, data)
+            await self.emit_events(sid, events)
+            return True
+        
+        @self.sio.on('control_ack')
+        async def handle_control_ack(sid, data):
+            """Handle a phone's ack for an applied control packet"""
+            acknowledge_control(data)
+        
+        # Control namespace: its own connection, handled inline on the loop
+        # while frame decoding is pushed to worker threads
+        @self.sio.on('connect', namespace=config.CONTROL_NAMESPACE)
+        async def handle_control_connect(sid, environ, auth=None):
+            """Handle control channel connection"""
+            self.loop = asyncio.get_running_loop()
+            return connect_control_channel(sid, auth)
+        
+        @self.sio.on('disconnect', namespace=config.CONTROL_NAMESPACE)
+        async def handle_control_disconnect(sid, *args):
+            """Handle control channel disconnection"""
+            connection_manager.detach_control_channel(sid)
+        
+        @self.sio.on('control', namespace=config.CONTROL_NAMESPACE)
+        async def handle_channel_control(sid, data):
+            """Handle control events on the control channel"""
+            dispatch_panel_control(sid, data)
+        
+        @self.sio.on('control_batch', namespace=config.CONTROL_NAMESPACE)
+        async def handle_channel_control_batch(sid, data):
+            """Handle a batch of control events on the control channel"""
+            return dispatch_panel_control_batch(sid, data)
+        
+        @self.sio.on('control_ack', namespace=config.CONTROL_NAMESPACE)
+        async def handle_channel_control_ack(sid, data):
+            """Handle a phone's ack on the control channel"""
+            acknowledge_control(data)
+        
+        @self.sio.on('ping')
+        async def handle_ping(sid, data=None):
+            """Handle ping from clients, answering with clock sync times"""
+            await self.sio.emit('pong', sync_clock(sid, data), to=sid)
+    
+    async def http_app(self, scope, receive, send):
+        """Minimal ASGI router for the HTTP endpoints"""
+        self.loop = asyncio.get_running_loop()
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        
+        if scope['type'] != 'http':
+            return
+        
+        for method, pattern, handler in self.routes:
+            match = pattern.match(scope['path'])
+            if match and scope['method'] == method:
+                try:
+                    await handler(scope, receive, send, **match.groupdict())
+                except Exception as e:
+                    logger.error(f"Request error on {scope['path']}: {e}")
+                return
+        
+        await self.send_response(send, 404, b"Not Found", "text/plain")
+    
+    async def send_response(self, send, status: int, body: bytes, content_type: str,
+                            headers: Optional[List[Tuple[bytes, bytes]]] = None):
+        """Send a complete HTTP response"""
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', content_type.encode()),
+                (b'content-length', str(len(body)).encode()),
+                (b'access-control-allow-origin', b'*')
+            ] + (headers or [])
+        })
+        await send({'type': 'http.response.body', 'body': body})
+    
+    async def send_json(self, send, data: Dict, status: int = 200):
+        """Send a JSON response"""
+        await self.send_response(send, status, json.dumps(data).encode(), "application/json")
+    
+    async def render(self, send, template: str, **context):
+        """Render a template from the templates directory"""
+        html = self.templates.get_template(template).render(**context)
+        await self.send_response(send, 200, html.encode('utf-8'), "text/html; charset=utf-8")
+    
+    def query_args(self, scope) -> Dict[str, str]:
+        """Parse the query string of a request"""
+        return {key: values[0] for key, values in parse_qs(scope.get('query_string', b'').decode()).items()}
+    
+    async def read_body(self, receive) -> bytes:
+        """Read a full request body"""
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                return body
+    
+    @staticmethod
+    def read_file(path: str) -> bytes:
+        """Read a whole file, run through asyncio.to_thread"""
+        with open(path, 'rb') as f:
+            return f.read()
+    
+    async def index(self, scope, receive, send):
+        """Main page"""
+        await self.render(send, 'index.html')
+    
+    async def control_panel(self, scope, receive, send):
+        """Control panel, with its key filled in for the desktop running the server"""
+        client = scope.get('client') or ("", 0)
+        panel_key = config.PANEL_KEY if is_local_address(client[0]) else ''
+        await self.render(send, 'control.html', panel_key=panel_key)
+    
+    async def generate_qr(self, scope, receive, send):
+        """Generate QR code for connection"""
+        headers = dict(scope.get('headers', []))
+        client = scope.get('client') or ("127.0.0.1", 0)
+        client_info = {
+            "device": "Android Device",
+            "user_agent": headers.get(b'user-agent', b'Unknown').decode(errors='replace'),
+            "ip": client[0]
+        }
+        await self.send_json(send, await asyncio.to_thread(create_connection, client_info))
+    
+    async def connect(self, scope, receive, send):
+        """Mobile connection page"""
+        args = self.query_args(scope)
+        token = args.get('token', '')
+        resume_key = args.get('resume', '')
+        
+        if connection_manager.validate_token(token) or (resume_key and connection_manager.can_resume(resume_key)):
+            await self.render(send, 'mobile.html', token=token)
+        else:
+            await self.send_response(send, 403, b"Invalid or expired token", "text/plain")
+    
+    async def video_stream(self, scope, receive, send, sid: str):
+        """Video streaming endpoint"""
+        profile = frame_processor.resolve_profile(self.query_args(scope).get('profile'))
+        
+        # Hand the viewer to a streaming worker process when they are running
+        worker_port = stream_workers.pick_port()
+        if worker_port:
+            host = host_without_port(dict(scope.get('headers', [])).get(b'host', b'localhost').decode())
+            await send({
+                'type': 'http.response.start',
+                'status': 302,
+                'headers': [(b'location', f"http://{host}:{worker_port}/stream/{sid}?profile={profile}".encode()),
+                            (b'content-length', b'0')]
+            })
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        
+        if not connection_manager.add_viewer(sid, profile):
+            await self.send_response(send, 404, b"Unknown device", "text/plain")
+            return
+        
+        viewer = str(next(viewer_ids))
+        disconnected = asyncio.Event()
+        
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+        
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [(b'content-type', b'multipart/x-mixed-replace; boundary=frame'),
+                            (b'access-control-allow-origin', b'*')]
+            })
+            
+            last_seq = 0
+            while connection_manager.is_streaming(sid) and not disconnected.is_set():
+                # Await the next frame for this profile without holding a thread
+                result = await connection_manager.wait_frame_async(sid, last_seq, config.STREAM_WAIT_TIMEOUT, profile)
+                if result:
+                    seq, frame = result
+                    record_viewer_frame(sid, profile, seq - last_seq - 1 if last_seq else 0, viewer)
+                    last_seq = seq
+                    await send({
+                        'type': 'http.response.body',
+                        'body': mjpeg_part(sid, seq, frame),
+                        'more_body': True
+                    })
+            
+            await send({'type': 'http.response.body', 'body': b''})
+        except Exception as e:
+            logger.error(f"Stream generation error: {e}")
+        finally:
+            watcher.cancel()
+            connection_manager.remove_viewer(sid, profile)
+            forget_viewer(viewer)
+    
+    async def get_devices(self, scope, receive, send):
+        """Get connected devices"""
+        devices = connection_manager.get_connected_devices()
+        await self.send_json(send, {
+            "success": True,
+            "devices": devices,
+            "count": len(devices)
+        })
+    
+    async def take_screenshot(self, scope, receive, send, sid: str):
+        """Take screenshot of device"""
+        await self.send_json(send, screenshot_writer.capture(sid))
+    
+    async def take_screenshots(self, scope, receive, send):
+        """Take screenshots of several devices (all when none are given)"""
+        try:
+            sids = json.loads(await self.read_body(receive) or b'{}').get('sids') or []
+        except ValueError:
+            sids = []
+        if not sids:
+            sids = [device["sid"] for device in connection_manager.get_connected_devices()]
+        
+        await self.send_json(send, {"success": True, "screenshots": screenshot_writer.capture_many(sids)})
+    
+    async def screenshot_status(self, scope, receive, send, screenshot_id: str):
+        """Get the state of a queued screenshot"""
+        status = screenshot_writer.get_status(screenshot_id)
+        if status is None:
+            await self.send_json(send, {"success": False, "error": "Unknown screenshot"}, 404)
+            return
+        await self.send_json(send, dict(status, success=True))
+    
+    async def list_all_screenshots(self, scope, receive, send):
+        """List recent screenshots of all devices from the manifest"""
+        since, until, limit = parse_screenshot_query(self.query_args(scope))
+        screenshots = await asyncio.to_thread(screenshot_store.list, None, since, until, limit)
+        await self.send_json(send, {"success": True, "screenshots": screenshots, "count": len(screenshots)})
+    
+    async def list_screenshots(self, scope, receive, send, sid: str):
+        """List a device's screenshots from the manifest"""
+        since, until, limit = parse_screenshot_query(self.query_args(scope))
+        screenshots = await asyncio.to_thread(screenshot_store.list, sid, since, until, limit)
+        await self.send_json(send, {"success": True, "sid": sid, "screenshots": screenshots, "count": len(screenshots)})
+    
+    async def screenshot_file(self, scope, receive, send, digest: str):
+        """Serve a stored screenshot by content hash"""
+        path = screenshot_store.get_object(digest)
+        if path is None:
+            await self.send_json(send, {"success": False, "error": "Unknown screenshot"}, 404)
+            return
+        body = await asyncio.to_thread(self.read_file, path)
+        # Objects never change, so clients may cache them forever
+        await self.send_response(send, 200, body, "image/jpeg",
+                                 [(b'cache-control', b'max-age=31536000, immutable')])
+    
+    async def system_info(self, scope, receive, send):
+        """Get system information"""
+        await self.send_json(send, get_system_info(self.start_time))
+    
+    async def start_recording(self, scope, receive, send, sid: str):
+        """Start recording a device session"""
+        await self.send_json(send, await asyncio.to_thread(recording_manager.start, sid))
+    
+    async def stop_recording(self, scope, receive, send, sid: str):
+        """Stop recording a device session"""
+        # Stopping joins the writer thread while it flushes
+        await self.send_json(send, await asyncio.to_thread(recording_manager.stop, sid))
+    
+    async def list_recordings(self, scope, receive, send):
+        """List recorded sessions"""
+        await self.send_json(send, {"success": True, "recordings": await asyncio.to_thread(recording_manager.list_sessions)})
+    
+    async def playback_info(self, scope, receive, send, session_id: str):
+        """Recorded session metadata"""
+        playback = await asyncio.to_thread(playback_library.open, session_id)
+        if playback is None:
+            await self.send_json(send, {"success": False, "error": "Unknown recording"}, 404)
+            return
+        await self.send_json(send, dict(await asyncio.to_thread(playback.get_info), success=True))
+    
+    async def playback_frame(self, scope, receive, send, session_id: str):
+        """Frame at t seconds into a recorded session"""
+        playback = await asyncio.to_thread(playback_library.open, session_id)
+        offset = parse_playback_args(self.query_args(scope))[0]
+        # Page faults on the mapping may hit the disk, keep them off the loop
+        result = await asyncio.to_thread(playback.frame_at, offset) if playback else None
+        if result is None:
+            await self.send_json(send, {"success": False, "error": "Unknown recording"}, 404)
+            return
+        timestamp, frame = result
+        headers = [(b'x-frame-timestamp', str(timestamp).encode())]
+        if playback.stopped:
+            # Frames of a session still recording can change as segments are re-mapped
+            headers.append((b'cache-control', b'max-age=3600'))
+        await self.send_response(send, 200, frame, "image/jpeg", headers)
+    
+    async def playback_stream(self, scope, receive, send, session_id: str):
+        """Replay a recorded session as MJPEG"""
+        playback = await asyncio.to_thread(playback_library.open, session_id)
+        if playback is None:
+            await self.send_json(send, {"success": False, "error": "Unknown recording"}, 404)
+            return
+        offset, speed = parse_playback_args(self.query_args(scope))
+        
+        disconnected = asyncio.Event()
+        
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+        
+        watcher = asyncio.ensure_future(watch_disconnect())
+        frames = playback.replay(offset, speed)
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [(b'content-type', b'multipart/x-mixed-replace; boundary=frame'),
+                            (b'access-control-allow-origin', b'*')]
+            })
+            
+            while not disconnected.is_set():
+                step = await asyncio.to_thread(next, frames, None)
+                if step is None:
+                    break
+                delay, frame = step
+                if delay:
+                    await asyncio.sleep(delay)
+                await send({
+                    'type': 'http.response.body',
+                    'body': b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + frame + b'\r\n',
+                    'more_body': True
+                })
+            
+            await send({'type': 'http.response.body', 'body': b''})
+        except Exception as e:
+            logger.error(f"Playback error: {e}")
+        finally:
+            watcher.cancel()
+    
+    async def get_metrics(self, scope, receive, send):
+        """Prometheus metrics"""
+        await self.send_response(send, 200, metrics.render_prometheus().encode(), "text/plain; version=0.0.4")
+    
+    async def get_metrics_summary(self, scope, receive, send):
+        """Metrics summary per device"""
+        await self.send_json(send, dict(metrics.summary(), success=True))
+    
+    async def open_telegram(self, scope, receive, send):
+        """Open Telegram profile"""
+        webbrowser.open(config.TELEGRAM_URL)
+        await self.send_json(send, {"success": True, "url": config.TELEGRAM_URL})
+    
+    async def open_instagram(self, scope, receive, send):
+        """Open Instagram profile"""
+        webbrowser.open(config.INSTAGRAM_URL)
+        await self.send_json(send, {"success": True, "url": config.INSTAGRAM_URL})
+    
+    async def send_command(self, scope, receive, send, sid: str):
+        """Send command to device"""
+        headers = dict(scope.get('headers', []))
+        if not panel_authorized(headers.get(b'x-panel-key', b'').decode(errors='replace')):
+            await self.send_json(send, {"success": False, "error": "Control panel key required"}, 403)
+            return
+        try:
+            data = json.loads(await self.read_body(receive) or b'{}')
+            command = data.get('command', '')
+            
+            if command:
+                control_handler.handle_command(sid, command)
+                await self.send_json(send, {"success": True})
+                return
+            
+            await self.send_json(send, {"success": False})
+        except Exception as e:
+            await self.send_json(send, {"success": False, "error": str(e)})
+    
+    async def static_file(self, scope, receive, send, path: str):
+        """Serve files from the static folder"""
+        root = os.path.abspath("static")
+        full_path = os.path.abspath(os.path.join(root, path))
+        if not full_path.startswith(root + os.sep) or not os.path.isfile(full_path):
+            await self.send_response(send, 404, b"Not Found", "text/plain")
+            return
+        
+        body = await asyncio.to_thread(self.read_file, full_path)
+        content_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+        await self.send_response(send, 200, body, content_type)
+    
+    def run(self):
+        """Run the application on uvicorn"""
+        self.start_time = time.time()
+        
+        logger.info(f"Starting {config.APP_NAME} v{config.VERSION} (asyncio mode)")
+        print_server_info(get_server_ip(), "asyncio")
+        
+        try:
+            uvicorn.run(self.asgi_app,
+                        host=config.HOST,
+                        port=config.WEB_PORT,
+                        log_level="warning",
+                        lifespan="on")
+        except Exception as e:
+            logger.error(f"Server error: {e}")
+            print(f"\nError: Failed to start server: {e}")
+            print(f"Check if port {config.WEB_PORT} is available.")
+
+def benchmark_frames(source: Optional[str], count: int) -> List[bytes]:
+    """JPEG frames for simulated devices
+    
+    source is a directory of .jpg files or a recorded session; without one,
+    synthetic frames with a moving block and changing text are rendered.
+    """
+    if source and os.path.isdir(source):
+        files = sorted(name for name in os.listdir(source) if name.lower().endswith(('.jpg', '.jpeg')))
+        if files:
+            frames = []
+            for name in files[:count]:
+                with open(os.path.join(source, name), 'rb') as f:
+                    frames.append(f.read())
+            return frames
+    
+    if source:
+        recordings_dir, session_id = os.path.split(os.path.normpath(source))
+        config.RECORDINGS_DIR = recordings_dir or config.RECORDINGS_DIR
+        playback = SessionPlayback(session_id)
+        frames = []
+        position = playback.locate(playback.start)
+        while position is not None and len(frames) < count:
+            frames.append(playback.read(position)[1])
+            position = playback.next_position(position)
+        return frames
+    
+    width, height = config.BENCHMARK_FRAME_SIZE
+    background = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    frames = []
+    for i in range(count):
+        image = background.copy()
+        draw = ImageDraw.Draw(image)
+        top = (i * 37) % (height - 120)
+        draw.rectangle([20, top, width - 20, top + 120], fill=((i * 50) % 256, 80, 200 - i % 100))
+        for line in range(12):
+            draw.text((30, 40 + line * 60), f"frame {i} line {line} " * 3, fill=(255, 255, 255))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=70)
+        frames.append(buffer.getvalue())
+    return frames
+
+class BenchmarkDevice:
+    """Simulated phone: authenticates with a token and pushes frames at a fixed rate"""
+    
+    def __init__(self, url: str, token: str, index: int, frames: List[bytes], fps: float):
+        self.url = url
+        self.token = token
+        self.index = index
+        self.frames = frames
+        self.fps = fps
+        self.sid: Optional[str] = None
+        self.counts = {"sent": 0, "acked": 0, "skipped": 0, "controls": 0}
+        self.in_flight = 0
+        self.lock = threading.Condition()
+        self.authenticated = threading.Event()
+        self.client = python_socketio.Client(reconnection=False)
+        self.client.on('authenticated', self._on_authenticated)
+        self.client.on('control_event', self._on_control)
+        self.client.on('control_batch', lambda batch: self._on_control(batch, len(batch.get('events', []))))
+        
+    def _on_authenticated(self, data: Dict):
+        if data.get('success'):
+            self.sid = data['sid']
+            self.authenticated.set()
+    
+    def _on_control(self, data: Dict, events: int = 1):
+        with self.lock:
+            self.counts["controls"] += events
+    
+    def _on_ack(self, *args):
+        with self.lock:
+            self.in_flight -= 1
+            self.counts["acked"] += 1
+            self.lock.notify_all()
+    
+    def connect(self, client_data: Optional[Dict] = None) -> bool:
+        """Connect and authenticate, returns False on failure"""
+        self.client.connect(self.url, transports=['websocket'])
+        self.client.emit('authenticate', {'token': self.token,
+                                          'client_data': client_data or {'device': f"benchmark-{self.index}"}})
+        if not self.authenticated.wait(10):
+            return False
+        # Same host, so the clocks agree
+        self.client.emit('ping', {'t0': time.time() * 1000, 'offset': 0, 'rtt': 0})
+        return True
+    
+    def send(self, event: str, data: Dict, block: bool = True) -> bool:
+        """Emit a frame event, waiting (or giving up) while too many are unacked"""
+        with self.lock:
+            while self.in_flight >= config.BENCHMARK_MAX_IN_FLIGHT:
+                if not block:
+                    self.counts["skipped"] += 1
+                    return False
+                self.lock.wait(1)
+            self.in_flight += 1
+            self.counts["sent"] += 1
+        self.client.emit(event, data, callback=self._on_ack)
+        return True
+    
+    def drain(self, timeout: float):
+        """Wait for the acks of frames still in flight"""
+        deadline = time.time() + timeout
+        with self.lock:
+            while self.in_flight and time.time() < deadline:
+                self.lock.wait(0.1)
+    
+    def run(self, stop: threading.Event):
+        """Send frames until stopped, skipping ticks while too many are unacked"""
+        interval = 1 / self.fps
+        next_tick = time.time()
+        capture_seq = 0
+        while not stop.is_set():
+            sent = self.send('screen_data', {
+                'frame': self.frames[(capture_seq + 1 + self.index) % len(self.frames)],
+                'captured_at': time.time() * 1000,
+                'capture_seq': capture_seq + 1,
+                'screen_info': {'width': config.BENCHMARK_FRAME_SIZE[0], 'height': config.BENCHMARK_FRAME_SIZE[1]}
+            }, block=False)
+            if sent:
+                capture_seq += 1
+            
+            next_tick += interval
+            delay = next_tick - time.time()
+            if delay > 0:
+                stop.wait(delay)
+            else:
+                # Fell behind, don't burst to catch up
+                next_tick = time.time()
+    
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return dict(self.counts)
+    
+    def close(self):
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+
+class BenchmarkViewer:
+    """Simulated control panel: reads one MJPEG stream and sends control events"""
+    
+    def __init__(self, url: str, sid: str, profile: str, control_rate: float, panel_key: str):
+        self.url = url
+        self.sid = sid
+        self.profile = profile
+        self.control_rate = control_rate
+        self.panel_key = panel_key
+        self.counts = {"frames": 0, "bytes": 0, "controls": 0}
+        self.latencies: List[float] = []
+        self.measuring = False
+        self.lock = threading.Lock()
+        self.client = python_socketio.Client(reconnection=False) if control_rate else None
+        
+    def run(self, stop: threading.Event):
+        """Read frames until stopped, timing capture to arrival"""
+        host, port = self.url.split("//", 1)[1].rsplit(":", 1)
+        conn = http.client.HTTPConnection(host, int(port), timeout=10)
+        conn.request('GET', f"/stream/{self.sid}?profile={self.profile}")
+        response = conn.getresponse()
+        try:
+            while not stop.is_set():
+                line = response.readline()
+                if not line:
+                    break
+                if line.strip() != b'--frame':
+                    continue
+                headers = {}
+                while True:
+                    line = response.readline().strip()
+                    if not line:
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                frame = response.read(int(headers['content-length']))
+                arrived = time.time()
+                with self.lock:
+                    self.counts["frames"] += 1
+                    self.counts["bytes"] += len(frame)
+                    if self.measuring and 'x-capture-timestamp' in headers:
+                        self.latencies.append(arrived - float(headers['x-capture-timestamp']))
+        except (OSError, KeyError, ValueError):
+            pass
+        finally:
+            conn.close()
+    
+    def run_control(self, stop: threading.Event):
+        """Drag the pointer around with a click every 20 events"""
+        self.client.connect(self.url, namespaces=[config.CONTROL_NAMESPACE], transports=['websocket'],
+                            auth={'panel_key': self.panel_key})
+        interval = 1 / self.control_rate
+        step = 0
+        while not stop.wait(interval):
+            step += 1
+            x, y = (step * 7) % 100, (step * 13) % 100
+            action = ("down", "up")[step // 20 % 2] if step % 20 == 0 else "move"
+            self.client.emit('control', {'sid': self.sid, 'type': 'mouse',
+                                         'data': {'type': action, 'x': x, 'y': y}},
+                             namespace=config.CONTROL_NAMESPACE)
+            with self.lock:
+                self.counts["controls"] += 1
+    
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return dict(self.counts)
+    
+    def close(self):
+        if self.client:
+            try:
+                self.client.disconnect()
+            except Exception:
+                pass
+
+def _latency_summary(values: List[float]) -> Dict:
+    """Percentiles in milliseconds of unsorted seconds"""
+    values = sorted(values)
+    return {
+        "samples": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p90_ms": round(percentile(values, 90) * 1000, 1),
+        "p99_ms": round(percentile(values, 99) * 1000, 1)
+    }
+
+def _benchmark_load(url: str, tokens: List[str], options: Dict) -> Dict:
+    """Run the simulated devices and viewers, in their own process so they don't skew server CPU"""
+    if not ASYNC_AVAILABLE:
+        raise ImportError("Benchmark requires: pip install python-socketio websocket-client")
+    
+    frames = benchmark_frames(options["frames"], config.BENCHMARK_FRAME_COUNT)
+    devices = [BenchmarkDevice(url, token, i, frames, options["fps"]) for i, token in enumerate(tokens)]
+    for device in devices:
+        if not device.connect():
+            raise RuntimeError(f"Device {device.index} failed to authenticate")
+    
+    viewers = [BenchmarkViewer(url, devices[i % len(devices)].sid, options["profile"], options["control_rate"],
+                               options["panel_key"])
+               for i in range(options["viewers"])]
+    
+    stop = threading.Event()
+    threads = [threading.Thread(target=device.run, args=(stop,), daemon=True) for device in devices]
+    threads += [threading.Thread(target=viewer.run, args=(stop,), daemon=True) for viewer in viewers]
+    threads += [threading.Thread(target=viewer.run_control, args=(stop,), daemon=True)
+                for viewer in viewers if viewer.client]
+    for thread in threads:
+        thread.start()
+    
+    # Counters are compared between the end of the warmup and the end of the run
+    time.sleep(options["warmup"])
+    for viewer in viewers:
+        viewer.measuring = True
+    started = time.time()
+    device_start = [device.snapshot() for device in devices]
+    viewer_start = [viewer.snapshot() for viewer in viewers]
+    time.sleep(options["duration"])
+    elapsed = time.time() - started
+    device_end = [device.snapshot() for device in devices]
+    viewer_end = [viewer.snapshot() for viewer in viewers]
+    
+    stop.set()
+    for client in devices + viewers:
+        client.close()
+    for thread in threads:
+        thread.join(2)
+    
+    def delta(end, start):
+        return {key: end[key] - start[key] for key in end}
+    
+    device_counts = [delta(end, start) for end, start in zip(device_end, device_start)]
+    viewer_counts = [delta(end, start) for end, start in zip(viewer_end, viewer_start)]
+    acked = {device.sid: counts["acked"] for device, counts in zip(devices, device_counts)}
+    expected = sum(acked[viewer.sid] for viewer in viewers)
+    received = sum(counts["frames"] for counts in viewer_counts)
+    
+    sent_fps = [counts["acked"] / elapsed for counts in device_counts]
+    viewer_fps = [counts["frames"] / elapsed for counts in viewer_counts]
+    return {
+        "elapsed": round(elapsed, 2),
+        "frame_bytes_avg": sum(len(frame) for frame in frames) // len(frames),
+        "devices": {
+            "count": len(devices),
+            "fps_target": options["fps"],
+            "fps_avg": round(sum(sent_fps) / len(sent_fps), 2),
+            "fps_min": round(min(sent_fps), 2),
+            "frames_acked": sum(counts["acked"] for counts in device_counts),
+            "ticks_skipped": sum(counts["skipped"] for counts in device_counts),
+            "sids": [device.sid for device in devices]
+        },
+        "viewers": {
+            "count": len(viewers),
+            "fps_avg": round(sum(viewer_fps) / len(viewer_fps), 2) if viewers else 0.0,
+            "fps_min": round(min(viewer_fps), 2) if viewers else 0.0,
+            "frames": received,
+            "drop_rate": round(max(0.0, 1 - received / expected), 4) if expected else 0.0,
+            "mbit_per_second": round(sum(counts["bytes"] for counts in viewer_counts) * 8 / elapsed / 1e6, 2),
+            "capture_to_viewer": _latency_summary([value for viewer in viewers for value in viewer.latencies])
+        },
+        "control": {
+            "sent": sum(counts["controls"] for counts in viewer_counts),
+            "delivered": sum(counts["controls"] for counts in device_counts)
+        }
+    }
+
+def _wait_for_port(port: int, timeout: float) -> bool:
+    """Wait until something listens on a local port"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+def _fetch_json(url: str, path: str) -> Dict:
+    host, port = url.split("//", 1)[1].rsplit(":", 1)
+    conn = http.client.HTTPConnection(host, int(port), timeout=10)
+    try:
+        conn.request('GET', path)
+        return json.loads(conn.getresponse().read())
+    finally:
+        conn.close()
+
+def start_local_server(server_mode: str) -> Optional[str]:
+    """Run the server in this process on a free localhost port, returns its URL"""
+    probe = socket.socket()
+    probe.bind(("127.0.0.1", 0))
+    config.WEB_PORT = probe.getsockname()[1]
+    probe.close()
+    config.HOST = "127.0.0.1"
+    logger.level = logger.LEVELS["WARNING"]
+    
+    create_templates()
+    app = AsyncMØNSTRApp() if server_mode == "asyncio" else MØNSTRApp()
+    threading.Thread(target=app.run, daemon=True).start()
+    if not _wait_for_port(config.WEB_PORT, 15):
+        print(f"[ERROR] Server did not start on port {config.WEB_PORT}")
+        return None
+    return f"http://127.0.0.1:{config.WEB_PORT}"
+
+def issue_token(url: str, local: bool, device: str) -> str:
+    """Device token from the in-process server, or from /generate_qr of a remote one"""
+    if local:
+        return connection_manager.generate_token({"device": device})
+    return _fetch_json(url, '/generate_qr')['token']
+
+def run_benchmark(args: argparse.Namespace) -> bool:
+    """Load test one server with simulated devices and viewers, printing a JSON report
+    
+    Without --url the server is started in this process on a free port and
+    the simulated clients run in a child process, so the CPU and memory
+    sampled from /system_info belong to the server alone.
+    """
+    if args.url and args.control_rate and not args.panel_key:
+        print("[ERROR] --panel-key is required to send control events to --url (or use --control-rate 0)")
+        return False
+    url = args.url.rstrip('/') if args.url else start_local_server(args.server_mode)
+    if url is None:
+        return False
+    tokens = [issue_token(url, args.url is None, f"benchmark-{i}") for i in range(args.devices)]
+    
+    # The load runs in a spawned process, which has a PANEL_KEY of its own
+    options = {"fps": args.fps, "viewers": args.viewers, "profile": args.profile, "frames": args.frames,
+               "control_rate": args.control_rate, "warmup": args.warmup, "duration": args.duration,
+               "panel_key": args.panel_key or config.PANEL_KEY}
+    samples = []
+    latency: Dict[str, Dict] = {}
+    started_at = datetime.now().isoformat()
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        job = pool.submit(_benchmark_load, url, tokens, options)
+        measure_from = time.time() + args.warmup
+        while not job.done():
+            usage = _fetch_json(url, '/system_info').get('process', {})
+            if time.time() >= measure_from:
+                samples.append((time.time(), usage.get('cpu_seconds'), usage.get('rss_bytes')))
+                # Devices are forgotten once they disconnect, keep their last stats
+                latency.update((device["sid"], device.get("latency") or {})
+                               for device in _fetch_json(url, '/devices').get('devices', []))
+            time.sleep(config.BENCHMARK_SAMPLE_INTERVAL)
+        try:
+            load = job.result()
+        except Exception as e:
+            print(f"[ERROR] Benchmark load failed: {e}")
+            return False
+    
+    server = {}
+    if len(samples) >= 2 and samples[0][1] is not None:
+        cpu_percent = (samples[-1][1] - samples[0][1]) / (samples[-1][0] - samples[0][0]) * 100
+        server["cpu_percent"] = round(cpu_percent, 1)
+        server["cpu_percent_per_device"] = round(cpu_percent / args.devices, 2)
+    rss = [sample[2] for sample in samples if sample[2]]
+    if rss:
+        server["rss_mb_start"] = round(rss[0] / 1024 / 1024, 1)
+        server["rss_mb_peak"] = round(max(rss) / 1024 / 1024, 1)
+        server["rss_mb_end"] = round(rss[-1] / 1024 / 1024, 1)
+    
+    # Server side latency per stage: median of device medians, worst device tail
+    stats = [latency[sid] for sid in load["devices"].pop("sids") if sid in latency]
+    for stage in FrameLatencyTracker.STAGES:
+        stages = [stat[stage] for stat in stats if stat.get(stage, {}).get("samples")]
+        if stages:
+            p50 = sorted(stage_stats["p50_ms"] for stage_stats in stages)
+            server[stage] = {"p50_ms": percentile(p50, 50),
+                             "p99_ms": max(stage_stats["p99_ms"] for stage_stats in stages)}
+    
+    report = {
+        "benchmark": {
+            "target": url if args.url else f"in-process ({args.server_mode})",
+            "devices": args.devices,
+            "viewers": args.viewers,
+            "fps": args.fps,
+            "profile": args.profile,
+            "frames": args.frames or "synthetic",
+            "frame_bytes_avg": load.pop("frame_bytes_avg"),
+            "warmup": args.warmup,
+            "duration": load.pop("elapsed"),
+            "started_at": started_at
+        },
+        **load,
+        "server": server
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    print(output)
+    return True
+
+def _microbench_device(sid: str):
+    """Register a fake device on the global singletons, returns its cleanup"""
+    connection_manager.add_client(sid, "microbench", {"device": "microbench"})
+    stream_controller.register(sid)
+    return lambda: disconnect_client(sid)
+
+def _microbench_add_frame(frames: List[bytes]):
+    """ConnectionManager.add_frame while viewer threads wait on the same buffer"""
+    manager = ConnectionManager()
+    manager.add_client("microbench", "microbench", {"device": "microbench"})
+    stop = threading.Event()
+    
+    def viewer():
+        last_seq = 0
+        while not stop.is_set():
+            result = manager.wait_frame("microbench", last_seq, 0.1)
+            if result:
+                last_seq = result[0]
+    
+    threads = [threading.Thread(target=viewer, daemon=True) for _ in range(config.MICROBENCH_VIEWERS)]
+    for thread in threads:
+        thread.start()
+    cycle = itertools.cycle(frames)
+    
+    def cleanup():
+        stop.set()
+        for thread in threads:
+            thread.join()
+        manager.remove_client("microbench")
+    
+    return lambda: manager.add_frame("microbench", next(cycle)), cleanup
+
+def _microbench_get_frame(frames: List[bytes]):
+    """ConnectionManager.get_frame while a writer thread keeps publishing"""
+    manager = ConnectionManager()
+    manager.add_client("microbench", "microbench", {"device": "microbench"})
+    stop = threading.Event()
+    
+    def writer():
+        for frame in itertools.cycle(frames):
+            if stop.wait(0.001):
+                break
+            manager.add_frame("microbench", frame)
+    
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+    
+    def cleanup():
+        stop.set()
+        thread.join()
+        manager.remove_client("microbench")
+    
+    return lambda: manager.get_frame("microbench"), cleanup
+
+def _microbench_ingest(frames: List[bytes], encode: bool):
+    """ingest_screen_data for binary frames or base64 data URLs, alternating frames so none is a duplicate"""
+    cleanup = _microbench_device("microbench-ingest")
+    if encode:
+        frames = ["data:image/jpeg;base64," + base64.b64encode(frame).decode() for frame in frames]
+    packets = itertools.cycle([{"frame": frame, "screen_info": {}} for frame in frames])
+    return lambda: ingest_screen_data("microbench-ingest", next(packets)), cleanup
+
+def _microbench_process_frame(frames: List[bytes]):
+    """SimpleFrameProcessor.process_frame to the medium profile, uncached"""
+    cycle = itertools.cycle(frames)
+    return lambda: frame_processor.process_frame(next(cycle), "medium"), None
+
+def _microbench_mjpeg_part(frames: List[bytes]):
+    """MJPEG part assembly as written by the /stream loops"""
+    cleanup = _microbench_device("microbench-part")
+    frame_latency.update_clock("microbench-part", 0.0, 0.0)
+    frame_latency.ingested("microbench-part", 1, time.time() * 1000, 1)
+    return lambda: mjpeg_part("microbench-part", 1, frames[0]), cleanup
+
+def _microbench_mouse_event(frames: List[bytes]):
+    """ControlHandler.handle_mouse_event with a no-op transport"""
+    cleanup = _microbench_device("microbench-control")
+    emitter = control_handler.emitter
+    control_handler.emitter = lambda *args, **kwargs: None
+    events = itertools.cycle([{"type": "move", "x": x % 100, "y": (x * 7) % 100} for x in range(100)])
+    
+    def restore():
+        control_handler.emitter = emitter
+        cleanup()
+    
+    return lambda: control_handler.handle_mouse_event("microbench-control", next(events)), restore
+
+MICROBENCHMARKS = OrderedDict([
+    ("add_frame_contended", _microbench_add_frame),
+    ("get_frame_contended", _microbench_get_frame),
+    ("ingest_screen_data_base64", lambda frames: _microbench_ingest(frames, True)),
+    ("ingest_screen_data_binary", lambda frames: _microbench_ingest(frames, False)),
+    ("process_frame", _microbench_process_frame),
+    ("mjpeg_part", _microbench_mjpeg_part),
+    ("handle_mouse_event", _microbench_mouse_event)
+])
+
+def time_operation(operation, min_time: float, repeat: int) -> Dict:
+    """Time an operation in rounds of at least min_time seconds, per call in microseconds"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            operation()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time / 10:
+            break
+        number *= 10
+    number = max(1, int(number * min_time / elapsed))
+    
+    rounds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            operation()
+        rounds.append((time.perf_counter() - started) / number * 1e6)
+    rounds.sort()
+    return {
+        "median_us": round(rounds[len(rounds) // 2], 3),
+        "min_us": round(rounds[0], 3),
+        "max_us": round(rounds[-1], 3),
+        "number": number,
+        "repeat": repeat
+    }
+
+def run_microbenchmarks(args: argparse.Namespace) -> bool:
+    """Run the hot path micro-benchmarks, optionally saving or comparing a baseline
+    
+    Returns False when --compare finds a benchmark whose median got slower
+    than the baseline by more than the threshold.
+    """
+    names = args.benchmarks or list(MICROBENCHMARKS)
+    unknown = [name for name in names if name not in MICROBENCHMARKS]
+    if unknown:
+        print(f"[ERROR] Unknown benchmarks: {', '.join(unknown)} (choose from {', '.join(MICROBENCHMARKS)})")
+        return False
+    
+    # Sampled log lines would otherwise flood the console during the runs
+    logger.level = logger.LEVELS["WARNING"]
+    frames = benchmark_frames(None, 4)
+    results = {}
+    for name in names:
+        operation, cleanup = MICROBENCHMARKS[name](frames)
+        try:
+            results[name] = time_operation(operation, args.min_time, args.repeat)
+        finally:
+            if cleanup:
+                cleanup()
+        print(f"[INFO] {name:<28} {results[name]['median_us']:>12.2f} us  "
+              f"(min {results[name]['min_us']:.2f}, x{results[name]['number']})")
+    
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "cpu_count": os.cpu_count(),
+        "results": results
+    }
+    
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f).get("results", {})
+        # Re-running a subset only replaces those entries
+        report["results"] = dict(baseline, **results)
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"[SUCCESS] Baseline saved: {args.baseline}")
+    
+    if not args.compare:
+        return True
+    
+    # Timings only mean something against the same machine, so no baseline
+    # ships with the repo; a fresh checkout reports that instead of failing
+    if not os.path.exists(args.baseline):
+        print(f"[WARNING] No baseline at {args.baseline}, nothing to compare against. "
+              f"Create one with: python monstr_m1nd.py microbench --save")
+        return True
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] Cannot read baseline {args.baseline}: {e}")
+        return False
+    if (baseline.get("python"), baseline.get("platform")) != (report["python"], report["platform"]):
+        print(f"[WARNING] Baseline is from Python {baseline.get('python')} on {baseline.get('platform')}")
+    
+    regressions = []
+    print(f"\n{'benchmark':<28} {'baseline us':>12} {'current us':>12} {'change':>8}")
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            print(f"{name:<28} {'-':>12} {result['median_us']:>12.2f}      new")
+            continue
+        change = result["median_us"] / previous["median_us"] - 1
+        flag = "  REGRESSION" if change > args.threshold else ""
+        print(f"{name:<28} {previous['median_us']:>12.2f} {result['median_us']:>12.2f} {change:>+8.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    
+    if regressions:
+        print(f"[ERROR] {len(regressions)} benchmark(s) slower than baseline by more than "
+              f"{args.threshold:.0%}: {', '.join(regressions)}")
+        return False
+    print(f"[SUCCESS] No regressions beyond {args.threshold:.0%}")
+    return True
+
+def replay_capture(args: argparse.Namespace) -> bool:
+    """Feed a traffic capture back into a server, printing a JSON report
+    
+    Each captured device gets a new simulated device connection and the
+    control events are sent from one simulated control panel with the sids
+    mapped. --speed scales the captured timing, --fast sends as fast as the
+    server acks frames.
+    """
+    if not ASYNC_AVAILABLE:
+        print("[ERROR] Replay requires: pip install python-socketio websocket-client")
+        return False
+    try:
+        records = TrafficCapture.read(args.capture)
+        first = next(records, None)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] Cannot read capture {args.capture}: {e}")
+        return False
+    if first is None:
+        print(f"[ERROR] Capture {args.capture} is empty")
+        return False
+    
+    if args.url and not args.panel_key:
+        print("[ERROR] --panel-key is required to replay control events into --url")
+        return False
+    url = args.url.rstrip('/') if args.url else start_local_server(args.server_mode)
+    if url is None:
+        return False
+    panel = python_socketio.Client(reconnection=False)
+    try:
+        panel.connect(url, namespaces=[config.CONTROL_NAMESPACE], transports=['websocket'],
+                      auth={'panel_key': args.panel_key or config.PANEL_KEY})
+    except python_socketio.exceptions.ConnectionError as e:
+        print(f"[ERROR] Control panel connection refused: {e}")
+        return False
+    
+    devices: Dict[int, BenchmarkDevice] = {}
+    
+    def device_for(number: int, client_data: Optional[Dict] = None) -> BenchmarkDevice:
+        device = devices.get(number)
+        if device is None:
+            device = BenchmarkDevice(url, issue_token(url, args.url is None, f"replay-{number}"), number, [], 0)
+            if not device.connect(client_data):
+                raise RuntimeError(f"Replayed device {number} failed to authenticate")
+            devices[number] = device
+        return device
+    
+    speed = 0.0 if args.fast else args.speed
+    counts: Dict[str, int] = {}
+    lags: List[float] = []
+    usage_start = _fetch_json(url, '/system_info').get('process', {})
+    wall_start = time.time()
+    last_timestamp = first[0]
+    
+    try:
+        for timestamp, kind, number, data in itertools.chain([first], records):
+            last_timestamp = timestamp
+            if speed > 0:
+                delay = (timestamp - first[0]) / speed - (time.time() - wall_start)
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    lags.append(-delay)
             
-            if frame_data:
-                try:
-                    # Decode base64 frame
-                    if ',' in frame_data:
-                        frame_data = frame_data.split(',')[1]
-                    
-                    frame_bytes = base64.b64decode(frame_data)
-                    connection_manager.add_frame(sid, frame_bytes)
-                    
-                    # Update screen size if provided
-                    if screen_info:
-                        width = screen_info.get('width', 0)
-                        height = screen_info.get('height', 0)
-                        if width and height:
-                            connection_manager.update_screen_size(sid, width, height)
-                    
-                except Exception as e:
-                    logger.error(f"Screen data error: {e}")
-        
-        @self.socketio.on('control')
-        def handle_control(data):
-            """Handle control events from desktop"""
-            sid = data.get('sid', '')
-            event_type = data.get('type', '')
-            event_data = data.get('data', {})
-            
-            if sid and sid in connection_manager.clients:
-                if event_type == 'mouse':
-                    control_handler.handle_mouse_event(sid, event_data)
-                elif event_type == 'keyboard':
-                    control_handler.handle_keyboard_event(sid, event_data)
-                elif event_type == 'touch':
-                    control_handler.handle_touch_event(sid, event_data)
-                elif event_type == 'command':
-                    control_handler.handle_command(sid, event_data.get('command', ''))
+            if kind == "connect":
+                device_for(number, data.get("client_data"))
+            elif kind == "disconnect":
+                device = devices.pop(number, None)
+                if device:
+                    # Closing waits on the websocket handshake, keep it off the replay clock
+                    threading.Thread(target=device.close, daemon=True).start()
+            elif kind in ("screen_data", "screen_tiles"):
+                if isinstance(data, dict) and data.get("captured_at") is not None:
+                    # The simulated device reports clock offset 0, so its
+                    # captures happen now rather than on the phone's old clock
+                    data = dict(data, captured_at=time.time() * 1000)
+                device_for(number).send(kind, data)
+            else:
+                panel.emit(kind, dict(data, sid=device_for(number).sid), namespace=config.CONTROL_NAMESPACE)
+            counts[kind] = counts.get(kind, 0) + 1
         
-        @self.socketio.on('ping')
-        def handle_ping():
-            """Handle ping from clients"""
-            sid = request.sid
-            client = connection_manager.get_client(sid)
-            if client:
-                client['last_ping'] = time.time()
-            emit('pong')
+        for device in devices.values():
+            device.drain(5)
+    except ValueError as e:
+        print(f"[ERROR] Capture is corrupt after {sum(counts.values())} replayed events: {e}")
+        return False
+    except (RuntimeError, OSError) as e:
+        print(f"[ERROR] Replay failed after {sum(counts.values())} replayed events: {e}")
+        return False
+    finally:
+        elapsed = time.time() - wall_start
+        usage_end = _fetch_json(url, '/system_info').get('process', {})
+        for device in devices.values():
+            device.close()
+        panel.disconnect()
     
-    def run(self):
-        """Run the application"""
-        self.start_time = time.time()
-        
-        logger.info(f"Starting {config.APP_NAME} v{config.VERSION}")
-        logger.info(f"Author: {config.AUTHOR}")
-        logger.info(f"Telegram: {config.TELEGRAM_URL}")
-        logger.info(f"Instagram: {config.INSTAGRAM_URL}")
-        
-        # Get server IP
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            server_ip = s.getsockname()[0]
-            s.close()
-        except:
-            server_ip = socket.gethostbyname(socket.gethostname())
-            if server_ip.startswith("127."):
-                server_ip = "localhost"
-        
-        print("\n" + "="*60)
-        print(f"MØNSTR-M1ND v{config.VERSION}")
-        print("="*60)
-        print(f"Author: {config.AUTHOR}")
-        print(f"Telegram: {config.TELEGRAM_URL}")
-        print(f"Instagram: {config.INSTAGRAM_URL}")
-        print("="*60)
-        print("\nServer Information:")
-        print(f"  • Server IP: {server_ip}")
-        print(f"  • Port: {config.WEB_PORT}")
-        print(f"  • FPS: {config.FRAME_RATE}")
-        print(f"  • Max Clients: {config.MAX_CLIENTS}")
-        print("\nAccess Points:")
-        print(f"  • Main Interface: http://{server_ip}:{config.WEB_PORT}")
-        print(f"  • Control Panel: http://{server_ip}:{config.WEB_PORT}/control")
-        print(f"  • Local Access: http://localhost:{config.WEB_PORT}")
-        print("\nQuick Start:")
-        print("  1. Open main interface in browser")
-        print("  2. Click 'Generate QR Code'")
-        print("  3. Scan QR code with your Android device")
-        print("  4. Open link on mobile and grant permissions")
-        print("  5. Start controlling from desktop!")
-        print("="*60 + "\n")
-        
-        try:
-            self.socketio.run(self.app, 
-                             host=config.HOST, 
-                             port=config.WEB_PORT,
-                             debug=False,
-                             allow_unsafe_werkzeug=True)
-        except Exception as e:
-            logger.error(f"Server error: {e}")
-            print(f"\nError: Failed to start server: {e}")
-            print(f"Check if port {config.WEB_PORT} is available.")
+    captured = last_timestamp - first[0]
+    report = {
+        "capture": args.capture,
+        "target": url if args.url else f"in-process ({args.server_mode})",
+        "speed": "fast" if speed <= 0 else speed,
+        "events": counts,
+        "captured_seconds": round(captured, 2),
+        "replay_seconds": round(elapsed, 2),
+        "speedup": round(captured / elapsed, 2) if elapsed else None,
+        "lag": _latency_summary(lags) if speed > 0 else None,
+        "server": {}
+    }
+    if usage_start.get("cpu_seconds") is not None and usage_end.get("cpu_seconds") is not None:
+        cpu = usage_end["cpu_seconds"] - usage_start["cpu_seconds"]
+        report["server"]["cpu_seconds"] = round(cpu, 3)
+        report["server"]["cpu_percent"] = round(cpu / elapsed * 100, 1) if elapsed else None
+    if usage_end.get("rss_bytes"):
+        report["server"]["rss_mb_end"] = round(usage_end["rss_bytes"] / 1024 / 1024, 1)
+    
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    print(output)
+    return True
 
 def create_templates():
     """Create HTML templates for web interface"""
@@ -1459,7 +6097,26 @@ def create_templates():
         let fps = 0;
         let frameCount = 0;
         let lastFpsUpdate = Date.now();
+        let binaryFrames = false;
+        let framesInFlight = 0;
+        let captureSeq = 0;
+        let clockOffset = null;
+        let clockRtt = null;
+        const CLOCK_SYNC_BURST = 5;
+        const MAX_FRAMES_IN_FLIGHT = 2;
+        
+        // Capture settings, adjusted live by the server via stream_settings
+        let streamSettings = { fps: 15, quality: 70, scale: 1.0 };
+        
+        // Delta mode state: per-tile hashes of the last captured frame
+        let deltaSettings = null;
+        let tileHashes = null;
+        let tileLayout = '';
+        let lastKeyframe = 0;
+        let forceKeyframe = true;
         let token = new URLSearchParams(window.location.search).get('token');
+        let resumeKey = new URLSearchParams(window.location.search).get('resume');
+        let controlSocket = null;
         
         // Device information
         const deviceInfo = {
@@ -1483,9 +6140,10 @@ def create_templates():
                 console.log('Connected to server');
                 updateStatus('Connected to server');
                 
-                // Authenticate with token
+                // Authenticate with token, or resume once the token was used
                 socket.emit('authenticate', {
                     token: token,
+                    resume_key: resumeKey,
                     client_data: deviceInfo
                 });
             });
@@ -1494,6 +6152,23 @@ def create_templates():
                 if (data.success) {
                     updateStatus('Authenticated');
                     console.log('Authentication successful:', data);
+                    
+                    // Use binary attachments when both server and browser support them
+                    binaryFrames = !!data.binary_frames && typeof Blob.prototype.arrayBuffer === 'function';
+                    if (data.stream_settings) {
+                        applyStreamSettings(data.stream_settings);
+                    }
+                    deltaSettings = binaryFrames ? data.delta : null;
+                    forceKeyframe = true;
+                    
+                    // Keep the new resume key in the URL so a page reload can resume too
+                    resumeKey = data.resume_key;
+                    history.replaceState(null, '', `?token=${encodeURIComponent(token)}&resume=${encodeURIComponent(resumeKey)}`);
+                    
+                    if (data.control_key) {
+                        connectControlChannel(data.control_namespace, data.control_key);
+                    }
+                    syncClock();
                 } else {
                     updateStatus('Authentication failed');
                     alert('Authentication failed. Please refresh the page.');
@@ -1503,17 +6178,43 @@ def create_templates():
             socket.on('disconnect', () => {
                 updateStatus('Disconnected');
                 streaming = false;
+                framesInFlight = 0;
             });
             
             socket.on('control_event', (data) => {
                 handleControlEvent(data);
+                ackControl(data.id);
+            });
+            
+            socket.on('control_batch', (batch) => {
+                batch.events.forEach(event => handleControlEvent(decodeControlEvent(event)));
+                ackControl(batch.id);
+            });
+            
+            socket.on('stream_settings', (data) => {
+                applyStreamSettings(data);
+            });
+            
+            socket.on('request_keyframe', () => {
+                forceKeyframe = true;
             });
             
-            socket.on('pong', () => {
-                // Keep alive
+            socket.on('pong', (data) => {
+                // Keep alive, and an NTP style estimate of server minus phone clock
+                if (!data || data.t0 === undefined || data.t0 === null) return;
+                const t3 = Date.now();
+                clockRtt = (t3 - data.t0) - (data.t2 - data.t1);
+                clockOffset = ((data.t1 - data.t0) + (data.t2 - t3)) / 2;
             });
         }
         
+        function applyStreamSettings(settings) {
+            streamSettings = Object.assign(streamSettings, settings);
+            document.getElementById('qualityInfo').textContent = 
+                `${streamSettings.quality}% @ ${Math.round(streamSettings.scale * 100)}%`;
+            console.log('Stream settings:', streamSettings);
+        }
+        
         function updateStatus(text) {
             document.getElementById('statusText').textContent = text;
             document.getElementById('connectionStatus').textContent = text;
@@ -1548,8 +6249,10 @@ def create_templates():
                 const videoTrack = screenStream.getVideoTracks()[0];
                 const settings = videoTrack.getSettings();
                 
-                canvas.width = settings.width || 1280;
-                canvas.height = settings.height || 720;
+                canvas.sourceWidth = settings.width || 1280;
+                canvas.sourceHeight = settings.height || 720;
+                canvas.width = canvas.sourceWidth;
+                canvas.height = canvas.sourceHeight;
                 
                 // Create video element for capturing
                 const video = document.createElement('video');
@@ -1582,49 +6285,180 @@ def create_templates():
             }
         }
         
+        function sendFrame(frame, keyframe, capture) {
+            // Send frame data via WebSocket, the server acks each frame
+            framesInFlight++;
+            socket.emit('screen_data', {
+                frame: frame,
+                keyframe: keyframe,
+                captured_at: capture.captured_at,
+                capture_seq: capture.capture_seq,
+                screen_info: {
+                    width: canvas.sourceWidth,
+                    height: canvas.sourceHeight
+                }
+            }, () => {
+                framesInFlight = Math.max(0, framesInFlight - 1);
+            });
+            
+            updateFps();
+        }
+        
+        function updateFps() {
+            // Update FPS counter
+            frameCount++;
+            const now = Date.now();
+            if (now - lastFpsUpdate >= 1000) {
+                fps = frameCount;
+                frameCount = 0;
+                lastFpsUpdate = now;
+                document.getElementById('fpsCounter').textContent = fps;
+            }
+        }
+        
+        function sendFullFrame(capture, keyframe = false) {
+            // Get image data as JPEG
+            canvas.toBlob((blob) => {
+                if (blob) {
+                    if (binaryFrames) {
+                        // Send raw JPEG bytes as a binary attachment
+                        blob.arrayBuffer().then(buffer => sendFrame(buffer, keyframe, capture));
+                    } else {
+                        // Fallback: base64 data URL
+                        const reader = new FileReader();
+                        reader.onload = () => sendFrame(reader.result, keyframe, capture);
+                        reader.readAsDataURL(blob);
+                    }
+                }
+            }, 'image/jpeg', streamSettings.quality / 100);
+        }
+        
+        function hashTiles(image, tileSize) {
+            // FNV-1a over every pixel, one hash per tile
+            const pixels = new Uint32Array(image.data.buffer);
+            const cols = Math.ceil(image.width / tileSize);
+            const rows = Math.ceil(image.height / tileSize);
+            const hashes = new Uint32Array(cols * rows).fill(2166136261);
+            
+            for (let y = 0; y < image.height; y++) {
+                const rowStart = y * image.width;
+                const tileRow = Math.floor(y / tileSize) * cols;
+                for (let x = 0; x < image.width; x++) {
+                    const t = tileRow + Math.floor(x / tileSize);
+                    hashes[t] = Math.imul(hashes[t] ^ pixels[rowStart + x], 16777619);
+                }
+            }
+            return hashes;
+        }
+        
+        function encodeTile(index, cols, tileSize) {
+            const x = (index % cols) * tileSize;
+            const y = Math.floor(index / cols) * tileSize;
+            const w = Math.min(tileSize, canvas.width - x);
+            const h = Math.min(tileSize, canvas.height - y);
+            
+            // Copy synchronously so the next capture can't overwrite the tile
+            const tileCanvas = document.createElement('canvas');
+            tileCanvas.width = w;
+            tileCanvas.height = h;
+            tileCanvas.getContext('2d').drawImage(canvas, x, y, w, h, 0, 0, w, h);
+            
+            return new Promise((resolve) => {
+                tileCanvas.toBlob((blob) => {
+                    blob.arrayBuffer().then(data => resolve({ x: x, y: y, w: w, h: h, data: data }));
+                }, 'image/jpeg', streamSettings.quality / 100);
+            });
+        }
+        
+        function sendTiles(changed, cols, tileSize, capture) {
+            const width = canvas.width;
+            const height = canvas.height;
+            
+            framesInFlight++;
+            Promise.all(changed.map(index => encodeTile(index, cols, tileSize))).then((tiles) => {
+                socket.emit('screen_tiles', {
+                    tiles: tiles,
+                    width: width,
+                    height: height,
+                    captured_at: capture.captured_at,
+                    capture_seq: capture.capture_seq,
+                    screen_info: {
+                        width: canvas.sourceWidth,
+                        height: canvas.sourceHeight
+                    }
+                }, () => {
+                    framesInFlight = Math.max(0, framesInFlight - 1);
+                });
+                updateFps();
+            });
+        }
+        
+        function captureDelta(capture) {
+            const tileSize = deltaSettings.tile_size;
+            const image = ctx.getImageData(0, 0, canvas.width, canvas.height);
+            const hashes = hashTiles(image, tileSize);
+            const layout = `${canvas.width}x${canvas.height}`;
+            const now = Date.now();
+            
+            const changed = [];
+            if (tileHashes && tileLayout === layout) {
+                for (let i = 0; i < hashes.length; i++) {
+                    if (hashes[i] !== tileHashes[i]) {
+                        changed.push(i);
+                    }
+                }
+            }
+            
+            const keyframeDue = forceKeyframe || !tileHashes || tileLayout !== layout ||
+                now - lastKeyframe >= deltaSettings.keyframe_interval * 1000 ||
+                changed.length > hashes.length * deltaSettings.keyframe_ratio;
+            
+            tileHashes = hashes;
+            tileLayout = layout;
+            
+            if (keyframeDue) {
+                forceKeyframe = false;
+                lastKeyframe = now;
+                sendFullFrame(capture, true);
+            } else if (changed.length > 0) {
+                sendTiles(changed, Math.ceil(canvas.width / tileSize), tileSize, capture);
+            }
+        }
+        
         function startStreaming(video) {
             function captureFrame() {
                 if (!streaming || !socket || !socket.connected) return;
                 
-                try {
-                    // Draw video frame to canvas
-                    ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
-                    
-                    // Get image data as JPEG
-                    canvas.toBlob((blob) => {
-                        if (blob) {
-                            const reader = new FileReader();
-                            reader.onload = () => {
-                                // Send frame data via WebSocket
-                                socket.emit('screen_data', {
-                                    frame: reader.result,
-                                    screen_info: {
-                                        width: canvas.width,
-                                        height: canvas.height
-                                    }
-                                });
-                                
-                                // Update FPS counter
-                                frameCount++;
-                                const now = Date.now();
-                                if (now - lastFpsUpdate >= 1000) {
-                                    fps = frameCount;
-                                    frameCount = 0;
-                                    lastFpsUpdate = now;
-                                    document.getElementById('fpsCounter').textContent = fps;
-                                }
-                            };
-                            reader.readAsDataURL(blob);
+                // Skip this tick while the link is still busy with earlier frames
+                if (framesInFlight < MAX_FRAMES_IN_FLIGHT) {
+                    try {
+                        // Apply capture scale from stream settings
+                        const width = Math.round(canvas.sourceWidth * streamSettings.scale);
+                        const height = Math.round(canvas.sourceHeight * streamSettings.scale);
+                        if (canvas.width !== width || canvas.height !== height) {
+                            canvas.width = width;
+                            canvas.height = height;
                         }
-                    }, 'image/jpeg', 0.7);
-                    
-                } catch (error) {
-                    console.error('Frame capture error:', error);
+                        
+                        // Draw video frame to canvas
+                        ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
+                        const capture = { captured_at: Date.now(), capture_seq: ++captureSeq };
+                        
+                        if (deltaSettings) {
+                            // Only changed tiles, with periodic keyframes
+                            captureDelta(capture);
+                        } else {
+                            sendFullFrame(capture);
+                        }
+                        
+                    } catch (error) {
+                        console.error('Frame capture error:', error);
+                    }
                 }
                 
                 // Schedule next frame
                 if (streaming) {
-                    setTimeout(captureFrame, 1000 / 15); // 15 FPS
+                    setTimeout(captureFrame, 1000 / streamSettings.fps);
                 }
             }
             
@@ -1647,6 +6481,63 @@ def create_templates():
             updateStatus('Ready to connect');
         }
         
+        function connectControlChannel(namespace, controlKey) {
+            // A separate connection so taps never wait behind a frame upload
+            if (controlSocket) {
+                controlSocket.disconnect();
+            }
+            controlSocket = io(namespace, { forceNew: true, auth: { control_key: controlKey } });
+            
+            controlSocket.on('control_event', (data) => {
+                handleControlEvent(data);
+                ackControl(data.id);
+            });
+            
+            controlSocket.on('control_batch', (batch) => {
+                batch.events.forEach(event => handleControlEvent(decodeControlEvent(event)));
+                ackControl(batch.id);
+            });
+        }
+        
+        function ackControl(id) {
+            const channel = controlSocket && controlSocket.connected ? controlSocket : socket;
+            if (id && channel) {
+                channel.emit('control_ack', { id: id, applied_at: Date.now() });
+            }
+        }
+        
+        function decodeControlEvent(event) {
+            const [code, dt, ...args] = event;
+            switch (code[0]) {
+                case 'm':
+                    return { type: 'mouse', event: { md: 'down', mm: 'move', mu: 'up', mw: 'wheel' }[code],
+                             x: args[0] / 100, y: args[1] / 100, delta: args[2], dt: dt };
+                case 'k':
+                    return code === 'kt'
+                        ? { type: 'keyboard', event: 'text', key: '', text: args[0], dt: dt }
+                        : { type: 'keyboard', event: code === 'kd' ? 'down' : 'up', key: args[0],
+                            text: args[0].length === 1 ? args[0] : '', dt: dt };
+                case 't':
+                    return { type: 'touch', action: args[0], x: args[1] / 100, y: args[2] / 100, dt: dt };
+                default:
+                    return { type: 'command', command: args[0], dt: dt };
+            }
+        }
+        
+        function sendPing() {
+            // Each ping reports the previous exchange so the server can pick the best one
+            if (socket && socket.connected) {
+                socket.emit('ping', { t0: Date.now(), offset: clockOffset, rtt: clockRtt });
+            }
+        }
+        
+        function syncClock() {
+            // A short burst right away, the periodic pings keep the estimate fresh
+            for (let i = 0; i <= CLOCK_SYNC_BURST; i++) {
+                setTimeout(sendPing, i * 250);
+            }
+        }
+        
         function handleControlEvent(event) {
             console.log('Control event received:', event);
         }
@@ -1657,11 +6548,7 @@ def create_templates():
             connectWebSocket();
             
             // Send periodic pings
-            setInterval(() => {
-                if (socket && socket.connected) {
-                    socket.emit('ping');
-                }
-            }, 10000);
+            setInterval(sendPing, 10000);
         });
         
         // Handle page visibility change
@@ -2091,7 +6978,8 @@ def create_templates():
                        placeholder="Type text to send..."
                        id="keyboardInput"
                        onkeydown="handleKeyDown(event)"
-                       onkeyup="handleKeyUp(event)">
+                       onkeyup="handleKeyUp(event)"
+                       onpaste="handlePaste(event)">
                 
                 <button class="btn btn-secondary" onclick="clearText()">
                     Clear Text
@@ -2103,9 +6991,19 @@ def create_templates():
                 <button class="btn" id="streamBtn" onclick="toggleStream()">
                     Start Stream
                 </button>
+                <select class="keyboard-input" id="profileSelect" onchange="changeProfile()">
+                    <option value="original" selected>Original</option>
+                    <option value="high">High</option>
+                    <option value="medium">Medium</option>
+                    <option value="low">Low</option>
+                    <option value="gray">Grayscale</option>
+                </select>
                 <button class="btn btn-secondary" onclick="takeScreenshot()">
                     Take Screenshot
                 </button>
+                <button class="btn btn-secondary" id="recordBtn" onclick="toggleRecording()">
+                    Start Recording
+                </button>
                 <button class="btn" id="controlModeBtn" onclick="toggleControlMode()">
                     Enable Control Mode
                 </button>
@@ -2116,9 +7014,31 @@ def create_templates():
                         <div class="stat-label">FPS</div>
                     </div>
                     <div class="stat-item">
-                        <div class="stat-value" id="qualityInfo">Medium</div>
+                        <div class="stat-value" id="qualityInfo">Original</div>
                         <div class="stat-label">Quality</div>
                     </div>
+                    <div class="stat-item">
+                        <div class="stat-value" id="controlLatency">-</div>
+                        <div class="stat-label">Control ms</div>
+                    </div>
+                    <div class="stat-item">
+                        <div class="stat-value" id="frameLatency">-</div>
+                        <div class="stat-label">Frame ms</div>
+                    </div>
+                </div>
+            </div>
+            
+            <div class="panel-section">
+                <div class="panel-title">Recordings</div>
+                <select class="keyboard-input" id="recordingSelect" onchange="selectRecording()">
+                    <option value="">No recordings</option>
+                </select>
+                <input type="range" id="playbackSlider" min="0" max="0" value="0" step="1"
+                       style="width: 100%;" oninput="showPlaybackFrame()">
+                <div class="social-buttons">
+                    <button class="btn btn-secondary" onclick="playRecording(1)">1x</button>
+                    <button class="btn btn-secondary" onclick="playRecording(4)">4x</button>
+                    <button class="btn btn-secondary" onclick="playRecording(16)">16x</button>
                 </div>
             </div>
             
@@ -2193,10 +7113,16 @@ def create_templates():
     <script src="https://cdnjs.cloudflare.com/ajax/libs/socket.io/4.0.0/socket.io.min.js"></script>
     <script>
         let socket = null;
+        let controlSocket = null;
+        // Filled in when the panel is opened on the server's own desktop,
+        // other machines use the /control?key=... link from the startup banner
+        let panelKey = new URLSearchParams(location.search).get('key') || '{{ panel_key }}' ||
+            sessionStorage.getItem('panelKey') || '';
         let currentDevice = null;
         let streaming = false;
         let controlMode = false;
         let mouseDown = false;
+        let recording = false;
         
         function connectWebSocket() {
             socket = io();
@@ -2212,6 +7138,16 @@ def create_templates():
                 updateConnectionStatus(false);
             });
             
+            // Control events use their own connection on the control namespace,
+            // authorised by the panel key
+            sessionStorage.setItem('panelKey', panelKey);
+            controlSocket = io('/control', { forceNew: true, auth: { panel_key: panelKey } });
+            controlSocket.on('connect_error', () => {
+                // Transport errors are retried, only a refused key leaves the socket inactive
+                if (controlSocket.active) return;
+                alert('Control panel key missing or wrong: open the Control Panel link printed at server startup');
+            });
+            
             // Start periodic updates
             startStatsUpdate();
         }
@@ -2239,6 +7175,12 @@ def create_templates():
                             let html = '';
                             data.devices.forEach(device => {
                                 const isActive = currentDevice === device.sid;
+                                if (isActive) {
+                                    // Median capture-to-send age of the frames we are shown
+                                    const stage = device.latency && device.latency.capture_to_send;
+                                    document.getElementById('frameLatency').textContent =
+                                        stage && stage.samples ? Math.round(stage.p50_ms) : '-';
+                                }
                                 html += `
                                     <div class="device-item ${isActive ? 'active' : ''}" 
                                          onclick="selectDevice('${device.sid}', '${device.device}')">
@@ -2269,7 +7211,15 @@ def create_templates():
             // Update UI
             document.getElementById('streamBtn').disabled = false;
             document.getElementById('streamBtn').innerHTML = 'Start Stream';
-            
+
+            // Reflect whether this device is already being recorded
+            fetch('/recordings')
+                .then(response => response.json())
+                .then(data => {
+                    recording = data.recordings.some(r => r.sid === sid && r.recording);
+                    document.getElementById('recordBtn').innerHTML = recording ? 'Stop Recording' : 'Start Recording';
+                });
+
             // Stop any existing stream
             stopStream();
         }
@@ -2294,7 +7244,8 @@ def create_templates():
             const noStream = document.getElementById('noStream');
             
             // Show stream display
-            streamDisplay.src = `/stream/${currentDevice}`;
+            const profile = document.getElementById('profileSelect').value;
+            streamDisplay.src = `/stream/${currentDevice}?profile=${profile}`;
             streamDisplay.classList.remove('hidden');
             noStream.classList.add('hidden');
             
@@ -2329,6 +7280,78 @@ def create_templates():
             console.log('Stream stopped');
         }
         
+        function loadRecordings() {
+            fetch('/recordings')
+                .then(response => response.json())
+                .then(data => {
+                    const select = document.getElementById('recordingSelect');
+                    const selected = select.value;
+                    select.innerHTML = '<option value="">Select a recording</option>';
+                    
+                    data.recordings.forEach(recording => {
+                        const option = document.createElement('option');
+                        option.value = recording.session_id;
+                        option.textContent = `${recording.device} ${recording.session_id}`;
+                        select.appendChild(option);
+                    });
+                    select.value = selected;
+                })
+                .catch(error => {
+                    console.error('Error loading recordings:', error);
+                });
+        }
+        
+        function selectRecording() {
+            const session = document.getElementById('recordingSelect').value;
+            if (!session) return;
+            
+            fetch(`/playback/${session}`)
+                .then(response => response.json())
+                .then(data => {
+                    const slider = document.getElementById('playbackSlider');
+                    slider.max = Math.floor(data.duration);
+                    slider.value = 0;
+                    showPlaybackFrame();
+                });
+        }
+        
+        function showPlayback(src) {
+            stopStream();
+            const streamDisplay = document.getElementById('streamDisplay');
+            streamDisplay.src = src;
+            streamDisplay.classList.remove('hidden');
+            document.getElementById('noStream').classList.add('hidden');
+        }
+        
+        function showPlaybackFrame() {
+            const session = document.getElementById('recordingSelect').value;
+            if (!session) return;
+            
+            const offset = document.getElementById('playbackSlider').value;
+            showPlayback(`/playback/${session}/frame?t=${offset}`);
+        }
+        
+        function playRecording(speed) {
+            const session = document.getElementById('recordingSelect').value;
+            if (!session) {
+                alert('Please select a recording first');
+                return;
+            }
+            
+            const offset = document.getElementById('playbackSlider').value;
+            showPlayback(`/playback/${session}/stream?speed=${speed}&t=${offset}`);
+        }
+        
+        function changeProfile() {
+            const select = document.getElementById('profileSelect');
+            document.getElementById('qualityInfo').textContent = select.options[select.selectedIndex].text;
+            
+            // Reconnect the stream with the new profile
+            if (streaming) {
+                startStream();
+            }
+        }
+        
         function toggleControlMode() {
             if (!streaming) {
                 alert('Please start the stream first');
@@ -2435,35 +7458,69 @@ def create_templates():
             sendKeyboardEvent('up', event.key, event.keyCode);
         }
         
-        function sendMouseEvent(type, x, y, extra = null) {
-            if (!socket || !currentDevice) return;
+        // Control events are queued as [code, dt, ...args] and sent as one control_batch.
+        // Presses, releases, text and commands flush at once; moves and keys wait a frame.
+        const CONTROL_BATCH_MS = 16;
+        let controlQueue = [];
+        let controlBatchStart = 0;
+        let controlFlushTimer = null;
+        
+        function toUnits(percent) {
+            return Math.round(Math.min(Math.max(percent, 0), 100) * 100);
+        }
+        
+        function queueControl(code, args, urgent) {
+            if (!controlSocket || !currentDevice) return;
             
-            socket.emit('control', {
+            if (controlQueue.length === 0) {
+                controlBatchStart = performance.now();
+            }
+            controlQueue.push([code, Math.round(performance.now() - controlBatchStart), ...args]);
+            
+            if (urgent) {
+                flushControl();
+            } else if (!controlFlushTimer) {
+                controlFlushTimer = setTimeout(flushControl, CONTROL_BATCH_MS);
+            }
+        }
+        
+        function flushControl() {
+            clearTimeout(controlFlushTimer);
+            controlFlushTimer = null;
+            if (controlQueue.length === 0 || !controlSocket || !currentDevice) return;
+            
+            const sentAt = performance.now();
+            controlSocket.emit('control_batch', {
                 sid: currentDevice,
-                type: 'mouse',
-                data: {
-                    type: type,
-                    x: x,
-                    y: y,
-                    button: 'left',
-                    extra: extra
-                }
+                events: controlQueue
+            }, (ack) => {
+                // Panel to server round trip; the device's apply latency is in /devices
+                document.getElementById('controlLatency').textContent = Math.round(performance.now() - sentAt);
             });
+            controlQueue = [];
+        }
+        
+        function sendMouseEvent(type, x, y, extra = null) {
+            const code = { down: 'md', move: 'mm', up: 'mu', wheel: 'mw' }[type];
+            const args = [toUnits(x), toUnits(y)];
+            if (type === 'wheel') {
+                args.push(extra || 0);
+            }
+            queueControl(code, args, type === 'down' || type === 'up');
         }
         
         function sendKeyboardEvent(type, key, keyCode) {
-            if (!socket || !currentDevice) return;
+            queueControl(type === 'down' ? 'kd' : 'ku', [key, keyCode || 0], false);
+        }
+        
+        function handlePaste(event) {
+            if (!controlMode || !currentDevice) return;
             
-            socket.emit('control', {
-                sid: currentDevice,
-                type: 'keyboard',
-                data: {
-                    type: type,
-                    key: key,
-                    keyCode: keyCode,
-                    text: key.length === 1 ? key : ''
-                }
-            });
+            // A pasted paragraph goes out as one text event instead of a key per character
+            const text = event.clipboardData.getData('text');
+            if (text) {
+                queueControl('kt', [text], true);
+            }
         }
         
         function sendCommand(command) {
@@ -2472,10 +7529,16 @@ def create_templates():
                 return;
             }
             
+            if (controlSocket && controlSocket.connected) {
+                queueControl('c', [command], true);
+                return;
+            }
+            
             fetch(`/send_command/${currentDevice}`, {
                 method: 'POST',
                 headers: {
-                    'Content-Type': 'application/json'
+                    'Content-Type': 'application/json',
+                    'X-Panel-Key': panelKey
                 },
                 body: JSON.stringify({ command: command })
             })
@@ -2500,7 +7563,7 @@ def create_templates():
                 .then(response => response.json())
                 .then(data => {
                     if (data.success) {
-                        alert(`Screenshot saved: ${data.filename}`);
+                        alert(`Screenshot queued: ${data.filename}`);
                     } else {
                         alert('Failed to take screenshot');
                     }
@@ -2511,6 +7574,30 @@ def create_templates():
                 });
         }
         
+        function toggleRecording() {
+            if (!currentDevice) {
+                alert('Please select a device first');
+                return;
+            }
+            
+            const action = recording ? 'stop' : 'start';
+            fetch(`/record/${action}/${currentDevice}`, { method: 'POST' })
+                .then(response => response.json())
+                .then(data => {
+                    if (data.success) {
+                        recording = !recording;
+                        document.getElementById('recordBtn').innerHTML = recording ? 'Stop Recording' : 'Start Recording';
+                        console.log(`Recording ${action}:`, data.session_id);
+                        loadRecordings();
+                    } else {
+                        alert('Recording error: ' + (data.error || 'Unknown error'));
+                    }
+                })
+                .catch(error => {
+                    console.error('Error toggling recording:', error);
+                });
+        }
+        
         function clearText() {
             document.getElementById('keyboardInput').value = '';
         }
@@ -2551,11 +7638,13 @@ def create_templates():
             
             // Refresh devices every 5 seconds
             setInterval(refreshDevices, 5000);
+            setInterval(loadRecordings, 15000);
         }
         
         // Initialize
         document.addEventListener('DOMContentLoaded', function() {
             connectWebSocket();
+            loadRecordings();
         });
     </script>
 </body>
@@ -2564,8 +7653,78 @@ def create_templates():
     with open("templates/control.html", "w", encoding="utf-8") as f:
         f.write(control_html)
 
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description=f"{config.APP_NAME} - Android Remote Control System")
+    parser.add_argument("--server-mode", choices=["threading", "asyncio"], default=config.SERVER_MODE,
+                        help="threading: Flask-SocketIO on Werkzeug, asyncio: python-socketio AsyncServer on uvicorn")
+    parser.add_argument("--stream-workers", type=int, default=config.STREAM_WORKERS,
+                        help="serve /stream from this many worker processes reading shared memory frame rings")
+    parser.add_argument("--capture", metavar="FILE",
+                        help="record inbound device frames and control events to FILE for replay")
+    
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    timelapse = commands.add_parser("timelapse", help="export a timelapse and contact sheet from a recording")
+    timelapse.add_argument("session", help="session id under recordings/ or path to a session directory")
+    timelapse.add_argument("-o", "--output", help="timelapse MJPEG path (default: <session>/timelapse.mjpg)")
+    timelapse.add_argument("--sheet", help="contact sheet path (default: <session>/contact_sheet.jpg)")
+    timelapse.add_argument("--threshold", type=int, default=config.TIMELAPSE_THRESHOLD,
+                           help="changed hash bits needed to keep a frame")
+    timelapse.add_argument("--max-gap", type=float, default=config.TIMELAPSE_MAX_GAP,
+                           help="keep a frame at least every N seconds of recording")
+    timelapse.add_argument("--width", type=int, default=config.TIMELAPSE_WIDTH)
+    timelapse.add_argument("--quality", type=int, default=config.TIMELAPSE_QUALITY)
+    timelapse.add_argument("--sheet-frames", type=int, default=config.TIMELAPSE_SHEET_FRAMES)
+    timelapse.add_argument("--columns", type=int, default=config.TIMELAPSE_SHEET_COLUMNS)
+    timelapse.add_argument("--workers", type=int, default=0, help="worker processes (default: CPU count)")
+    
+    benchmark = commands.add_parser("benchmark", help="load test the server with simulated devices and viewers")
+    benchmark.add_argument("--devices", type=int, default=4, help="simulated phones")
+    benchmark.add_argument("--viewers", type=int, default=4, help="simulated MJPEG viewers, spread over the devices")
+    benchmark.add_argument("--fps", type=float, default=config.FRAME_RATE, help="frames per second per device")
+    benchmark.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    benchmark.add_argument("--warmup", type=float, default=3.0, help="seconds before measuring starts")
+    benchmark.add_argument("--profile", default=config.DEFAULT_STREAM_PROFILE, help="stream profile the viewers request")
+    benchmark.add_argument("--control-rate", type=float, default=20.0,
+                           help="control events per second per viewer (0 disables)")
+    benchmark.add_argument("--frames", help="directory of JPEGs or recorded session to send (default: synthetic)")
+    benchmark.add_argument("--url", help="benchmark a running server instead of one started in-process")
+    benchmark.add_argument("--panel-key", help="control panel key of the --url server, from its startup banner")
+    benchmark.add_argument("-o", "--output", help="also write the JSON report to this file")
+    
+    microbench = commands.add_parser("microbench", help="time the frame and control hot paths against a baseline")
+    microbench.add_argument("benchmarks", nargs="*", help="benchmarks to run (default: all)")
+    microbench.add_argument("--save", action="store_true", help="store the results as the baseline")
+    microbench.add_argument("--compare", action="store_true",
+                            help="compare with the baseline, failing on regressions")
+    microbench.add_argument("--baseline", default=config.MICROBENCH_BASELINE)
+    microbench.add_argument("--threshold", type=float, default=config.MICROBENCH_THRESHOLD,
+                            help="allowed slowdown of the median, 0.25 = 25%%")
+    microbench.add_argument("--min-time", type=float, default=config.MICROBENCH_MIN_TIME)
+    microbench.add_argument("--repeat", type=int, default=config.MICROBENCH_REPEAT)
+    
+    replay = commands.add_parser("replay", help="feed a --capture file back into a server")
+    replay.add_argument("capture", help="traffic capture file")
+    replay.add_argument("--speed", type=float, default=1.0, help="playback speed of the captured timing")
+    replay.add_argument("--fast", action="store_true", help="send as fast as the server acks frames")
+    replay.add_argument("--url", help="replay into a running server instead of one started in-process")
+    replay.add_argument("--panel-key", help="control panel key of the --url server, from its startup banner")
+    replay.add_argument("-o", "--output", help="also write the JSON report to this file")
+    return parser.parse_args(argv)
+
 def main():
     """Main entry point"""
+    args = parse_args()
+    
+    if args.command == "timelapse":
+        sys.exit(0 if export_timelapse(args) else 1)
+    if args.command == "benchmark":
+        sys.exit(0 if run_benchmark(args) else 1)
+    if args.command == "microbench":
+        sys.exit(0 if run_microbenchmarks(args) else 1)
+    if args.command == "replay":
+        sys.exit(0 if replay_capture(args) else 1)
+    
     print("\n" + "="*60)
     print("MØNSTR-M1ND Android Remote Control System")
     print("="*60)
@@ -2583,16 +7742,38 @@ def main():
         # Create templates
         create_templates()
         
+        if args.stream_workers > 0:
+            config.SHARED_MEMORY_FRAMES = True
+            stream_workers.start(args.stream_workers, config.STREAM_WORKER_PORT)
+        
+        if args.capture:
+            traffic_capture.start(args.capture)
+        
         # Create and run app
-        app = MØNSTRApp()
+        if args.server_mode == "asyncio":
+            app = AsyncMØNSTRApp()
+        else:
+            app = MØNSTRApp()
         app.run()
         
     except KeyboardInterrupt:
         print("\n[INFO] Shutting down MØNSTR-M1ND...")
-        print("[INFO] Goodbye! Created by MR.MONSIF")
     except Exception as e:
         print(f"\n[ERROR] Application error: {e}")
         print("[ERROR] Please report issues to: http://t.me/monstr_m1nd")
+    finally:
+        # Werkzeug and uvicorn handle SIGINT themselves and return from run()
+        shutdown_services()
+        print("[INFO] Goodbye! Created by MR.MONSIF")
+
+def shutdown_services():
+    """Finish recordings, captures and queued writes before exiting"""
+    recording_manager.stop_all()
+    traffic_capture.stop()
+    screenshot_writer.shutdown()
+    frame_worker_pool.shutdown()
+    stream_workers.stop()
+    logger.shutdown()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file